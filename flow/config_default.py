@@ -3,4 +3,6 @@ Contains default config variables, which may be overridden by a user config.
 """
 
 PYTHON_COMMAND = "python"
-SUMO_SLEEP = 1.0  # Delay between initializing SUMO and connecting with TraCI
+SUMO_STARTUP_TIMEOUT = 60.0  # Max. wait for SUMO to accept a TraCI connection
+# (replaces SUMO_SLEEP, the fixed delay before connecting, which is no longer
+# used: flow connects as soon as SUMO accepts the connection)
@@ -1,7 +1,27 @@
 import numpy as np
 
+# failsafe methods, and their vectorized equivalents used by get_action_batch
+BATCH_FAILSAFES = [
+    ("get_safe_action_instantaneous", "get_safe_actions_instantaneous"),
+    ("get_safe_velocity_action", "get_safe_velocity_actions"),
+    ("safe_velocity", "get_safe_velocity_actions"),
+]
+
 
 class BaseController:
+
+    # specifies whether the controller stores a state that is specific to its
+    # vehicle (e.g. a history of speeds). Subclasses without such a state may
+    # set it to False, in which case the controller is only constructed once
+    # per vehicle type, and used by all vehicles of the type, with veh_id set
+    # to the vehicle it is requested for (see flow.core.vehicles.Vehicles)
+    per_vehicle_state = True
+
+    # variables of the vehicles (e.g. traci.constants.VAR_COLOR) read from
+    # sumo by the controller through Vehicles.get_sumo_variable. These are
+    # subscribed to for all vehicles in the network
+    vehicle_variables = []
+
     def __init__(self,
                  veh_id,
                  sumo_cf_params,
@@ -58,7 +78,75 @@ class BaseController:
         """Returns the acceleration of the controller"""
         raise NotImplementedError
 
-    def get_action(self, env):
+    def get_accel_batch(self, env, veh_ids):
+        """Returns the accelerations of several vehicles that use this
+        controller (or controllers of the same class with the same
+        parameters), computed at once with vectorized operations.
+
+        This is implemented by controllers whose accelerations only depend on
+        their parameters and the state of the vehicles (see batched). The
+        accelerations must match the ones returned by get_accel.
+
+        Parameters
+        ----------
+        env: Env Type
+            state of the environment at the current time step
+        veh_ids: list<str>
+            names of the vehicles
+
+        Returns
+        -------
+        numpy ndarray
+            the accelerations of the vehicles
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def batched(cls):
+        """Returns whether the actions of the controller may be computed for
+        several vehicles at once with get_action_batch.
+
+        This is the case if the class implements get_accel_batch, and
+        get_accel is not overridden by a subclass of the class that
+        implements it, nor the failsafes without their vectorized
+        equivalents. Otherwise, the actions are computed per vehicle with
+        get_action.
+        """
+        if cls.get_action is not BaseController.get_action or \
+                cls.get_action_batch is not BaseController.get_action_batch:
+            return False
+        for name, batch_name in BATCH_FAILSAFES:
+            if getattr(cls, name) is not getattr(BaseController, name) and \
+                    getattr(cls, batch_name) is \
+                    getattr(BaseController, batch_name):
+                return False
+        for klass in cls.__mro__:
+            if "get_accel_batch" in vars(klass):
+                return klass is not BaseController
+            if "get_accel" in vars(klass):
+                return False
+        return False
+
+    def batch_key(self):
+        """Returns a key identifying the controllers whose actions may be
+        computed together with get_action_batch.
+
+        Controllers of the same class whose attributes (other than the name
+        of their vehicle) are equal have the same key, so that the vehicles of
+        several types with the same controller parameters are batched
+        together. Attributes that cannot be compared by value are compared by
+        identity.
+
+        Returns
+        -------
+        tuple
+            hashable key of the controller
+        """
+        return (type(self), _freeze(
+            {name: value for name, value in self.__dict__.items()
+             if name != "veh_id"}))
+
+    def get_action(self, env, noise=None):
         """Converts the get_accel() acceleration into an action.
 
         If no acceleration is specified, the action returns a None as well,
@@ -73,6 +161,10 @@ class BaseController:
         ----------
         env: Env Type
             state of the environment at the current time step
+        noise: float, optional
+            noise added to the acceleration, if it was already drawn (see
+            flow.envs.Env.get_controller_actions). Otherwise, the noise is
+            drawn from the random number generator of the environment
 
         Returns
         -------
@@ -88,7 +180,9 @@ class BaseController:
 
         # add noise to the accelerations, if requested
         if self.accel_noise > 0:
-            accel += np.random.normal(0, self.accel_noise)
+            if noise is None:
+                noise = _random(env).normal(0, self.accel_noise)
+            accel += noise
 
         # run the failsafes, if requested
         if self.fail_safe == 'instantaneous':
@@ -98,6 +192,77 @@ class BaseController:
 
         return accel
 
+    def get_action_batch(self, env, veh_ids, noise=None):
+        """Converts the get_accel_batch() accelerations of several vehicles
+        into actions.
+
+        This is the equivalent of get_action for all vehicles that use this
+        controller (see batched).
+
+        Parameters
+        ----------
+        env: Env Type
+            state of the environment at the current time step
+        veh_ids: list<str>
+            names of the vehicles
+        noise: numpy ndarray, optional
+            noise added to the accelerations, if it was already drawn (see
+            flow.envs.Env.get_controller_actions). Otherwise, the noise is
+            drawn from the random number generator of the environment
+
+        Returns
+        -------
+        list<float>
+            the modified form of the accelerations
+        """
+        accel = np.asarray(self.get_accel_batch(env, veh_ids), dtype=float)
+
+        # add noise to the accelerations, if requested
+        if self.accel_noise > 0:
+            if noise is None:
+                noise = _random(env).normal(0, self.accel_noise, len(veh_ids))
+            accel = accel + noise
+
+        # run the failsafes, if requested
+        if self.fail_safe == 'instantaneous':
+            accel = self.get_safe_actions_instantaneous(env, veh_ids, accel)
+        elif self.fail_safe == 'safe_velocity':
+            accel = self.get_safe_velocity_actions(env, veh_ids, accel)
+
+        return accel.tolist()
+
+    @staticmethod
+    def get_leader_arrays(env, veh_ids):
+        """Returns the states of vehicles and their leaders used by
+        car-following models, as arrays (see get_accel_batch).
+
+        Parameters
+        ----------
+        env: Env Type
+            state of the environment at the current time step
+        veh_ids: list<str>
+            names of the vehicles
+
+        Returns
+        -------
+        numpy ndarray
+            speeds of the vehicles
+        numpy ndarray
+            speeds of their leaders (-1001 for vehicles with no leader)
+        numpy ndarray
+            headways of the vehicles
+        numpy ndarray
+            boolean mask of the vehicles that have a leader
+        """
+        vehicles = env.vehicles
+        leaders = vehicles.get_array("leader", veh_ids)
+        has_leader = (leaders != "") & (leaders != None)  # noqa: E711
+        speed = vehicles.get_array("speed", veh_ids).astype(float)
+        lead_speed = vehicles.get_array("speed", leaders.tolist()) \
+            .astype(float)
+        headway = vehicles.get_array("headway", veh_ids).astype(float)
+        return speed, lead_speed, headway, has_leader
+
     def get_safe_action_instantaneous(self, env, action):
         """
         Instantaneously stops the car if there is a change of colliding into
@@ -185,6 +350,85 @@ class BaseController:
             else:
                 return action
 
+    def get_safe_actions_instantaneous(self, env, veh_ids, actions):
+        """Performs the "instantaneous" failsafe action for several vehicles
+        at once.
+
+        This is the vectorized equivalent of get_safe_action_instantaneous.
+
+        Parameters
+        ----------
+        env: Environment type
+            current environment, which contains information of the state of the
+            network at the current time step
+        veh_ids: list<str>
+            names of the vehicles
+        actions: numpy ndarray
+            requested acceleration actions of the vehicles
+
+        Returns
+        -------
+        numpy ndarray
+            the requested actions of vehicles that do not lead to a crash, and
+            stopping actions otherwise
+        """
+        # if there is only one vehicle in the network, all actions are safe
+        if env.vehicles.num_vehicles == 1:
+            return actions
+
+        # if there is no other vehicle in the lane, all actions are safe
+        leaders = env.vehicles.get_array("leader", veh_ids)
+        has_leader = leaders != None  # noqa: E711
+
+        this_vel = env.vehicles.get_array("speed", veh_ids).astype(float)
+        sim_step = env.sim_step
+        next_vel = this_vel + actions * sim_step
+        h = env.vehicles.get_array("headway", veh_ids).astype(float)
+
+        # stop immediately if the vehicle would crash into the vehicle ahead
+        # of it in the next time step (see get_safe_action_instantaneous)
+        unsafe = has_leader & (next_vel > 0) & \
+            (h < sim_step * next_vel + this_vel * 1e-3 +
+             0.5 * this_vel * sim_step)
+        return np.where(unsafe, -this_vel / sim_step, actions)
+
+    def get_safe_velocity_actions(self, env, veh_ids, actions):
+        """Performs the "safe_velocity" failsafe action for several vehicles
+        at once.
+
+        This is the vectorized equivalent of get_safe_velocity_action.
+
+        Parameters
+        ----------
+        env: Environment type
+            current environment, which contains information of the state of the
+            network at the current time step
+        veh_ids: list<str>
+            names of the vehicles
+        actions: numpy ndarray
+            requested acceleration actions of the vehicles
+
+        Returns
+        -------
+        numpy ndarray
+            the requested actions clipped by the safe velocities
+        """
+        if env.vehicles.num_vehicles == 1:
+            # if there is only one vehicle in the network, all actions are safe
+            return actions
+
+        this_vel, lead_vel, h, _ = self.get_leader_arrays(env, veh_ids)
+        sim_step = env.sim_step
+        safe_velocity = 2 * h / sim_step + (lead_vel - this_vel) - \
+            this_vel * (2 * self.delay)
+
+        return np.where(
+            this_vel + actions * sim_step > safe_velocity,
+            np.where(safe_velocity > 0,
+                     (safe_velocity - this_vel) / sim_step,
+                     -this_vel / sim_step),
+            actions)
+
     def safe_velocity(self, env):
         """Finds maximum velocity such that if the lead vehicle were to stop
         entirely, we can bring the following vehicle to rest at the point at
@@ -212,3 +456,46 @@ class BaseController:
         v_safe = 2 * h / env.sim_step + dv - this_vel * (2 * self.delay)
 
         return v_safe
+
+
+def _random(env):
+    """Returns the random number generator of an environment (environments
+    loaded from old pkl files use the global numpy generator)."""
+    return getattr(env, "np_random", np.random)
+
+
+def _freeze(value):
+    """Returns a hashable equivalent of a parameter of a controller (see
+    BaseController.batch_key)."""
+    if isinstance(value, dict):
+        return (dict, tuple(sorted(
+            ((_freeze(k), _freeze(v)) for k, v in value.items()),
+            key=repr)))
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_freeze(v) for v in value))
+    if isinstance(value, np.ndarray):
+        return (np.ndarray, value.dtype.str, value.shape, value.tobytes())
+    if hasattr(value, "__dict__") and not callable(value):
+        return (type(value), _freeze(vars(value)))
+    if isinstance(value, (set, frozenset)):
+        return (frozenset, frozenset(_freeze(v) for v in value))
+    try:
+        hash(value)
+    except TypeError:
+        return _Identity(value)
+    return value
+
+
+class _Identity:
+    """Hashable wrapper of a value compared by identity (see _freeze)."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, _Identity) and self.value is other.value
+
+    def __hash__(self):
+        return id(self.value)
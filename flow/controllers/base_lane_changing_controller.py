@@ -1,5 +1,13 @@
 class BaseLaneChangeController:
 
+    # specifies whether the controller stores a state that is specific to its
+    # vehicle (see BaseController)
+    per_vehicle_state = True
+
+    # variables of the vehicles read from sumo by the controller through
+    # Vehicles.get_sumo_variable (see BaseController)
+    vehicle_variables = []
+
     def __init__(self, veh_id, lane_change_params={}):
         """Base class for lane-changing controllers.
 
@@ -1,5 +1,17 @@
+import traci.constants as tc
+
 
 class BaseRouter:
+
+    # specifies whether the router stores a state that is specific to its
+    # vehicle (see BaseController)
+    per_vehicle_state = True
+
+    # variables of the vehicles read from sumo by the router through
+    # Vehicles.get_sumo_variable (see BaseController). Routers read the
+    # current route of their vehicle by default
+    vehicle_variables = [tc.VAR_EDGES]
+
     def __init__(self, veh_id, router_params):
         """Base class for routing controllers.
 
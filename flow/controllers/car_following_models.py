@@ -5,7 +5,10 @@ flow-controlled vehicles.
 Controllers can have their output delayed by some duration. Each controller
 includes the function ``get_accel(self, env) -> acc`` which, using the
 current state of the world and existing parameters, uses the control
-model to return a vehicle acceleration.
+model to return a vehicle acceleration. The models also include the function
+``get_accel_batch(self, env, veh_ids) -> accs``, which computes the
+accelerations of several vehicles that use the same model and parameters at
+once.
 
 """
 import math
@@ -16,6 +19,8 @@ from flow.controllers.base_controller import BaseController
 
 class CFMController(BaseController):
 
+    per_vehicle_state = False
+
     def __init__(self,
                  veh_id,
                  sumo_cf_params,
@@ -77,9 +82,19 @@ class CFMController(BaseController):
         return self.k_d*(d_l - self.d_des) + self.k_v*(lead_vel - this_vel) + \
             self.k_c*(self.v_des - this_vel)
 
+    def get_accel_batch(self, env, veh_ids):
+        this_vel, lead_vel, d_l, has_leader = \
+            self.get_leader_arrays(env, veh_ids)
+
+        accel = self.k_d*(d_l - self.d_des) + self.k_v*(lead_vel - this_vel) \
+            + self.k_c*(self.v_des - this_vel)
+        return np.where(has_leader, accel, self.max_accel)
+
 
 class BCMController(BaseController):
 
+    per_vehicle_state = False
+
     def __init__(self,
                  veh_id,
                  sumo_cf_params,
@@ -154,9 +169,24 @@ class BCMController(BaseController):
             self.k_v * ((lead_vel - this_vel) - (this_vel - trail_vel)) + \
             self.k_c * (self.v_des - this_vel)
 
+    def get_accel_batch(self, env, veh_ids):
+        this_vel, lead_vel, headway, has_leader = \
+            self.get_leader_arrays(env, veh_ids)
+
+        trail_ids = env.vehicles.get_array("follower", veh_ids).tolist()
+        trail_vel = env.vehicles.get_array("speed", trail_ids).astype(float)
+        footway = env.vehicles.get_array("headway", trail_ids).astype(float)
+
+        accel = self.k_d * (headway - footway) + \
+            self.k_v * ((lead_vel - this_vel) - (this_vel - trail_vel)) + \
+            self.k_c * (self.v_des - this_vel)
+        return np.where(has_leader, accel, self.max_accel)
+
 
 class OVMController(BaseController):
 
+    per_vehicle_state = False
+
     def __init__(self,
                  veh_id,
                  sumo_cf_params,
@@ -227,9 +257,27 @@ class OVMController(BaseController):
 
         return self.alpha * (v_h - this_vel) + self.beta * h_dot
 
+    def get_accel_batch(self, env, veh_ids):
+        this_vel, lead_vel, h, has_leader = \
+            self.get_leader_arrays(env, veh_ids)
+        h_dot = lead_vel - this_vel
+
+        # V function here - input: h, output : Vh
+        v_h = np.where(
+            h <= self.h_st, 0,
+            np.where(h < self.h_go,
+                     self.v_max / 2 * (1 - np.cos(np.pi * (h - self.h_st) /
+                                                  (self.h_go - self.h_st))),
+                     self.v_max))
+
+        accel = self.alpha * (v_h - this_vel) + self.beta * h_dot
+        return np.where(has_leader, accel, self.max_accel)
+
 
 class LinearOVM(BaseController):
 
+    per_vehicle_state = False
+
     def __init__(self,
                  veh_id,
                  sumo_cf_params,
@@ -286,9 +334,24 @@ class LinearOVM(BaseController):
 
         return (v_h - this_vel) / self.adaptation
 
+    def get_accel_batch(self, env, veh_ids):
+        this_vel = env.vehicles.get_array("speed", veh_ids).astype(float)
+        h = env.vehicles.get_array("headway", veh_ids).astype(float)
+
+        # V function here - input: h, output : Vh
+        alpha = 1.689  # the average value from Nakayama paper
+        v_h = np.where(
+            h < self.h_st, 0,
+            np.where(h <= self.h_st + self.v_max/alpha,
+                     alpha * (h - self.h_st), self.v_max))
+
+        return (v_h - this_vel) / self.adaptation
+
 
 class IDMController(BaseController):
 
+    per_vehicle_state = False
+
     def __init__(self,
                  veh_id,
                  v0=30,
@@ -365,9 +428,26 @@ class IDMController(BaseController):
 
         return self.a * (1 - (v/self.v0)**self.delta - (s_star/h)**2)
 
+    def get_accel_batch(self, env, veh_ids):
+        v, lead_vel, h, has_leader = self.get_leader_arrays(env, veh_ids)
+
+        # see get_accel for negative headways
+        h = np.where(np.abs(h) < 1e-3, 1e-3, h)
+
+        s_star = np.where(
+            has_leader,
+            self.s0 + np.maximum(
+                0,
+                v * self.T + v*(v-lead_vel) / (2*np.sqrt(self.a*self.b))),
+            0)
+
+        return self.a * (1 - (v/self.v0)**self.delta - (s_star/h)**2)
+
 
 class SumoCarFollowingController(BaseController):
 
+    per_vehicle_state = False
+
     def __init__(self, veh_id, sumo_cf_params):
         """Instantiates a car-following controller whose actions are purely
         defined by sumo.
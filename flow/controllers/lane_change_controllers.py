@@ -5,6 +5,8 @@ from flow.controllers.base_lane_changing_controller import \
 class SumoLaneChangeController(BaseLaneChangeController):
     """A controller used to enforce sumo lane-change dynamics on a vehicle."""
 
+    per_vehicle_state = False
+
     def __init__(self, veh_id):
         super().__init__(veh_id, lane_change_params={})
         self.SumoController = True
@@ -16,5 +18,7 @@ class SumoLaneChangeController(BaseLaneChangeController):
 class StaticLaneChanger(BaseLaneChangeController):
     """A lane-changing model used to keep a vehicle in the same lane."""
 
+    per_vehicle_state = False
+
     def get_lane_change_action(self, env):
         return 0
@@ -3,6 +3,8 @@ from flow.controllers.base_controller import BaseController
 
 class RLController(BaseController):
 
+    per_vehicle_state = False
+
     def __init__(self, veh_id, sumo_cf_params, time_delay=0, fail_safe=None):
         """Instantiates an RL Controller.
 
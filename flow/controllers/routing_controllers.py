@@ -7,6 +7,8 @@ class ContinuousRouter(BaseRouter):
     follow the same route, and repeat said route once it reaches its end.
     """
 
+    per_vehicle_state = False
+
     def choose_route(self, env):
         if env.vehicles.get_edge(self.veh_id) == \
                 env.vehicles.get_route(self.veh_id)[-1]:
@@ -20,6 +22,8 @@ class GridRouter(BaseRouter):
     A router used to re-route a vehicle within a grid environment.
     """
 
+    per_vehicle_state = False
+
     def choose_route(self, env):
         if env.vehicles.get_edge(self.veh_id) == \
                 env.vehicles.get_route(self.veh_id)[-1]:
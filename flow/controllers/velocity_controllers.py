@@ -3,6 +3,9 @@ import numpy as np
 
 
 class FollowerStopper(BaseController):
+
+    per_vehicle_state = False
+
     def __init__(self, veh_id, sumo_cf_params, v_des=15, danger_edges=None):
         """Inspired by Dan Work's... work:
 
@@ -92,6 +95,10 @@ class FollowerStopper(BaseController):
 
 
 class PISaturation(BaseController):
+
+    # the controller stores the speed history of its vehicle
+    per_vehicle_state = True
+
     def __init__(self, veh_id, sumo_cf_params):
         """Inspired by Dan Work's... work:
 
@@ -160,6 +167,9 @@ class PISaturation(BaseController):
 
 class HandTunedVelocityController(FollowerStopper):
 
+    # the desired speed is updated from the position of the vehicle
+    per_vehicle_state = True
+
     def __init__(self, veh_id, v_regions, sumo_cf_params, danger_edges=None):
         super().__init__(veh_id, sumo_cf_params, v_regions[0],
                          danger_edges=danger_edges)
@@ -182,6 +192,10 @@ class HandTunedVelocityController(FollowerStopper):
 
 
 class FeedbackController(FollowerStopper):
+
+    # the desired speed is updated from the density ahead of the vehicle
+    per_vehicle_state = True
+
     def __init__(self, veh_id, sumo_cf_params, Kp, desired_bottleneck_density,
                  danger_edges=None):
         super().__init__(veh_id, sumo_cf_params, danger_edges=danger_edges)
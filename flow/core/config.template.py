@@ -5,4 +5,6 @@ Copy this file to config.py and make any necessary changes.
 """
 
 PYTHON_COMMAND = "python"
-SUMO_SLEEP = 5.0  # Delay between initializing SUMO and connecting with TraCI
+SUMO_STARTUP_TIMEOUT = 60.0  # Max. wait for SUMO to accept a TraCI connection
+# (replaces SUMO_SLEEP, the fixed delay before connecting, which is no longer
+# used: flow connects as soon as SUMO accepts the connection)
@@ -68,7 +68,7 @@ class SumoExperiment:
             self.env.reset()
             for j in range(num_steps):
                 state, reward, done, _ = self.env.step(rl_actions)
-                vel[j] = np.mean(vehicles.get_speed(vehicles.get_ids()))
+                vel[j] = np.mean(vehicles.get_array("speed"))
                 ret += reward
                 ret_list.append(reward)
                 if done:
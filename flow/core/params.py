@@ -16,7 +16,14 @@ class SumoParams:
                  seed=None,
                  restart_instance=False,
                  print_warnings=True,
-                 teleport_time=-1):
+                 teleport_time=-1,
+                 batch_commands=False,
+                 context_subscription=False,
+                 process_pool_size=0,
+                 use_libsumo=False,
+                 count_traci_calls=False,
+                 flow_leaders=False,
+                 validate_leaders=False):
         """Sumo-specific parameters
 
         These parameters are used to customize a sumo simulation instance upon
@@ -52,7 +59,8 @@ class SumoParams:
             more realistic, but increases the possibility of collisions.
             Defaults to False
         seed: int, optional
-            seed for sumo instance
+            seed for sumo instance, and for the acceleration noise of the
+            controllers of vehicles (see flow.envs.Env.seed)
         restart_instance: bool, optional
             specifies whether to restart a sumo instance upon reset. Restarting
             the instance helps avoid slowdowns cause by excessive inflows over
@@ -63,6 +71,57 @@ class SumoParams:
         teleport_time: int, optional
             If negative, vehicles don't teleport in gridlock. If positive,
             they teleport after teleport_time seconds
+        batch_commands: bool, optional
+            specifies whether actuation commands (accelerations, lane changes,
+            routes, and traffic light states) issued during a step should be
+            queued and sent to sumo in a single TraCI message right before the
+            simulation step, instead of one message per command. Defaults to
+            False
+        context_subscription: bool, optional
+            specifies whether the state of all vehicles should be collected
+            through a single network-wide context subscription instead of
+            individual subscriptions for every vehicle, so that vehicles
+            entering the network do not require any additional TraCI calls.
+            In this case, the leaders, followers, and headways of vehicles are
+            computed by flow from the positions of vehicles in their lanes
+            instead of by sumo. Defaults to False
+        process_pool_size: int, optional
+            number of idle sumo processes, started with the same command as
+            the one used by the environment, that are kept ready to replace
+            the current sumo instance. Starting and restarting sumo (e.g. at
+            resets if "restart_instance" is set to True) then does not wait
+            for sumo to load the scenario. Not used with sumo's gui. Defaults
+            to 0 (no pool)
+        use_libsumo: bool, optional
+            specifies whether sumo should be run within the python process
+            through libsumo, instead of as a separate process communicating
+            over a TraCI socket. This removes the serialization and socket
+            costs of every TraCI call. Only one simulation may be run per
+            process with libsumo, and the gui is still run over TraCI.
+            Requires libsumo to be installed. Defaults to False
+        count_traci_calls: bool, optional
+            specifies whether the number and wall time of the TraCI calls
+            performed by the environment should be recorded per command
+            (e.g. "vehicle.getSpeed"). The statistics of every episode are
+            logged at resets, and are available at any time (per step, per
+            episode, and in total) from the "traci_stats" attribute of the
+            environment (see flow.core.traci_counter.TraCICallStats).
+            Defaults to False
+        flow_leaders: bool, optional
+            specifies whether the leaders, followers, and headways of vehicles
+            should be computed by flow from the positions of vehicles in their
+            lanes (and in the edges ahead of them), instead of subscribing to
+            the leader of every vehicle in sumo. This removes the leader
+            search that sumo performs for every vehicle at every step. Always
+            the case if "context_subscription" is set to True. Defaults to
+            False
+        validate_leaders: bool, optional
+            specifies whether the leaders and headways computed by flow should
+            be compared at every step to the ones provided by sumo, with any
+            mismatch being logged. The leaders of vehicles are then subscribed
+            to in sumo even if "flow_leaders" is set to True, but the values
+            computed by flow are still the ones used in this case. Not
+            available with "context_subscription". Defaults to False
 
         """
         self.port = port
@@ -77,6 +136,13 @@ class SumoParams:
         self.restart_instance = restart_instance
         self.print_warnings = print_warnings
         self.teleport_time = teleport_time
+        self.batch_commands = batch_commands
+        self.context_subscription = context_subscription
+        self.process_pool_size = process_pool_size
+        self.use_libsumo = use_libsumo
+        self.count_traci_calls = count_traci_calls
+        self.flow_leaders = flow_leaders
+        self.validate_leaders = validate_leaders
 
 
 class EnvParams:
@@ -89,7 +155,12 @@ class EnvParams:
                  sort_vehicles=False,
                  warmup_steps=0,
                  sims_per_step=1,
-                 evaluate=False):
+                 evaluate=False,
+                 snapshot_reset=None,
+                 profile=False,
+                 vehicle_arrays=False,
+                 vehicle_history=0,
+                 history_states=None):
         """Environment and experiment-specific parameters.
 
         This includes specifying the bounds of the action space and relevant
@@ -126,6 +197,50 @@ class EnvParams:
                 flag indicating that the evaluation reward should be used
                 so the evaluation reward should be used rather than the
                 normal reward
+            snapshot_reset: str, optional
+                specifies whether the state of the network at the start of a
+                rollout should be restored from a snapshot saved by sumo,
+                instead of removing and re-adding every vehicle at every
+                reset. May be one of:
+
+                - None (default): vehicles are re-added at every reset
+                - "initial": the state before the warmup steps is saved during
+                  the first reset, and the warmup steps are performed after
+                  every restore
+                - "warmup": the state after the warmup steps is saved during
+                  the first reset, and no warmup steps are performed after a
+                  restore
+
+                Snapshots are not used if the starting positions or the
+                arrangement of vehicles are shuffled at resets.
+            profile: bool, optional
+                specifies whether the time spent in the different phases of
+                a step (controllers, simulation step, state updates,
+                observations, rewards, ...) should be measured. The per-phase
+                breakdown is logged at every reset, and is available at any
+                time from the "profiler" attribute of the environment (see
+                flow.core.profiler.StepProfiler). Defaults to False
+            vehicle_arrays: bool, optional
+                specifies whether the speeds, lanes, edges, positions,
+                headways, leaders, followers, lengths, and types of vehicles
+                are stored in numpy arrays indexed by vehicle slots, rather
+                than in a dictionary per vehicle. The getters of the vehicles
+                class are unchanged, and environments may additionally access
+                the arrays directly through vehicles.arrays (see
+                flow.core.vehicle_arrays.VehicleArrays). Defaults to False
+            vehicle_history: int, optional
+                number of time steps (including the current one) during which
+                the states of vehicles are retained, in ring buffers indexed
+                by vehicle slots. The past states are read with
+                vehicles.get_history, e.g. for time-delayed controllers or
+                stacked-frame observations. This implies vehicle_arrays.
+                Defaults to 0 (no history)
+            history_states: list<str>, optional
+                names of the states whose history is retained if
+                vehicle_history is positive, among "speed", "lane",
+                "position", "absolute_position", "headway", and "length".
+                Defaults to the speeds, positions, headways, and lanes of
+                vehicles
 
         """
         self.vehicle_arrangement_shuffle = vehicle_arrangement_shuffle
@@ -137,6 +252,11 @@ class EnvParams:
         self.warmup_steps = warmup_steps
         self.sims_per_step = sims_per_step
         self.evaluate = evaluate
+        self.snapshot_reset = snapshot_reset
+        self.profile = profile
+        self.vehicle_arrays = vehicle_arrays
+        self.vehicle_history = vehicle_history
+        self.history_states = history_states
 
     def get_additional_param(self, key):
         return self.additional_params[key]
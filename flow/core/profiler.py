@@ -0,0 +1,155 @@
+"""
+Contains a profiler measuring the time spent in the phases of a step.
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+
+class StepProfiler:
+
+    def __init__(self, enabled=True, window=10000):
+        """Per-phase step profiler.
+
+        Measures the time spent in named phases (e.g. "simulation_step",
+        "compute_reward") of every step. The durations of the last window
+        samples of every phase are kept, from which the mean, median, and
+        99th percentile of each phase can be computed at any time.
+
+        Phases are timed with a context manager:
+
+            >>> with profiler.phase("compute_reward"):
+            >>>     reward = env.compute_reward(state, actions)
+
+        If the profiler is not enabled, phases are not timed, and the only
+        overhead is a function call per phase.
+
+        Attributes
+        ----------
+        enabled: bool, optional
+            specifies whether phases are timed. Defaults to True
+        window: int, optional
+            number of most recent durations kept per phase
+        """
+        self.enabled = enabled
+        self.window = window
+
+        # Key = name of the phase
+        # Element = durations (in seconds) of the most recent samples
+        self.durations = dict()
+
+    def phase(self, name):
+        """Returns a context manager timing a phase of the step.
+
+        Parameters
+        ----------
+        name: str
+            name of the phase
+
+        Returns
+        -------
+        context manager
+            records the time spent within its context
+        """
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def record(self, name, duration):
+        """Adds the duration of a phase to its rolling window.
+
+        Parameters
+        ----------
+        name: str
+            name of the phase
+        duration: float
+            time spent in the phase, in seconds
+        """
+        if name not in self.durations:
+            self.durations[name] = deque(maxlen=self.window)
+        self.durations[name].append(duration)
+
+    def summary(self):
+        """Returns statistics of the durations of every phase.
+
+        Returns
+        -------
+        dict
+            Key = name of the phase
+            Element = dict with the number of samples ("count") and the
+            "mean", "p50", "p99", and "total" durations in seconds
+        """
+        summary = dict()
+        for name, durations in self.durations.items():
+            if len(durations) == 0:
+                continue
+            samples = np.array(durations)
+            summary[name] = {
+                "count": len(samples),
+                "mean": np.mean(samples),
+                "p50": np.percentile(samples, 50),
+                "p99": np.percentile(samples, 99),
+                "total": np.sum(samples),
+            }
+        return summary
+
+    def report(self):
+        """Returns a table of the statistics of every phase.
+
+        Phases are sorted by decreasing total time, and durations are given
+        in milliseconds. If a "step" phase is recorded, the share of the
+        total step time spent in every phase is also given.
+
+        Returns
+        -------
+        str
+            per-phase breakdown of the time spent in the step
+        """
+        summary = self.summary()
+        step_time = summary.get("step", {}).get("total", 0)
+
+        lines = ["{:<24}{:>8}{:>10}{:>10}{:>10}{:>8}".format(
+            "phase", "count", "mean", "p50", "p99", "share")]
+        for name in sorted(summary, key=lambda n: -summary[n]["total"]):
+            stats = summary[name]
+            share = "" if step_time == 0 else \
+                "{:.1%}".format(stats["total"] / step_time)
+            lines.append("{:<24}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>8}".format(
+                name, stats["count"], 1e3 * stats["mean"],
+                1e3 * stats["p50"], 1e3 * stats["p99"], share))
+
+        return "\n".join(lines)
+
+    def clear(self):
+        """Removes all recorded durations."""
+        self.durations = dict()
+
+
+class _Phase:
+
+    __slots__ = ["profiler", "name", "start"]
+
+    def __init__(self, profiler, name):
+        """Context manager recording the duration of a phase."""
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class _NullPhase:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+# context manager returned for all phases when profiling is disabled
+_NULL_PHASE = _NullPhase()
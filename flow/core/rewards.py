@@ -29,7 +29,7 @@ def desired_velocity(env, fail=False):
     fail: bool
         specifies if any crash or other failure occurred in the system
     """
-    vel = np.array(env.vehicles.get_speed(env.vehicles.get_ids()))
+    vel = env.vehicles.get_array("speed")
     num_vehicles = env.vehicles.num_vehicles
 
     if any(vel < -100) or fail:
@@ -63,7 +63,7 @@ def max_edge_velocity(env, edge_list, fail=False):
         specifies if any crash or other failure occurred in the system
     """
     veh_ids = env.vehicles.get_ids_by_edge(edge_list)
-    vel = np.array(env.vehicles.get_speed(veh_ids))
+    vel = env.vehicles.get_array("speed", veh_ids)
     num_vehicles = len(veh_ids)
 
     if any(vel < -100) or fail:
@@ -115,7 +115,7 @@ def min_delay(env):
         state of the system.
     """
 
-    vel = np.array(env.vehicles.get_speed(env.vehicles.get_ids()))
+    vel = env.vehicles.get_array("speed")
 
     vel = vel[vel >= -1e-6]
     v_top = max(env.scenario.speed_limit(edge)
@@ -137,7 +137,7 @@ def min_delay_unscaled(env):
         state of the system.
     """
 
-    vel = np.array(env.vehicles.get_speed(env.vehicles.get_ids()))
+    vel = env.vehicles.get_array("speed")
 
     vel = vel[vel >= -1e-6]
     v_top = max(env.scenario.speed_limit(edge)
@@ -178,8 +178,8 @@ def penalize_headway_variance(vehicles, vids, normalization=1, penalty_gain=1,
     penalty_exponent: float, optional
         used to allow exponential punishing of smaller headways
     """
-    headways = penalty_gain * np.power(np.array(
-        [vehicles.get_headway(veh_id) / normalization for veh_id in vids]),
+    headways = penalty_gain * np.power(
+        vehicles.get_array("headway", vids) / normalization,
         penalty_exponent)
     return -np.var(headways)
 
@@ -203,12 +203,11 @@ def punish_small_rl_headways(env, headway_threshold,
     penalty_exponent: float, optional
         used to allow exponential punishing of smaller headways
     """
-    headway_penalty = 0
-    for veh_id in env.vehicles.get_rl_ids():
-        if env.vehicles.get_headway(veh_id) < headway_threshold:
-            headway_penalty += \
-                (((headway_threshold - env.vehicles.get_headway(veh_id)) /
-                  headway_threshold) ** penalty_exponent) * penalty_gain
+    headways = env.vehicles.get_array("headway", env.vehicles.get_rl_ids())
+    headways = headways[headways < headway_threshold]
+    headway_penalty = np.sum(
+        ((headway_threshold - headways) / headway_threshold)
+        ** penalty_exponent) * penalty_gain
 
     # return max_headway_penalty - headway_penalty
     return -np.abs(headway_penalty)
@@ -0,0 +1,170 @@
+"""
+Contains a pool of pre-started sumo processes.
+
+Starting sumo requires loading the network, routes and additional files of a
+scenario before a TraCI client may connect, which stalls every environment
+construction and every reset that restarts the sumo instance. The pool below
+keeps a number of idle sumo processes, started with the same command and
+already loading (or waiting for a client on) their own port, and hands one
+out on request. A replacement process is started immediately, and loads in
+the background while the rollout continues.
+"""
+import atexit
+import os
+import random
+import signal
+import subprocess
+import threading
+
+import sumolib
+
+# pools created so far, keyed by the sumo command (without the port) and
+# whether the processes use random seeds
+_POOLS = dict()
+
+# environments may be started and restarted from several threads (e.g. by
+# FlowVecEnv), so the pools are only accessed while holding this lock
+_LOCK = threading.RLock()
+
+
+class SumoProcessPool:
+
+    def __init__(self, sumo_call, size, random_seed=False):
+        """Pool of idle sumo processes sharing the same command.
+
+        Attributes
+        ----------
+        sumo_call: list of str
+            command used to start sumo, without the "--remote-port" option
+        size: int
+            number of idle sumo processes kept by the pool
+        random_seed: bool, optional
+            specifies whether every process should be started with a new
+            random seed (in which case sumo_call should not contain the
+            "--seed" option). Defaults to False
+        """
+        self.sumo_call = list(sumo_call)
+        self.size = size
+        self.random_seed = random_seed
+
+        # list of (process, port, seed) tuples of the idle sumo instances
+        self._idle = []
+
+        self._refill()
+
+    def acquire(self):
+        """Returns an idle sumo process, and starts a replacement for it.
+
+        Processes that exited while idle (e.g. because another process took
+        their port first) are discarded. If no idle process is available, a
+        new one is started.
+
+        Returns
+        -------
+        subprocess.Popen type
+            the sumo process, which is owned by the caller from now on
+        int
+            the port the sumo process accepts a TraCI connection on
+        int or None
+            the seed the sumo process was started with, if random_seed is set
+        """
+        with _LOCK:
+            instance = None
+            while len(self._idle) > 0 and instance is None:
+                proc, port, seed = self._idle.pop(0)
+                if proc.poll() is None:
+                    instance = (proc, port, seed)
+
+            if instance is None:
+                instance = self._launch()
+
+            self._refill()
+
+        return instance
+
+    def num_idle(self):
+        """Returns the number of idle sumo processes in the pool."""
+        with _LOCK:
+            return len(self._idle)
+
+    def close(self):
+        """Terminates all idle sumo processes of the pool."""
+        with _LOCK:
+            idle, self._idle = self._idle, []
+        for proc, _, _ in idle:
+            _kill(proc)
+
+    def _refill(self):
+        """Starts sumo processes until the pool contains size idle ones."""
+        while len(self._idle) < self.size:
+            self._idle.append(self._launch())
+
+    def _launch(self):
+        """Starts a sumo process listening on a free port."""
+        port = sumolib.miscutils.getFreeSocketPort()
+        sumo_call = self.sumo_call + ["--remote-port", str(port)]
+
+        seed = None
+        if self.random_seed:
+            seed = random.randint(0, int(1e5))
+            sumo_call += ["--seed", str(seed)]
+
+        proc = subprocess.Popen(sumo_call, preexec_fn=os.setsid)
+        return proc, port, seed
+
+
+def get_pool(sumo_call, size, random_seed=False):
+    """Returns the process pool for a sumo command, creating it if needed.
+
+    Parameters
+    ----------
+    sumo_call: list of str
+        command used to start sumo, without the "--remote-port" option
+    size: int
+        number of idle sumo processes kept by the pool (the largest value
+        requested for a command is used)
+    random_seed: bool, optional
+        specifies whether the processes should be started with random seeds
+        (see SumoProcessPool)
+
+    Returns
+    -------
+    SumoProcessPool type
+        the pool of processes started with this command
+    """
+    key = (tuple(sumo_call), random_seed)
+    with _LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = SumoProcessPool(sumo_call, size, random_seed)
+        elif _POOLS[key].size < size:
+            _POOLS[key].size = size
+            _POOLS[key]._refill()
+
+        return _POOLS[key]
+
+
+def active_pools():
+    """Returns the pools created so far (and not closed)."""
+    with _LOCK:
+        return list(_POOLS.values())
+
+
+def close_pools():
+    """Terminates the idle sumo processes of all pools."""
+    with _LOCK:
+        for pool in _POOLS.values():
+            pool.close()
+        _POOLS.clear()
+
+
+def _kill(proc):
+    """Terminates a sumo process (and its process group)."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    proc.wait()
+
+
+# idle sumo processes should not outlive the python process
+atexit.register(close_pools)
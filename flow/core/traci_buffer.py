@@ -0,0 +1,221 @@
+"""
+Contains a wrapper around a TraCI connection that batches the actuation
+commands issued during a simulation step into a single TraCI message.
+
+TraCI supports several commands per message: every command is appended to
+the connection's outgoing buffer, and a single call to the connection's
+``_sendExact`` method sends them together and validates one status response
+per command. The classes below use this to replace the one-round-trip-per-
+vehicle cost of commands such as ``slowDown`` and ``changeLane`` by a single
+round trip per step.
+
+``_sendExact`` and the buffers it sends (``_string`` and ``_queue``) are
+private attributes of ``traci.connection.Connection``. They are the same in
+the traci clients of SUMO 0.32 up to 1.x (tested with 1.28). Commands are only
+batched if the installed traci client is one of these versions and the
+connection has these attributes; otherwise they are sent to sumo immediately,
+as without the buffer.
+"""
+import logging
+import re
+
+import traci
+from traci.domain import Domain
+
+# latest major version of the traci client whose connection internals are
+# known to support batching (see the module docstring)
+MAX_TRACI_MAJOR_VERSION = 1
+
+# commands (per TraCI domain) that are queued instead of being sent to sumo
+# immediately. These commands do not return any value, and their effects are
+# only observable after the next simulation step.
+BUFFERED_COMMANDS = {
+    "vehicle": ["slowDown", "changeLane", "setRoute", "setSpeedMode",
+                "setLaneChangeMode"],
+    "trafficlight": ["setRedYellowGreenState", "setLinkState"],
+}
+
+
+class TraCICommandBuffer:
+
+    def __init__(self, connection, buffered_commands=None):
+        """Batched TraCI command channel.
+
+        Acts as a drop-in replacement for a traci connection. Calls to any of
+        the buffered commands are queued, and flushed to sumo in a single
+        TraCI message right before the next simulation step. Any other
+        command (e.g. getters, ``addFull``, ``remove``) flushes the queue
+        before being executed, so the ordering of commands as seen by sumo is
+        identical to the unbuffered case.
+
+        Attributes
+        ----------
+        connection: traci.connection.Connection type
+            the TraCI connection used to communicate with sumo
+        buffered_commands: dict, optional
+            Key = name of the TraCI domain (e.g. "vehicle")
+            Element = list of commands in this domain that should be queued,
+            defaults to BUFFERED_COMMANDS
+        """
+        self._connection = connection
+        self._buffered_commands = buffered_commands or BUFFERED_COMMANDS
+        self._domains = dict()
+
+        # specifies whether commands can be batched with this connection. If
+        # not, queued commands are sent immediately
+        self.batching = supports_batching(connection)
+        if not self.batching:
+            logging.warning(" The traci client (version %s) does not support "
+                            "batched commands, they are sent one at a time",
+                            getattr(traci, "__version__", "unknown"))
+
+        # list of (method, args, kwargs) tuples waiting to be sent to sumo
+        self._queue = []
+
+        # number of commands and TraCI messages sent through the buffer
+        self.num_commands = 0
+        self.num_messages = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._connection, name)
+
+        if isinstance(attr, Domain):
+            # wrap the domain so that its commands go through the buffer
+            if name not in self._domains:
+                self._domains[name] = _BufferedDomain(
+                    self, attr, self._buffered_commands.get(name, []))
+            return self._domains[name]
+
+        if callable(attr):
+            return self._flushing(attr)
+
+        return attr
+
+    def queue(self, method, *args, **kwargs):
+        """Adds a command to the list of commands sent at the next flush.
+
+        If batching is not supported, the command is sent immediately.
+        """
+        if not self.batching:
+            method(*args, **kwargs)
+            self.num_commands += 1
+            self.num_messages += 1
+            return
+        self._queue.append((method, args, kwargs))
+
+    def flush(self):
+        """Sends all queued commands to sumo in a single TraCI message.
+
+        Raises
+        ------
+        traci.exceptions.TraCIException
+            If sumo rejected any of the queued commands.
+        """
+        if len(self._queue) == 0:
+            return
+
+        queue, self._queue = self._queue, []
+        send_exact = self._connection._sendExact
+
+        # let every command append itself to the outgoing message without
+        # sending it, and then send the whole message at once
+        self._connection._sendExact = _no_send
+        try:
+            for method, args, kwargs in queue:
+                method(*args, **kwargs)
+        finally:
+            del self._connection._sendExact
+
+        send_exact()
+
+        self.num_commands += len(queue)
+        self.num_messages += 1
+
+    def simulationStep(self, *args, **kwargs):
+        """Flushes the queued commands and advances the simulation."""
+        self.flush()
+        return self._connection.simulationStep(*args, **kwargs)
+
+    def close(self, *args, **kwargs):
+        """Closes the connection, discarding any command not yet sent."""
+        self._queue = []
+        return self._connection.close(*args, **kwargs)
+
+    def _flushing(self, method):
+        """Wraps a method so that the queue is flushed before calling it."""
+        def wrapper(*args, **kwargs):
+            self.flush()
+            return method(*args, **kwargs)
+        return wrapper
+
+
+class _BufferedDomain:
+
+    def __init__(self, buffer, domain, buffered_commands):
+        """A TraCI domain whose buffered commands are queued in the buffer.
+
+        Attributes
+        ----------
+        buffer: TraCICommandBuffer type
+            the buffer the commands are queued in
+        domain: traci.domain.Domain type
+            the domain that is wrapped
+        buffered_commands: list of str
+            commands in this domain that should be queued
+        """
+        self._buffer = buffer
+        self._domain = domain
+        self._buffered_commands = set(buffered_commands)
+
+    def __getattr__(self, name):
+        attr = getattr(self._domain, name)
+
+        if not callable(attr):
+            return attr
+
+        if name in self._buffered_commands:
+            def wrapper(*args, **kwargs):
+                self._buffer.queue(attr, *args, **kwargs)
+            return wrapper
+
+        return self._buffer._flushing(attr)
+
+    def queues(self, name):
+        """Returns whether calls to a command of the domain are queued
+        instead of being sent to sumo immediately."""
+        return self._buffer.batching and name in self._buffered_commands
+
+
+def supports_batching(connection):
+    """Returns whether commands can be batched with a TraCI connection.
+
+    This is the case if the version of the traci client is at most
+    MAX_TRACI_MAJOR_VERSION (clients without a version, such as the ones
+    shipped in the tools of older SUMO releases, are accepted), and the
+    connection has the private attributes used to batch commands.
+
+    Parameters
+    ----------
+    connection: traci.connection.Connection type
+        the TraCI connection used to communicate with sumo
+
+    Returns
+    -------
+    bool
+        True if commands can be batched
+    """
+    version = getattr(traci, "__version__", None)
+    if version is not None:
+        # versions are e.g. "1.28.0", or "v1_2_0" in older SUMO tools
+        major = re.match(r"\D*(\d+)", str(version))
+        if major is None or int(major.group(1)) > MAX_TRACI_MAJOR_VERSION:
+            return False
+
+    return isinstance(getattr(connection, "_string", None), bytes) \
+        and isinstance(getattr(connection, "_queue", None), list) \
+        and callable(getattr(connection, "_sendExact", None))
+
+
+def _no_send():
+    """Replaces Connection._sendExact while commands are being queued."""
+    return None
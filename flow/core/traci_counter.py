@@ -0,0 +1,287 @@
+"""
+Contains a wrapper around a TraCI connection that counts and times the
+commands sent to sumo.
+
+Every TraCI getter or setter is a round trip to the sumo process, and the
+number of these round trips per step usually dominates the runtime of an
+environment. The classes below record how many times every command (e.g.
+"vehicle.getSpeed") is called and how long it takes, for the current step,
+the current episode, and the whole lifetime of an environment.
+
+If the connection batches commands (see flow.core.traci_buffer), the queued
+commands are recorded as "<command> (queued)", and the message sending them
+to sumo as its own "flush" command, recorded before the command that
+triggered it.
+"""
+import time
+from bisect import bisect_right
+
+import numpy as np
+from traci.domain import Domain
+
+from flow.core.traci_buffer import TraCICommandBuffer, _BufferedDomain
+
+# types of the domains of a connection: TraCI domains are Domain objects,
+# libsumo domains are classes, and a TraCICommandBuffer wraps its domains
+DOMAIN_TYPES = (Domain, type, _BufferedDomain)
+
+# upper bounds (in seconds) of the bins of the latency histograms, from 1 us
+# to 1 s. The last bin contains all calls slower than 1 s.
+LATENCY_BINS = np.logspace(-6, 0, 25)
+
+
+class TraCICallStats:
+
+    def __init__(self):
+        """Statistics of the TraCI calls performed by an environment.
+
+        Calls are grouped by command, named "<domain>.<method>" (e.g.
+        "vehicle.getSpeed"), or "<method>" for commands of the connection
+        itself (e.g. "simulationStep"). A step ends with every call to
+        simulationStep.
+
+        Attributes
+        ----------
+        total: dict
+            Key = command
+            Element = [number of calls, total time in seconds] since the
+            creation of the environment
+        episode: dict
+            same as total, since the start of the current episode
+        step: dict
+            same as total, since the end of the last step
+        last_step: dict
+            same as total, during the last completed step
+        histograms: dict
+            Key = command
+            Element = number of calls per latency bin (see LATENCY_BINS)
+        num_steps: int
+            number of steps since the creation of the environment
+        episode_steps: int
+            number of steps since the start of the current episode
+        """
+        self.total = dict()
+        self.episode = dict()
+        self.step = dict()
+        self.last_step = dict()
+        self.histograms = dict()
+        self.num_steps = 0
+        self.episode_steps = 0
+
+    def record(self, command, duration):
+        """Adds a call to the statistics of a command.
+
+        Parameters
+        ----------
+        command: str
+            name of the command
+        duration: float
+            wall time of the call, in seconds
+        """
+        for calls in [self.total, self.episode, self.step]:
+            if command not in calls:
+                calls[command] = [0, 0.]
+            calls[command][0] += 1
+            calls[command][1] += duration
+
+        if command not in self.histograms:
+            self.histograms[command] = np.zeros(len(LATENCY_BINS) + 1,
+                                                dtype=int)
+        self.histograms[command][bisect_right(LATENCY_BINS, duration)] += 1
+
+    def end_step(self):
+        """Closes the statistics of the current step."""
+        self.last_step, self.step = self.step, dict()
+        self.num_steps += 1
+        self.episode_steps += 1
+
+    def end_episode(self):
+        """Closes the statistics of the current episode."""
+        self.episode = dict()
+        self.episode_steps = 0
+
+    def percentile(self, command, q):
+        """Returns an estimate of a percentile of the latency of a command.
+
+        The estimate is the upper bound of the histogram bin containing the
+        percentile.
+
+        Parameters
+        ----------
+        command: str
+            name of the command
+        q: float
+            percentile, between 0 and 100
+
+        Returns
+        -------
+        float
+            latency of the command, in seconds
+        """
+        histogram = self.histograms[command]
+        rank = q / 100 * np.sum(histogram)
+        i = int(np.searchsorted(np.cumsum(histogram), rank))
+        return LATENCY_BINS[min(i, len(LATENCY_BINS) - 1)]
+
+    def calls_per_step(self, episode=True):
+        """Returns the average number of calls per step.
+
+        Parameters
+        ----------
+        episode: bool, optional
+            specifies whether the average is taken over the current episode
+            (default) or over the lifetime of the environment
+
+        Returns
+        -------
+        dict
+            Key = command
+            Element = average number of calls per step
+        """
+        calls = self.episode if episode else self.total
+        num_steps = max(self.episode_steps if episode else self.num_steps, 1)
+        return {command: count / num_steps
+                for command, (count, _) in calls.items()}
+
+    def report(self, episode=True):
+        """Returns a table of the statistics of every command.
+
+        Commands are sorted by decreasing total time.
+
+        Parameters
+        ----------
+        episode: bool, optional
+            specifies whether the statistics of the current episode
+            (default) or of the lifetime of the environment are reported
+
+        Returns
+        -------
+        str
+            number of calls (in total and per step), total time, and mean and
+            99th percentile latencies (in ms) of every command
+        """
+        calls = self.episode if episode else self.total
+        per_step = self.calls_per_step(episode)
+
+        header = "{:<36}{:>9}{:>10}{:>10}{:>9}{:>9}"
+        row = "{:<36}{:>9}{:>10.1f}{:>10.3f}{:>9.3f}{:>9.3f}"
+        lines = [header.format(
+            "command", "calls", "per step", "time (s)", "mean", "p99")]
+        for command in sorted(calls, key=lambda c: -calls[c][1]):
+            count, duration = calls[command]
+            lines.append(row.format(
+                command, count, per_step[command], duration,
+                1e3 * duration / count, 1e3 * self.percentile(command, 99)))
+
+        return "\n".join(lines)
+
+
+class TraCICallCounter:
+
+    def __init__(self, connection, stats):
+        """TraCI connection recording the calls performed through it.
+
+        Acts as a drop-in replacement for a traci connection (or a libsumo
+        module, or a TraCICommandBuffer). Every call to a command of the
+        connection or of one of its domains is timed and recorded in stats.
+
+        Attributes
+        ----------
+        connection: traci.connection.Connection type
+            the TraCI connection used to communicate with sumo
+        stats: TraCICallStats type
+            statistics the calls are recorded in
+        """
+        self._connection = connection
+        self.stats = stats
+        self._domains = dict()
+
+        # buffer whose queued commands are flushed (and recorded) before
+        # every other command, if the connection batches commands
+        self._buffer = connection \
+            if isinstance(connection, TraCICommandBuffer) else None
+
+    def __getattr__(self, name):
+        attr = getattr(self._connection, name)
+
+        if isinstance(attr, DOMAIN_TYPES):
+            if name not in self._domains:
+                self._domains[name] = _CountedDomain(
+                    self.stats, attr, name, self._flush)
+            return self._domains[name]
+
+        if callable(attr):
+            return _counted(self.stats, attr, name)
+
+        return attr
+
+    def simulationStep(self, *args, **kwargs):
+        """Advances the simulation, and closes the statistics of the step."""
+        self._flush()
+        result = _counted(self.stats, self._connection.simulationStep,
+                          "simulationStep")(*args, **kwargs)
+        self.stats.end_step()
+        return result
+
+    def _flush(self):
+        """Sends the commands queued in the buffer (if any) to sumo, and
+        records the message as a "flush" command."""
+        if self._buffer is None:
+            return
+        num_messages = self._buffer.num_messages
+        start = time.perf_counter()
+        self._buffer.flush()
+        if self._buffer.num_messages > num_messages:
+            self.stats.record("flush", time.perf_counter() - start)
+
+
+class _CountedDomain:
+
+    def __init__(self, stats, domain, name, flush):
+        """A TraCI domain whose calls are recorded in stats.
+
+        Attributes
+        ----------
+        stats: TraCICallStats type
+            statistics the calls are recorded in
+        domain: traci.domain.Domain type
+            the domain that is wrapped
+        name: str
+            name of the domain (e.g. "vehicle")
+        flush: callable
+            sends the commands queued by the connection, before any command
+            that is not queued (see TraCICallCounter)
+        """
+        self._stats = stats
+        self._domain = domain
+        self._name = name
+        self._flush = flush
+
+    def __getattr__(self, name):
+        attr = getattr(self._domain, name)
+
+        if not callable(attr):
+            return attr
+
+        command = self._name + "." + name
+        if isinstance(self._domain, _BufferedDomain) and \
+                self._domain.queues(name):
+            return _counted(self._stats, attr, command + " (queued)")
+
+        return _counted(self._stats, attr, command, self._flush)
+
+
+def _counted(stats, method, command, flush=None):
+    """Wraps a method so that its calls are recorded in stats.
+
+    If flush is specified, it is called before the call is timed.
+    """
+    def wrapper(*args, **kwargs):
+        if flush is not None:
+            flush()
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            stats.record(command, time.perf_counter() - start)
+    return wrapper
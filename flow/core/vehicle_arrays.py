@@ -0,0 +1,342 @@
+"""
+Contains a struct-of-arrays storage of the states of vehicles.
+
+Every state (e.g. the speed) of all vehicles is stored in a contiguous numpy
+array, at the integer slot of every vehicle. Environments may use these arrays
+to compute observations and rewards with vectorized numpy operations, instead
+of per-vehicle getter calls.
+"""
+import heapq
+
+import numpy as np
+
+# slot codes of the leaders and followers of vehicles (non-negative codes are
+# the slots of the leaders or followers)
+NO_VEHICLE = -1  # None (the vehicle has no leader/follower)
+EMPTY_VEHICLE = -2  # "" (sumo did not return a leader)
+# leaders and followers that do not have a slot (e.g. vehicles that were not
+# added to the vehicles class) are stored as OTHER_VEHICLE - i, where i is the
+# index of their name in VehicleArrays.other_ids
+OTHER_VEHICLE = -4
+
+# Key = name of the state
+# Element = (dtype of the array, value of the slots where the state is unset)
+COLUMNS = {
+    "speed": (np.float64, np.nan),
+    "lane": (np.int64, -1),
+    "edge": (np.int64, -1),
+    "position": (np.float64, np.nan),
+    "absolute_position": (np.float64, np.nan),
+    "headway": (np.float64, np.nan),
+    "leader": (np.int64, -3),
+    "follower": (np.int64, -3),
+    "length": (np.float64, np.nan),
+    "type": (np.int64, -1),
+}
+
+# states whose values are slots of other vehicles
+SLOT_COLUMNS = ["leader", "follower"]
+
+
+class VehicleArrays:
+
+    def __init__(self, capacity=16):
+        """Struct-of-arrays storage of the states of vehicles.
+
+        Every vehicle is assigned an integer slot when it is added, and its
+        states are stored at this slot in one numpy array per state (see
+        COLUMNS), e.g. arrays.speed[arrays.slots["human_0"]]. The slots of
+        removed vehicles are reused by the next vehicles that are added, with
+        the lowest free slots reused first, so that the arrays stay compact.
+
+        The following states are not stored as is:
+
+        * edges and types are stored as indices in the edges and types lists
+        * leaders and followers are stored as the slots of these vehicles, or
+          as NO_VEHICLE (None) or EMPTY_VEHICLE (""). Vehicles without a slot
+          are stored as indices in the other_ids list (see OTHER_VEHICLE)
+
+        Slots whose state was never set (or of removed vehicles) contain the
+        value specified in COLUMNS, e.g. NaN for float states.
+
+        Attributes
+        ----------
+        capacity: int, optional
+            initial number of slots of the arrays. The arrays are doubled in
+            size whenever they are full
+        """
+        self.capacity = capacity
+
+        # Key = vehicle id
+        # Element = slot of the vehicle
+        self.slots = dict()
+
+        # id of the vehicle at every slot (None for free slots)
+        self.ids = np.full(capacity, None, dtype=object)
+
+        # names of the edges and types, and their indices
+        self.edges = [""]
+        self.edge_index = {"": 0}
+        self.types = []
+        self.type_index = dict()
+
+        # names of the leaders and followers without a slot, and their indices
+        self.other_ids = []
+        self.other_index = dict()
+
+        # free slots below the number of slots ever used (min-heap)
+        self._free = []
+        self._num_used = 0
+
+        for name, (dtype, unset) in COLUMNS.items():
+            setattr(self, name, np.full(capacity, unset, dtype=dtype))
+
+    def add(self, veh_id):
+        """Assigns a slot to a vehicle.
+
+        Parameters
+        ----------
+        veh_id: str
+            name of the vehicle
+
+        Returns
+        -------
+        int
+            slot of the vehicle
+        """
+        if veh_id in self.slots:
+            return self.slots[veh_id]
+
+        if self._free:
+            slot = heapq.heappop(self._free)
+        else:
+            if self._num_used == self.capacity:
+                self._grow()
+            slot = self._num_used
+            self._num_used += 1
+
+        self.slots[veh_id] = slot
+        self.ids[slot] = veh_id
+        return slot
+
+    def remove(self, veh_id):
+        """Frees the slot of a vehicle, and unsets all its states.
+
+        Parameters
+        ----------
+        veh_id: str
+            name of the vehicle
+        """
+        slot = self.slots.pop(veh_id)
+        self.ids[slot] = None
+        for name, (_, unset) in COLUMNS.items():
+            getattr(self, name)[slot] = unset
+        heapq.heappush(self._free, slot)
+
+    def get_slots(self, veh_ids, missing=None):
+        """Returns the slots of vehicles.
+
+        Parameters
+        ----------
+        veh_ids: list<str>
+            names of the vehicles
+        missing: int, optional
+            slot returned for vehicles that do not have a slot. If not
+            specified, a KeyError is raised for these vehicles
+
+        Returns
+        -------
+        numpy ndarray
+            slots of the vehicles, which may be used to index the arrays of
+            any state
+        """
+        if missing is None:
+            slots = [self.slots[veh_id] for veh_id in veh_ids]
+        else:
+            slots = [self.slots.get(veh_id, missing) for veh_id in veh_ids]
+        return np.array(slots, dtype=np.int64)
+
+    def get(self, name, veh_id, error):
+        """Returns the state of a vehicle.
+
+        Parameters
+        ----------
+        name: str
+            name of the state (see COLUMNS)
+        veh_id: str
+            name of the vehicle
+        error: any
+            value that is returned if the vehicle is not found, or if its
+            state is not set
+
+        Returns
+        -------
+        any
+            the state of the vehicle, as it was set (e.g. an edge name)
+        """
+        slot = self.slots.get(veh_id)
+        if slot is None:
+            return error
+
+        value = getattr(self, name).item(slot)
+        if value == COLUMNS[name][1] or value != value:
+            return error
+
+        if name == "edge":
+            return self.edges[value]
+        if name == "type":
+            return self.types[value]
+        if name in SLOT_COLUMNS:
+            if value == NO_VEHICLE:
+                return None
+            if value == EMPTY_VEHICLE:
+                return ""
+            if value <= OTHER_VEHICLE:
+                return self.other_ids[OTHER_VEHICLE - value]
+            return self.ids[value]
+        return value
+
+    def gather(self, name, slots, error):
+        """Returns the state of several vehicles.
+
+        Parameters
+        ----------
+        name: str
+            name of the state (see COLUMNS)
+        slots: array_like
+            slots of the vehicles. Negative slots denote missing vehicles
+        error: any
+            value that is returned for missing vehicles, and vehicles whose
+            state is not set
+
+        Returns
+        -------
+        numpy ndarray
+            the states of the vehicles, as they were set. Edges, types,
+            leaders, and followers are returned in an array of objects
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        found = slots >= 0
+        values = getattr(self, name)[np.where(found, slots, 0)]
+        unset = COLUMNS[name][1]
+        missing = ~found | (values == unset) | (values != values)
+
+        if name == "edge":
+            table = np.array(self.edges, dtype=object)
+        elif name == "type":
+            table = np.array(self.types + [None], dtype=object)
+        elif name in SLOT_COLUMNS:
+            # negative codes index the elements of the table after the ids:
+            # NO_VEHICLE (-1), EMPTY_VEHICLE (-2), the unset value (-3), and
+            # the vehicles without a slot (OTHER_VEHICLE and below)
+            table = np.concatenate([self.ids, np.array(
+                [None, "", None] + self.other_ids, dtype=object)])
+            values = np.where(values >= 0, values, self.capacity - values - 1)
+        else:
+            return np.where(missing, error, values)
+
+        values = table[np.where(missing, 0, values)]
+        values[missing] = error
+        return values
+
+    def set(self, name, veh_id, value):
+        """Sets the state of a vehicle.
+
+        Parameters
+        ----------
+        name: str
+            name of the state (see COLUMNS)
+        veh_id: str
+            name of the vehicle
+        value: any
+            new state of the vehicle (e.g. an edge name)
+
+        Raises
+        ------
+        KeyError
+            if the vehicle does not have a slot
+        """
+        getattr(self, name)[self.slots[veh_id]] = self.encode(name, value)
+
+    def encode(self, name, value):
+        """Returns the value stored in the array of a state for a value of
+        this state.
+
+        Edge and type names are added to their tables the first time they are
+        encoded. Leaders and followers that do not have a slot are added to
+        the other_ids table the first time they are encoded, so that their
+        names are returned as they were set.
+        """
+        if name == "edge":
+            if value not in self.edge_index:
+                self.edge_index[value] = len(self.edges)
+                self.edges.append(value)
+            return self.edge_index[value]
+        if name == "type":
+            if value not in self.type_index:
+                self.type_index[value] = len(self.types)
+                self.types.append(value)
+            return self.type_index[value]
+        if name in SLOT_COLUMNS:
+            if value is None:
+                return NO_VEHICLE
+            if value == "":
+                return EMPTY_VEHICLE
+            if value in self.slots:
+                return self.slots[value]
+            if value not in self.other_index:
+                self.other_index[value] = len(self.other_ids)
+                self.other_ids.append(value)
+            return OTHER_VEHICLE - self.other_index[value]
+        return value
+
+    def set_sumo_obs(self, vehicle_obs, sumo_vars):
+        """Sets the states of all vehicles that are provided by sumo.
+
+        Parameters
+        ----------
+        vehicle_obs: dict
+            vehicle observations provided from sumo via subscriptions
+        sumo_vars: dict
+            Key = name of the state
+            Element = TraCI variable the state is subscribed as
+        """
+        veh_ids = list(self.slots)
+        slots = self.get_slots(veh_ids)
+        observations = [vehicle_obs.get(veh_id) or {} for veh_id in veh_ids]
+
+        for name, var in sumo_vars.items():
+            unset = COLUMNS[name][1]
+            if name == "edge":
+                values = [self.encode("edge", obs[var]) if var in obs
+                          else unset for obs in observations]
+            else:
+                values = [obs.get(var, unset) for obs in observations]
+            getattr(self, name)[slots] = values
+
+    def copy(self):
+        """Returns a copy of the arrays, slots, and tables of names."""
+        arrays = VehicleArrays.__new__(VehicleArrays)
+        arrays.__dict__ = self.__dict__.copy()
+        arrays.slots = dict(self.slots)
+        arrays.ids = self.ids.copy()
+        arrays.edges = list(self.edges)
+        arrays.edge_index = dict(self.edge_index)
+        arrays.types = list(self.types)
+        arrays.type_index = dict(self.type_index)
+        arrays.other_ids = list(self.other_ids)
+        arrays.other_index = dict(self.other_index)
+        arrays._free = list(self._free)
+        for name in COLUMNS:
+            setattr(arrays, name, getattr(self, name).copy())
+        return arrays
+
+    def _grow(self):
+        """Doubles the number of slots of the arrays."""
+        extra = self.capacity
+        self.ids = np.concatenate(
+            [self.ids, np.full(extra, None, dtype=object)])
+        for name, (dtype, unset) in COLUMNS.items():
+            setattr(self, name, np.concatenate(
+                [getattr(self, name), np.full(extra, unset, dtype=dtype)]))
+        self.capacity += extra
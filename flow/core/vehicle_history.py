@@ -0,0 +1,164 @@
+"""
+Contains a storage of the past states of vehicles.
+
+The states of the last time steps (e.g. the speeds of vehicles during the last
+10 steps) are stored in fixed-size numpy ring buffers, indexed by the slots of
+vehicles in a flow.core.vehicle_arrays.VehicleArrays object, so that recording
+the states of a step does not allocate any memory.
+"""
+import numpy as np
+
+from flow.core.vehicle_arrays import COLUMNS
+
+# states whose history is retained by default
+DEFAULT_STATES = ["speed", "position", "headway", "lane"]
+
+# states whose history may be retained (states stored as indices or slots,
+# e.g. edges and leaders, are not)
+HISTORY_STATES = ["speed", "lane", "position", "absolute_position",
+                  "headway", "length"]
+
+
+class VehicleHistory:
+
+    def __init__(self, num_steps, states=None, capacity=16):
+        """Ring buffers of the past states of vehicles.
+
+        The states of all slots of the vehicle arrays are copied into the
+        buffers at every time step (see record). The buffer of a state is a
+        (num_steps, capacity) array, where the row of a step is the step
+        modulo num_steps, and the column of a vehicle is its slot.
+
+        The history of a slot is erased when its vehicle is removed (see
+        clear_slot), so that vehicles that reuse a slot do not inherit the
+        history of the previous vehicle. Steps during which a vehicle was not
+        in the network contain the value specified in
+        flow.core.vehicle_arrays.COLUMNS, e.g. NaN for float states.
+
+        Attributes
+        ----------
+        num_steps: int
+            number of time steps that are retained (including the current
+            step)
+        states: list<str>, optional
+            names of the states whose history is retained (see
+            HISTORY_STATES). Defaults to the speeds, positions, headways, and
+            lanes of vehicles
+        capacity: int, optional
+            initial number of slots of the buffers. The buffers are grown with
+            the vehicle arrays
+        """
+        if num_steps < 1:
+            raise ValueError("At least one step must be retained.")
+        if states is None:
+            states = DEFAULT_STATES
+        for name in states:
+            if name not in HISTORY_STATES:
+                raise ValueError("The history of {} cannot be retained."
+                                 .format(name))
+
+        self.num_steps = num_steps
+        self.states = list(states)
+        self.capacity = capacity
+
+        # number of steps that were recorded since the history was cleared
+        self.recorded = 0
+
+        self.buffers = {
+            name: np.full((num_steps, capacity), COLUMNS[name][1],
+                          dtype=COLUMNS[name][0])
+            for name in self.states}
+
+    def record(self, arrays):
+        """Copies the current states of all slots into the buffers.
+
+        Parameters
+        ----------
+        arrays: flow.core.vehicle_arrays.VehicleArrays type
+            the current states of the vehicles
+        """
+        if arrays.capacity > self.capacity:
+            self._grow(arrays.capacity)
+
+        row = self.recorded % self.num_steps
+        for name, buffer in self.buffers.items():
+            buffer[row, :arrays.capacity] = getattr(arrays, name)
+        self.recorded += 1
+
+    def clear(self):
+        """Erases the history of all slots."""
+        for name, buffer in self.buffers.items():
+            buffer.fill(COLUMNS[name][1])
+        self.recorded = 0
+
+    def clear_slot(self, slot):
+        """Erases the history of a slot."""
+        if slot < self.capacity:
+            for name, buffer in self.buffers.items():
+                buffer[:, slot] = COLUMNS[name][1]
+
+    def gather(self, name, slots, steps_ago, error):
+        """Returns the past values of a state for several vehicles.
+
+        Parameters
+        ----------
+        name: str
+            name of the state
+        slots: array_like
+            slots of the vehicles. Negative slots denote missing vehicles
+        steps_ago: int or array_like
+            number of steps before the last recorded step (0 for the last
+            recorded step)
+        error: any
+            value that is returned for missing vehicles, vehicles whose state
+            was not set at these steps, and steps that were not recorded
+
+        Returns
+        -------
+        numpy ndarray
+            the values of the state. If steps_ago is an int, this is an array
+            with one value per vehicle. Otherwise, this is a (number of
+            vehicles, number of steps) array
+
+        Raises
+        ------
+        KeyError
+            if the history of the state is not retained
+        ValueError
+            if steps that are too old to be retained are requested
+        """
+        buffer = self.buffers[name]
+        steps = np.asarray(steps_ago, dtype=np.int64)
+        if np.any(steps >= self.num_steps) or np.any(steps < 0):
+            raise ValueError("Only the last {} steps are retained.".format(
+                self.num_steps))
+
+        slots = np.asarray(slots, dtype=np.int64)
+        found = (slots >= 0) & (slots < self.capacity)
+        rows = (self.recorded - 1 - np.atleast_1d(steps)) % self.num_steps
+        values = buffer[rows[:, None], np.where(found, slots, 0)].T
+
+        unset = COLUMNS[name][1]
+        missing = ~found[:, None] | (values == unset) | (values != values)
+        missing = missing | (np.atleast_1d(steps) >= self.recorded)
+        if steps.ndim == 0:
+            values, missing = values[:, 0], missing[:, 0]
+        return np.where(missing, error, values)
+
+    def copy(self):
+        """Returns a copy of the history."""
+        history = VehicleHistory.__new__(VehicleHistory)
+        history.__dict__ = self.__dict__.copy()
+        history.states = list(self.states)
+        history.buffers = {name: buffer.copy()
+                           for name, buffer in self.buffers.items()}
+        return history
+
+    def _grow(self, capacity):
+        """Adds slots to the buffers, up to a given number of slots."""
+        extra = capacity - self.capacity
+        for name, buffer in self.buffers.items():
+            self.buffers[name] = np.concatenate(
+                [buffer, np.full((self.num_steps, extra), COLUMNS[name][1],
+                                 dtype=buffer.dtype)], axis=1)
+        self.capacity = capacity
@@ -1,20 +1,52 @@
 from flow.controllers.car_following_models import SumoCarFollowingController
 from flow.controllers.rlcontroller import RLController
 from flow.controllers.lane_change_controllers import SumoLaneChangeController
+import bisect
 import collections
+import copy
 import logging
-from bisect import bisect_left
-import itertools
 import numpy as np
 
 import traci.constants as tc
 
 from flow.core.params import SumoCarFollowingParams, SumoLaneChangeParams
+from flow.core.vehicle_arrays import VehicleArrays
+from flow.core.vehicle_history import VehicleHistory
 
 SPEED_MODES = {"aggressive": 0, "no_collide": 1, "right_of_way": 25,
                "all_checks": 31}
 LC_MODES = {"aggressive": 0, "no_lat_collide": 512, "strategic": 853}
 
+# states of the vehicles that contain their controllers
+CONTROLLERS = ["acc_controller", "lane_changer", "router"]
+
+# states of the vehicles that are only computed when they are first accessed
+# after an update, with the ids of vehicles by edge (see
+# Vehicles._update_lane_data). Leader data is only computed this way if it is
+# not provided by sumo (see "flow_leaders" in SumoParams).
+LANE_DATA = ["lane_headways", "lane_tailways", "lane_leaders",
+             "lane_followers"]
+LEADER_DATA = ["leader", "follower", "headway"]
+
+# maximum difference (in m) between the headways computed by flow and by sumo
+# for the leaders of a vehicle to be considered the same when they are
+# validated (see "validate_leaders" in SumoParams)
+LEADER_TOLERANCE = 1e-3
+
+# states of the vehicles that are stored in numpy arrays if requested (see
+# Vehicles.enable_arrays), with the TraCI variables of the states provided by
+# sumo
+SUMO_ARRAY_STATES = {"speed": tc.VAR_SPEED, "lane": tc.VAR_LANE_INDEX,
+                     "edge": tc.VAR_ROAD_ID, "position": tc.VAR_LANEPOSITION}
+ARRAY_STATES = ["absolute_position", "headway", "leader", "follower",
+                "length", "type"]
+
+# default values returned by Vehicles.get_array for vehicles that are not
+# found (the same as the defaults of the getters of these states)
+ARRAY_ERRORS = {"speed": -1001, "lane": -1001, "edge": "", "position": -1001,
+                "absolute_position": -1001, "headway": -1001, "leader": "",
+                "follower": "", "length": -1001, "type": None}
+
 
 class Vehicles:
 
@@ -25,11 +57,14 @@ class Vehicles:
         State information on the vehicles for a given time step can be set or
         retrieved from this class.
         """
-        self.__ids = []  # ids of all vehicles
-        self.__human_ids = []  # ids of human-driven vehicles
-        self.__controlled_ids = []  # ids of flow-controlled vehicles
-        self.__controlled_lc_ids = []  # ids of flow lc-controlled vehicles
-        self.__rl_ids = []  # ids of rl-controlled vehicles
+        self.__ids = _VehicleIds()  # ids of all vehicles
+        self.__human_ids = _VehicleIds()  # ids of human-driven vehicles
+        # ids of flow-controlled vehicles
+        self.__controlled_ids = _VehicleIds()
+        # ids of flow lc-controlled vehicles
+        self.__controlled_lc_ids = _VehicleIds()
+        # ids of rl-controlled vehicles, kept sorted
+        self.__rl_ids = _VehicleIds(sort=True)
         self.__observed_ids = []  # ids of the observed vehicles
 
         # vehicles: Key = Vehicle ID, Value = Dictionary describing the vehicle
@@ -52,14 +87,22 @@ class Vehicles:
         # contain the minGap attribute of each type of vehicle
         self.minGap = dict()
 
+        # number of vehicles whose leader computed by flow differed from the
+        # one of sumo (see "validate_leaders" in SumoParams)
+        self.num_leader_mismatches = 0
+
         # list of vehicle ids located in each edge in the network
         self._ids_by_edge = dict()
 
+        # Key = (edge, lane) pair
+        # Element = list of vehicle ids located in the lane, sorted by position
+        self._ids_by_lane = dict()
+
         # number of vehicles that entered the network for every time-step
-        self._num_departed = []
+        self._num_departed = _StepCounts()
 
         # number of vehicles to exit the network for every time-step
-        self._num_arrived = []
+        self._num_arrived = _StepCounts()
 
         # simulation step size
         self.sim_step = 0
@@ -67,6 +110,56 @@ class Vehicles:
         # initial state of the vehicles class, used for serialization purposes
         self.initial = []
 
+        # environment whose state the lane data (lane leaders, followers,
+        # headways, and tailways, and ids by edge) of the vehicles was not yet
+        # computed from.
+        # This data is only computed when it is read (see _update_lane_data).
+        self._lane_data_env = None
+
+        # lane data of the vehicles in the network, as computed by
+        # _multi_lane_headways: the lane data of the vehicle at every row of
+        # the arrays is stored in the first (number of lanes of its edge)
+        # columns of the arrays
+        self._lane_rows = dict()
+        self._lane_counts = np.zeros(0, dtype=np.int64)
+
+        # environment whose state the ordering of vehicles in their lanes was
+        # not yet computed from (see _get_lane_order), and the ordering
+        # computed from the last update
+        self._lane_order_env = None
+        self._lane_order = None
+
+        # ids of the vehicles sorted by edge, lane, and position at the last
+        # update, from which the ordering of the next update is repaired
+        self._lane_order_ids = []
+        self._lane_arrays = dict()
+
+        # edges and junctions of the network, their index, and their number
+        # of lanes (see _lane_layout), and the ordering of the vehicles in
+        # all lanes at the last update, which is reused (with the ids by edge
+        # and lane) if no vehicle changed lane or order
+        self._layout = None
+        self._lanes = None
+
+        # Key = (vehicle type, "acc_controller", "lane_changer", or "router")
+        # Element = controller used by all vehicles of the type, if it does
+        #           not store a state specific to its vehicle (see
+        #           _new_controller)
+        self._shared_controllers = dict()
+
+        # struct-of-arrays storage of the states of the vehicles, if requested
+        # (see enable_arrays)
+        self.arrays = None
+
+        # past states of the vehicles, if requested (see enable_history)
+        self.history = None
+
+        # (vehicle id, controller state name) of the controllers that store a
+        # state specific to their vehicle, and are shared with a snapshot of
+        # the vehicles class. These are copied when they are first requested
+        # (see snapshot)
+        self._snapshot_controllers = set()
+
     def add(self,
             veh_id,
             acceleration_controller=(SumoCarFollowingController, {}),
@@ -197,34 +290,41 @@ class Vehicles:
         # this is used to return the actual headways from the vehicles class
         self.minGap[veh_id] = type_params["minGap"]
 
+        # the vehicles of this type do not share the controllers of a previous
+        # type with the same name
+        for name in CONTROLLERS:
+            self._shared_controllers.pop((veh_id, name), None)
+
         for i in range(num_vehicles):
             v_id = veh_id + '_%d' % i
 
             # add the vehicle to the list of vehicle ids
-            self.__ids.append(v_id)
+            self.__ids.add(v_id)
 
             self.__vehicles[v_id] = dict()
+            if self.arrays is not None:
+                self.arrays.add(v_id)
 
             # specify the type
-            self.__vehicles[v_id]["type"] = veh_id
+            self._set(v_id, "type", veh_id)
 
             # specify the acceleration controller class
-            self.__vehicles[v_id]["acc_controller"] = \
-                acceleration_controller[0](
-                    v_id,
-                    sumo_cf_params=sumo_car_following_params,
-                    **acceleration_controller[1])
+            self.__vehicles[v_id]["acc_controller"] = self._new_controller(
+                veh_id, "acc_controller", acceleration_controller[0],
+                v_id,
+                sumo_cf_params=sumo_car_following_params,
+                **acceleration_controller[1])
 
             # specify the lane-changing controller class
-            self.__vehicles[v_id]["lane_changer"] = \
-                lane_change_controller[0](veh_id=v_id,
-                                          **lane_change_controller[1])
+            self.__vehicles[v_id]["lane_changer"] = self._new_controller(
+                veh_id, "lane_changer", lane_change_controller[0],
+                veh_id=v_id, **lane_change_controller[1])
 
             # specify the routing controller class
             if routing_controller is not None:
-                self.__vehicles[v_id]["router"] = \
-                    routing_controller[0](veh_id=v_id,
-                                          router_params=routing_controller[1])
+                self.__vehicles[v_id]["router"] = self._new_controller(
+                    veh_id, "router", routing_controller[0],
+                    veh_id=v_id, router_params=routing_controller[1])
             else:
                 self.__vehicles[v_id]["router"] = None
 
@@ -233,16 +333,16 @@ class Vehicles:
 
             # check if the vehicle is human-driven or autonomous
             if acceleration_controller[0] == RLController:
-                self.__rl_ids.append(v_id)
+                self.__rl_ids.add(v_id)
             else:
-                self.__human_ids.append(v_id)
+                self.__human_ids.add(v_id)
 
                 # check if the vehicle's lane-changing / acceleration actions
                 # are controlled by sumo or not.
                 if acceleration_controller[0] != SumoCarFollowingController:
-                    self.__controlled_ids.append(v_id)
+                    self.__controlled_ids.add(v_id)
                 if lane_change_controller[0] != SumoLaneChangeController:
-                    self.__controlled_lc_ids.append(v_id)
+                    self.__controlled_lc_ids.add(v_id)
 
             # specify the speed and lane change mode for the vehicle
             self.__vehicles[v_id]["speed_mode"] = speed_mode
@@ -257,6 +357,144 @@ class Vehicles:
         self.num_types += 1
         self.types.append((veh_id, type_params))
 
+    def enable_arrays(self):
+        """Stores the states of the vehicles in numpy arrays.
+
+        The speeds, lanes, edges, and positions of the vehicles, as well as
+        the states in ARRAY_STATES, are stored in a
+        flow.core.vehicle_arrays.VehicleArrays object (the "arrays" attribute
+        of this class) instead of the dictionaries of the vehicles, so that
+        they may be accessed with vectorized operations. The getters and
+        setters of these states are unchanged.
+        """
+        if self.arrays is not None:
+            return
+
+        self.arrays = VehicleArrays()
+        for veh_id in self.__ids:
+            self.arrays.add(veh_id)
+
+        # move the states that were already set to the arrays (after all
+        # vehicles have a slot, so that leaders and followers are found)
+        for veh_id in self.__ids:
+            for state_name in ARRAY_STATES:
+                if state_name in self.__vehicles[veh_id]:
+                    self.arrays.set(state_name, veh_id,
+                                    self.__vehicles[veh_id].pop(state_name))
+        if self.__sumo_obs is not None:
+            self.arrays.set_sumo_obs(self.__sumo_obs, SUMO_ARRAY_STATES)
+
+    def enable_history(self, num_steps, states=None):
+        """Retains the states of the vehicles during the last time steps.
+
+        The states are stored in a flow.core.vehicle_history.VehicleHistory
+        object (the "history" attribute of this class), indexed by the slots
+        of the vehicles, and are read with get_history. This also stores the
+        current states of the vehicles in arrays (see enable_arrays). The
+        history is cleared at the start of every rollout. If the history of
+        headways is retained, the headways of vehicles are computed at every
+        step, even if they are computed by flow (see _update_lane_data).
+
+        Parameters
+        ----------
+        num_steps: int
+            number of time steps that are retained, including the current
+            step
+        states: list<str>, optional
+            names of the states whose history is retained, among "speed",
+            "lane", "position", "absolute_position", "headway", and "length".
+            Defaults to the speeds, positions, headways, and lanes of vehicles
+        """
+        self.enable_arrays()
+        self.history = VehicleHistory(num_steps, states,
+                                      capacity=self.arrays.capacity)
+
+    def snapshot(self):
+        """Returns a copy of the vehicles class, to be restored with restore.
+
+        Unlike a deep copy, only the states that change as vehicles move are
+        copied: the ids of vehicles, the states of every vehicle, the
+        observations provided by sumo, and the arrays of states. The
+        parameters of the vehicle types are shared with the snapshot, as well
+        as the controllers of vehicles. Controllers that store a state
+        specific to their vehicle (see the per_vehicle_state attribute of the
+        controller classes) are copied when they are first requested after
+        the snapshot or a restore, so that the controllers of the snapshot
+        are never modified.
+
+        Returns
+        -------
+        Vehicles type
+            the snapshot. It should not be modified, other than by restoring
+            it
+        """
+        # compute the pending lane data, so that the snapshot does not hold a
+        # reference to the environment
+        self._update_lane_data()
+        self._get_lane_order()
+
+        snapshot = self._copy()
+        self._snapshot_controllers = set(snapshot._snapshot_controllers)
+        return snapshot
+
+    def restore(self, snapshot):
+        """Restores the state of the vehicles class saved by snapshot.
+
+        The snapshot is not modified, and may be restored again.
+
+        Parameters
+        ----------
+        snapshot: Vehicles type
+            a snapshot returned by the snapshot method
+        """
+        self.__dict__ = snapshot._copy().__dict__
+
+    def _copy(self):
+        """Returns a copy of the vehicles class in which the states that
+        change as vehicles move are copied (see snapshot)."""
+        vehicles = Vehicles.__new__(Vehicles)
+        vehicles.__dict__ = self.__dict__.copy()
+
+        vehicles.__ids = self.__ids.copy()
+        vehicles.__human_ids = self.__human_ids.copy()
+        vehicles.__controlled_ids = self.__controlled_ids.copy()
+        vehicles.__controlled_lc_ids = self.__controlled_lc_ids.copy()
+        vehicles.__rl_ids = self.__rl_ids.copy()
+        vehicles.__observed_ids = list(self.__observed_ids)
+
+        vehicles.__vehicles = collections.OrderedDict(
+            (veh_id, dict(state)) for veh_id, state in self.__vehicles.items())
+        if self.__sumo_obs is not None:
+            vehicles.__sumo_obs = {veh_id: dict(obs) for veh_id, obs
+                                   in self.__sumo_obs.items()}
+
+        vehicles.types = list(self.types)
+        vehicles.initial_speeds = list(self.initial_speeds)
+        vehicles.type_parameters = dict(self.type_parameters)
+        vehicles.minGap = dict(self.minGap)
+        vehicles.initial = list(self.initial)
+        vehicles._ids_by_edge = dict(self._ids_by_edge)
+        vehicles._ids_by_lane = dict(getattr(self, "_ids_by_lane", {}))
+        vehicles._lane_order = None
+        vehicles._num_departed = self._num_departed.copy()
+        vehicles._num_arrived = self._num_arrived.copy()
+        vehicles._lane_rows = dict(getattr(self, "_lane_rows", {}))
+        vehicles._shared_controllers = \
+            dict(getattr(self, "_shared_controllers", {}))
+        if self.arrays is not None:
+            vehicles.arrays = self.arrays.copy()
+        if getattr(self, "history", None) is not None:
+            vehicles.history = self.history.copy()
+
+        # controllers with a state specific to their vehicle are shared by
+        # both copies until they are requested
+        vehicles._snapshot_controllers = set(
+            (veh_id, name) for veh_id, state in self.__vehicles.items()
+            for name in CONTROLLERS if state.get(name) is not None
+            and getattr(state[name], "per_vehicle_state", True))
+
+        return vehicles
+
     def update(self, vehicle_obs, sim_obs, env):
         """Updates the vehicle class with data pertaining to the vehicles at
         the current time step.
@@ -278,6 +516,10 @@ class Vehicles:
         env: Environment type
             state of the environment at the current time step
         """
+        # lane data that was not accessed since the last update is discarded
+        self._lane_data_env = None
+        self._lane_order_env = None
+        self._lane_order = None
 
         # remove exiting vehicles from the vehicles class
         for veh_id in sim_obs[tc.VAR_ARRIVED_VEHICLES_IDS]:
@@ -290,7 +532,6 @@ class Vehicles:
 
         # add entering vehicles into the vehicles class
         for veh_id in sim_obs[tc.VAR_DEPARTED_VEHICLES_IDS]:
-            veh_type = env.traci_connection.vehicle.getTypeID(veh_id)
             if veh_id in self.get_ids():
                 # this occurs when a vehicle is actively being removed and
                 # placed again in the network to ensure a constant number of
@@ -299,7 +540,20 @@ class Vehicles:
                 # updated
                 pass
             else:
-                self._add_departed(veh_id, veh_type, env)
+                # the type and length of the vehicle are available without
+                # additional TraCI calls if a context subscription is used
+                obs = vehicle_obs.get(veh_id, {})
+                veh_type = obs.get(tc.VAR_TYPE, None)
+                if veh_type is None:
+                    veh_type = env.traci_connection.vehicle.getTypeID(veh_id)
+                self._add_departed(veh_id, veh_type, env,
+                                   length=obs.get(tc.VAR_LENGTH, None))
+
+                # the results of the new subscription are included in
+                # vehicle_obs by a traci connection, but not by libsumo
+                if veh_id not in vehicle_obs:
+                    vehicle_obs[veh_id] = env.traci_connection.vehicle.\
+                        getSubscriptionResults(veh_id)
 
         if env.time_counter == 0:
             # reset all necessary values
@@ -307,30 +561,20 @@ class Vehicles:
                 self.set_state(veh_id, "last_lc", -float("inf"))
             self._num_departed.clear()
             self._num_arrived.clear()
+            if getattr(self, "history", None) is not None:
+                self.history.clear()
             self.sim_step = env.sim_step
         else:
             # update the "last_lc" variable
             for veh_id in self.__rl_ids:
                 prev_lane = self.get_lane(veh_id)
-                if vehicle_obs[veh_id][tc.VAR_LANE_INDEX] != \
-                        prev_lane and veh_id in self.__rl_ids:
+                this_lane = vehicle_obs.get(veh_id, {}).get(
+                    tc.VAR_LANE_INDEX, prev_lane)
+                if this_lane != prev_lane:
                     self.set_state(veh_id, "last_lc", env.time_counter)
 
             # update the "absolute_position" variable
-            for veh_id in self.__ids:
-                prev_pos = env.get_x_by_id(veh_id)
-                this_edge = vehicle_obs.get(veh_id, {}).get(tc.VAR_ROAD_ID, "")
-                this_pos = vehicle_obs.get(veh_id, {}).get(
-                    tc.VAR_LANEPOSITION, -1001)
-
-                # in case the vehicle isn't in the network
-                if this_edge == "":
-                    self.set_absolute_position(veh_id, -1001)
-                else:
-                    change = env.scenario.get_x(this_edge, this_pos) - prev_pos
-                    new_abs_pos = (self.get_absolute_position(veh_id) +
-                                   change) % env.scenario.length
-                    self.set_absolute_position(veh_id, new_abs_pos)
+            self._update_absolute_positions(vehicle_obs, env)
 
             # updated the list of departed and arrived vehicles
             self._num_departed.append(
@@ -338,34 +582,93 @@ class Vehicles:
             self._num_arrived.append(
                 len(sim_obs[tc.VAR_ARRIVED_VEHICLES_IDS]))
 
-        # update the "headway", "leader", and "follower" variables
-        for veh_id in self.__ids:
-            headway = vehicle_obs.get(veh_id, {}).get(tc.VAR_LEADER, None)
-            # check for a collided vehicle or a vehicle with no leader
-            if headway is None:
-                self.__vehicles[veh_id]["leader"] = None
-                self.__vehicles[veh_id]["follower"] = None
-                self.__vehicles[veh_id]["headway"] = 1e+3
-            else:
-                vtype = self.get_state(veh_id, "type")
-                min_gap = self.minGap[vtype]
-                self.__vehicles[veh_id]["headway"] = headway[1] + min_gap
-                self.__vehicles[veh_id]["leader"] = headway[0]
-                try:
-                    self.__vehicles[headway[0]]["follower"] = veh_id
-                except KeyError:
-                    pass
+        # update the "headway", "leader", and "follower" variables (these are
+        # computed by _multi_lane_headways if no leader subscriptions exist)
+        if not _flow_leaders(env.sumo_params):
+            for veh_id in self.__ids:
+                headway = vehicle_obs.get(veh_id, {}).get(tc.VAR_LEADER, None)
+                # check for a collided vehicle or a vehicle with no leader
+                if headway is None:
+                    self._set(veh_id, "leader", None)
+                    self._set(veh_id, "follower", None)
+                    self._set(veh_id, "headway", 1e+3)
+                else:
+                    vtype = self.get_state(veh_id, "type")
+                    min_gap = self.minGap[vtype]
+                    self._set(veh_id, "headway", headway[1] + min_gap)
+                    self._set(veh_id, "leader", headway[0])
+                    try:
+                        self._set(headway[0], "follower", veh_id)
+                    except KeyError:
+                        pass
 
         # update the sumo observations variable
         self.__sumo_obs = vehicle_obs.copy()
+        if self.arrays is not None:
+            self.arrays.set_sumo_obs(vehicle_obs, SUMO_ARRAY_STATES)
+
+        # the lane leaders data for each vehicle is updated when it is first
+        # read, so that it is not computed for steps where it is not used
+        self._lane_data_env = env
+        self._lane_order_env = env
 
-        # update the lane leaders data for each vehicle
-        self._multi_lane_headways(env)
+        if env.sumo_params.validate_leaders and \
+                not env.sumo_params.context_subscription:
+            self._validate_leaders(vehicle_obs, env)
 
-        # make sure the rl vehicle list is still sorted
-        self.__rl_ids.sort()
+        # record the states of the current step in the history of the vehicles
+        if getattr(self, "history", None) is not None:
+            if "headway" in self.history.states:
+                self._update_lane_data(leaders=True, lane_data=False)
+            self.history.record(self.arrays)
 
-    def _add_departed(self, veh_id, veh_type, env):
+    def _update_absolute_positions(self, vehicle_obs, env):
+        """Updates the absolute positions of all vehicles from their change in
+        position since the last time step.
+
+        The positions of the vehicles at the last and current time steps
+        (see env.get_x_by_id) are computed at once, see
+        Scenario.get_x_array.
+
+        Parameters
+        ----------
+        vehicle_obs: dict
+            vehicle observations provided from sumo via subscriptions at the
+            current time step
+        env: Env type
+            state of the environment at the current time step
+        """
+        veh_ids = self.get_ids()
+        if len(veh_ids) == 0:
+            return
+
+        # positions at the last time step (0 for vehicles not in the network)
+        prev_edge = self.get_array("edge")
+        prev_pos = np.where(
+            prev_edge == "", 0.,
+            env.scenario.get_x_array(prev_edge, self.get_array("position")))
+
+        observations = [vehicle_obs.get(veh_id, {}) for veh_id in veh_ids]
+        this_edge = np.array([obs.get(tc.VAR_ROAD_ID, "")
+                              for obs in observations], dtype=object)
+        this_pos = env.scenario.get_x_array(
+            this_edge,
+            [obs.get(tc.VAR_LANEPOSITION, -1001) for obs in observations])
+
+        new_abs_pos = (self.get_array("absolute_position") +
+                       (this_pos - prev_pos)) % env.scenario.length
+
+        # in case the vehicle isn't in the network
+        new_abs_pos[this_edge == ""] = -1001
+
+        if self.arrays is not None:
+            self.arrays.absolute_position[
+                self.arrays.get_slots(veh_ids)] = new_abs_pos
+        else:
+            for veh_id, abs_pos in zip(veh_ids, new_abs_pos.tolist()):
+                self.__vehicles[veh_id]["absolute_position"] = abs_pos
+
+    def _add_departed(self, veh_id, veh_type, env, length=None):
         """Adds a vehicle that entered the network from an inflow or reset.
 
         Parameters
@@ -376,16 +679,20 @@ class Vehicles:
             type of vehicle, as specified to sumo
         env: Env type
             state of the environment at the current time step
+        length: float, optional
+            length of the vehicle. If not specified, it is requested from sumo
         """
         if veh_type not in self.type_parameters:
             raise KeyError("Entering vehicle is not a valid type.")
 
         self.num_vehicles += 1
-        self.__ids.append(veh_id)
+        self.__ids.add(veh_id)
         self.__vehicles[veh_id] = dict()
+        if self.arrays is not None:
+            self.arrays.add(veh_id)
 
         # specify the type
-        self.__vehicles[veh_id]["type"] = veh_type
+        self._set(veh_id, "type", veh_type)
 
         sumo_cf_params = \
             self.type_parameters[veh_type]["sumo_car_following_params"]
@@ -393,45 +700,46 @@ class Vehicles:
         # specify the acceleration controller class
         accel_controller = \
             self.type_parameters[veh_type]["acceleration_controller"]
-        self.__vehicles[veh_id]["acc_controller"] = \
-            accel_controller[0](veh_id,
-                                sumo_cf_params=sumo_cf_params,
-                                **accel_controller[1])
+        self.__vehicles[veh_id]["acc_controller"] = self._new_controller(
+            veh_type, "acc_controller", accel_controller[0],
+            veh_id,
+            sumo_cf_params=sumo_cf_params,
+            **accel_controller[1])
 
         # specify the lane-changing controller class
         lc_controller = \
             self.type_parameters[veh_type]["lane_change_controller"]
-        self.__vehicles[veh_id]["lane_changer"] = \
-            lc_controller[0](veh_id=veh_id, **lc_controller[1])
+        self.__vehicles[veh_id]["lane_changer"] = self._new_controller(
+            veh_type, "lane_changer", lc_controller[0],
+            veh_id=veh_id, **lc_controller[1])
 
         # specify the routing controller class
         rt_controller = self.type_parameters[veh_type]["routing_controller"]
         if rt_controller is not None:
-            self.__vehicles[veh_id]["router"] = \
-                rt_controller[0](veh_id=veh_id, router_params=rt_controller[1])
+            self.__vehicles[veh_id]["router"] = self._new_controller(
+                veh_type, "router", rt_controller[0],
+                veh_id=veh_id, router_params=rt_controller[1])
         else:
             self.__vehicles[veh_id]["router"] = None
 
         # add the vehicle's id to the list of vehicle ids
         if accel_controller[0] == RLController:
-            self.__rl_ids.append(veh_id)
+            self.__rl_ids.add(veh_id)
             self.num_rl_vehicles += 1
         else:
-            self.__human_ids.append(veh_id)
+            self.__human_ids.add(veh_id)
             if accel_controller[0] != SumoCarFollowingController:
-                self.__controlled_ids.append(veh_id)
+                self.__controlled_ids.add(veh_id)
             if lc_controller[0] != SumoLaneChangeController:
-                self.__controlled_lc_ids.append(veh_id)
+                self.__controlled_lc_ids.add(veh_id)
 
         # subscribe the new vehicle
-        env.traci_connection.vehicle.subscribe(
-            veh_id, [tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
-                     tc.VAR_ROAD_ID, tc.VAR_SPEED, tc.VAR_EDGES])
-        env.traci_connection.vehicle.subscribeLeader(veh_id, 2000)
+        env.subscribe_vehicle(veh_id)
 
         # some constant vehicle parameters to the vehicles class
-        self.set_length(
-            veh_id, env.traci_connection.vehicle.getLength(veh_id))
+        if length is None:
+            length = env.traci_connection.vehicle.getLength(veh_id)
+        self.set_length(veh_id, length)
 
         # set the absolute position of the vehicle
         self.set_absolute_position(veh_id, 0)
@@ -453,8 +761,65 @@ class Vehicles:
         self.__vehicles[veh_id]["lane_change_mode"] = lc_mode
         env.traci_connection.vehicle.setLaneChangeMode(veh_id, lc_mode)
 
-        # make sure that the order of rl_ids is kept sorted
-        self.__rl_ids.sort()
+    def _new_controller(self, veh_type, name, controller_class, *args,
+                        **kwargs):
+        """Returns a controller for a new vehicle of a type.
+
+        Controllers whose class declares that they do not store a state
+        specific to their vehicle (see the per_vehicle_state attribute of the
+        controller classes) are only constructed for the first vehicle of a
+        type, and this controller is used by all vehicles of the type. Its
+        veh_id attribute is set to the vehicle it is requested for (see
+        _get_controller). Other controllers are constructed for every
+        vehicle.
+
+        Parameters
+        ----------
+        veh_type: str
+            type of the vehicle
+        name: str
+            one of "acc_controller", "lane_changer", or "router"
+        controller_class: type
+            class of the controller
+        args, kwargs: any
+            arguments of the constructor of the controller. The name of the
+            vehicle is passed as the first positional argument or as the
+            veh_id keyword argument
+
+        Returns
+        -------
+        object
+            the controller of the vehicle
+        """
+        if getattr(controller_class, "per_vehicle_state", True):
+            return controller_class(*args, **kwargs)
+
+        if not hasattr(self, "_shared_controllers"):
+            self._shared_controllers = dict()
+        key = (veh_type, name)
+        if key not in self._shared_controllers:
+            self._shared_controllers[key] = controller_class(*args, **kwargs)
+        return self._shared_controllers[key]
+
+    def _get_controller(self, veh_id, name, error):
+        """Returns a controller of a vehicle (see snapshot).
+
+        Controllers used by all vehicles of a type (see _new_controller) are
+        returned with their veh_id set to the vehicle, and should be used
+        before the controller of another vehicle of the type is requested.
+        """
+        controller = self.__vehicles.get(veh_id, {}).get(name, error)
+        if not getattr(controller, "per_vehicle_state", True):
+            controller.veh_id = veh_id
+
+        # controllers shared with a snapshot are copied before they are used
+        snapshot_controllers = getattr(self, "_snapshot_controllers", ())
+        if (veh_id, name) in snapshot_controllers:
+            controller = copy.deepcopy(controller)
+            self.__vehicles[veh_id][name] = controller
+            snapshot_controllers.discard((veh_id, name))
+
+        return controller
 
     def remove(self, veh_id):
         """Removes a vehicle.
@@ -468,6 +833,14 @@ class Vehicles:
             unique identifier of th vehicle to be removed
         """
         del self.__vehicles[veh_id]
+        if getattr(self, "history", None) is not None:
+            self.history.clear_slot(self.arrays.slots[veh_id])
+        if self.arrays is not None:
+            self.arrays.remove(veh_id)
+        getattr(self, "_lane_rows", {}).pop(veh_id, None)
+        for name in CONTROLLERS:
+            getattr(self, "_snapshot_controllers", set()).discard(
+                (veh_id, name))
         self.__ids.remove(veh_id)
         self.num_vehicles -= 1
 
@@ -482,55 +855,71 @@ class Vehicles:
             self.__rl_ids.remove(veh_id)
             self.num_rl_vehicles -= 1
 
-        # make sure that the rl ids remain sorted
-        self.__rl_ids.sort()
-
     def test_set_speed(self, veh_id, speed):
         self.__sumo_obs[veh_id][tc.VAR_SPEED] = speed
+        if self.arrays is not None:
+            self.arrays.set("speed", veh_id, speed)
 
     def set_absolute_position(self, veh_id, absolute_position):
-        self.__vehicles[veh_id]["absolute_position"] = absolute_position
+        self._set(veh_id, "absolute_position", absolute_position)
 
     def test_set_position(self, veh_id, position):
         self.__sumo_obs[veh_id][tc.VAR_LANEPOSITION] = position
+        if self.arrays is not None:
+            self.arrays.set("position", veh_id, position)
 
     def test_set_edge(self, veh_id, edge):
         self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = edge
+        if self.arrays is not None:
+            self.arrays.set("edge", veh_id, edge)
 
     def test_set_lane(self, veh_id, lane):
         self.__sumo_obs[veh_id][tc.VAR_LANE_INDEX] = lane
+        if self.arrays is not None:
+            self.arrays.set("lane", veh_id, lane)
 
     def set_leader(self, veh_id, leader):
-        self.__vehicles[veh_id]["leader"] = leader
+        self._update_lane_data(leaders=True, lane_data=False)
+        self._set(veh_id, "leader", leader)
 
     def set_follower(self, veh_id, follower):
-        self.__vehicles[veh_id]["follower"] = follower
+        self._update_lane_data(leaders=True, lane_data=False)
+        self._set(veh_id, "follower", follower)
 
     def set_headway(self, veh_id, headway):
-        self.__vehicles[veh_id]["headway"] = headway
+        self._update_lane_data(leaders=True, lane_data=False)
+        self._set(veh_id, "headway", headway)
 
     def get_ids(self):
         """Returns the names of all vehicles currently in the network."""
-        return self.__ids
+        return self.__ids.as_list()
 
     def get_human_ids(self):
         """Returns the names of all non-rl vehicles currently in the
         network."""
-        return self.__human_ids
+        return self.__human_ids.as_list()
 
     def get_controlled_ids(self):
         """Returns the names of all flow acceleration-controlled vehicles
         currently in the network."""
-        return self.__controlled_ids
+        return self.__controlled_ids.as_list()
 
     def get_controlled_lc_ids(self):
         """Returns the names of all flow lane change-controlled vehicles
         currently in the network."""
-        return self.__controlled_lc_ids
+        return self.__controlled_lc_ids.as_list()
 
     def get_rl_ids(self):
         """Returns the names of all rl-controlled vehicles in the network."""
-        return self.__rl_ids
+        return self.__rl_ids.as_list()
+
+    def is_rl(self, veh_id):
+        """Returns whether a vehicle is an rl-controlled vehicle in the
+        network.
+
+        This is equivalent to veh_id in get_rl_ids(), but takes constant
+        time."""
+        return veh_id in self.__rl_ids
 
     def set_observed(self, veh_id):
         """Adds a vehicle to the list of observed vehicles."""
@@ -549,33 +938,159 @@ class Vehicles:
     def get_ids_by_edge(self, edges):
         """Returns the names of all vehicles in the specified edge. If no
         vehicles are currently in the edge, then returns an empty list."""
+        self._get_lane_order()
         if isinstance(edges, (list, np.ndarray)):
             return sum([self.get_ids_by_edge(edge) for edge in edges], [])
-        return self._ids_by_edge.get(edges, []) or []
+        return list(self._ids_by_edge.get(edges, []) or [])
+
+    def get_ids_by_lane(self, edge, lane):
+        """Returns the names of all vehicles in the specified lane of an edge,
+        sorted by position (from the back to the front of the lane). If no
+        vehicles are currently in the lane, then returns an empty list."""
+        self._get_lane_order()
+        return list(getattr(self, "_ids_by_lane", {}).get((edge, lane), []))
 
     def get_inflow_rate(self, time_span):
         """Returns the inflow rate (in veh/hr) of vehicles from the network for
         the last **time_span** seconds."""
         if len(self._num_departed) == 0:
             return 0
-        num_inflow = self._num_departed[-int(time_span / self.sim_step):]
-        return 3600 * sum(num_inflow) / (len(num_inflow) * self.sim_step)
+        num_inflow, num_steps = self._num_departed.sum_last(
+            int(time_span / self.sim_step))
+        return 3600 * num_inflow / (num_steps * self.sim_step)
 
     def get_outflow_rate(self, time_span):
         """Returns the outflow rate (in veh/hr) of vehicles from the network
         for the last **time_span** seconds."""
         if len(self._num_arrived) == 0:
             return 0
-        num_outflow = self._num_arrived[-int(time_span / self.sim_step):]
-        return 3600 * sum(num_outflow) / (len(num_outflow) * self.sim_step)
+        num_outflow, num_steps = self._num_arrived.sum_last(
+            int(time_span / self.sim_step))
+        return 3600 * num_outflow / (num_steps * self.sim_step)
 
     def get_num_arrived(self):
         """Returns the number of vehicles that arrived in the last
         time step"""
-        if len(self._num_arrived) > 0:
-            return self._num_arrived[-1]
+        return self._num_arrived.last
+
+    def get_array(self, state_name, veh_ids=None, slots=None, error=None):
+        """Returns a state of several vehicles as a numpy array.
+
+        If the states of vehicles are stored in arrays (see enable_arrays),
+        the states are gathered from these arrays in a single vectorized
+        operation. Otherwise, they are collected from the getter of the
+        state.
+
+        Parameters
+        ----------
+        state_name : str
+            name of the state, one of: "speed", "lane", "edge", "position",
+            "absolute_position", "headway", "leader", "follower", "length",
+            or "type"
+        veh_ids : list<str>, optional
+            vehicle ids. Defaults to all vehicles in the network
+        slots : numpy ndarray, optional
+            slots of the vehicles (see
+            flow.core.vehicle_arrays.VehicleArrays.get_slots), which may be
+            specified instead of veh_ids if the states of vehicles are stored
+            in arrays
+        error : any, optional
+            value that is returned for vehicles that are not found. Defaults
+            to the default of the getter of the state (e.g. -1001 for
+            speeds)
+
+        Returns
+        -------
+        numpy ndarray
+            states of the vehicles. Edges, leaders, followers, and types are
+            returned in an array of objects
+
+        Raises
+        ------
+        ValueError
+            if slots are specified, but the states of vehicles are not stored
+            in arrays
+        """
+        if error is None:
+            error = ARRAY_ERRORS[state_name]
+        if veh_ids is None and slots is None:
+            veh_ids = self.get_ids()
+        if state_name in LEADER_DATA:
+            self._update_lane_data(leaders=True, lane_data=False)
+
+        if self.arrays is not None:
+            if slots is None:
+                slots = self.arrays.get_slots(veh_ids, missing=-1)
+            return self.arrays.gather(state_name, slots, error)
+
+        if slots is not None:
+            raise ValueError("Vehicle slots are only available if the states "
+                             "of vehicles are stored in arrays.")
+
+        if state_name in SUMO_ARRAY_STATES:
+            var = SUMO_ARRAY_STATES[state_name]
+            values = [self.__sumo_obs.get(veh_id, {}).get(var, error)
+                      for veh_id in veh_ids]
         else:
-            return 0
+            values = [self.__vehicles.get(veh_id, {}).get(state_name, error)
+                      for veh_id in veh_ids]
+
+        if state_name in ["edge", "leader", "follower", "type"]:
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+            return array
+        return np.array(values)
+
+    def get_history(self, state_name, veh_ids=None, steps_ago=1, slots=None,
+                    error=None):
+        """Returns the states of several vehicles at past time steps.
+
+        The history of the states must be retained (see enable_history). The
+        states are gathered from the history in a single vectorized
+        operation.
+
+        Parameters
+        ----------
+        state_name : str
+            name of the state, one of the states whose history is retained
+        veh_ids : list<str>, optional
+            vehicle ids. Defaults to all vehicles in the network
+        steps_ago : int or list<int>, optional
+            number of time steps before the current step (0 for the current
+            step). Defaults to the previous step
+        slots : numpy ndarray, optional
+            slots of the vehicles (see
+            flow.core.vehicle_arrays.VehicleArrays.get_slots), which may be
+            specified instead of veh_ids
+        error : any, optional
+            value that is returned for vehicles that are not found, and steps
+            during which a vehicle was not in the network. Defaults to the
+            default of the getter of the state (e.g. -1001 for speeds)
+
+        Returns
+        -------
+        numpy ndarray
+            states of the vehicles. If steps_ago is a list, this is a
+            (number of vehicles, number of steps) array
+
+        Raises
+        ------
+        ValueError
+            if the history of the state is not retained, or the requested
+            steps are older than the retained steps
+        """
+        if getattr(self, "history", None) is None or \
+                state_name not in self.history.states:
+            raise ValueError("The history of {} is not retained.".format(
+                state_name))
+        if error is None:
+            error = ARRAY_ERRORS[state_name]
+        if slots is None:
+            if veh_ids is None:
+                veh_ids = self.get_ids()
+            slots = self.arrays.get_slots(veh_ids, missing=-1)
+
+        return self.history.gather(state_name, slots, steps_ago, error)
 
     def get_initial_speed(self, veh_id, error=-1001):
         """Returns the initial speed upon reset of the specified vehicle.
@@ -652,6 +1167,8 @@ class Vehicles:
         """
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_speed(vehID, error) for vehID in veh_id]
+        if self.arrays is not None:
+            return self.arrays.get("speed", veh_id, error)
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_SPEED, error)
 
     def get_absolute_position(self, veh_id, error=-1001):
@@ -672,7 +1189,7 @@ class Vehicles:
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_absolute_position(vehID, error)
                     for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("absolute_position", error)
+        return self._get(veh_id, "absolute_position", error)
 
     def get_position(self, veh_id, error=-1001):
         """Returns the position of the vehicle relative to its current edge.
@@ -691,6 +1208,8 @@ class Vehicles:
         """
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_position(vehID, error) for vehID in veh_id]
+        if self.arrays is not None:
+            return self.arrays.get("position", veh_id, error)
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_LANEPOSITION, error)
 
     def get_edge(self, veh_id, error=""):
@@ -711,6 +1230,8 @@ class Vehicles:
         """
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_edge(vehID, error) for vehID in veh_id]
+        if self.arrays is not None:
+            return self.arrays.get("edge", veh_id, error)
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_ROAD_ID, error)
 
     def get_lane(self, veh_id, error=-1001):
@@ -730,10 +1251,12 @@ class Vehicles:
         """
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane(vehID, error) for vehID in veh_id]
+        if self.arrays is not None:
+            return self.arrays.get("lane", veh_id, error)
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_LANE_INDEX, error)
 
     def set_length(self, veh_id, length):
-        self.__vehicles[veh_id]["length"] = length
+        self._set(veh_id, "length", length)
 
     def get_length(self, veh_id, error=-1001):
         """Returns the length of the specified vehicle.
@@ -752,7 +1275,7 @@ class Vehicles:
         """
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_length(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("length", error)
+        return self._get(veh_id, "length", error)
 
     def get_acc_controller(self, veh_id, error=None):
         """Returns the acceleration controller of the specified vehicle.
@@ -771,7 +1294,7 @@ class Vehicles:
         """
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_acc_controller(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("acc_controller", error)
+        return self._get_controller(veh_id, "acc_controller", error)
 
     def get_lane_changing_controller(self, veh_id, error=None):
         """Returns the lane changing controller of the specified vehicle.
@@ -791,7 +1314,7 @@ class Vehicles:
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_changing_controller(vehID, error)
                     for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("lane_changer", error)
+        return self._get_controller(veh_id, "lane_changer", error)
 
     def get_routing_controller(self, veh_id, error=None):
         """Returns the routing controller of the specified vehicle.
@@ -811,7 +1334,7 @@ class Vehicles:
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_routing_controller(vehID, error)
                     for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("router", error)
+        return self._get_controller(veh_id, "router", error)
 
     def get_route(self, veh_id, error=list()):
         """Returns the route of the specified vehicle.
@@ -827,11 +1350,62 @@ class Vehicles:
         -------
         list<str>
 
+        Notes
+        -----
+        The route of vehicles is only subscribed to from sumo if it is
+        declared as needed by the environment or by a controller (routers
+        declare it by default), see get_sumo_variables.
         """
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_route(vehID, error) for vehID in veh_id]
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_EDGES, error)
 
+    def get_sumo_variable(self, veh_id, variable, error=None):
+        """Returns a variable of the specified vehicle, as provided by sumo.
+
+        Only the variables subscribed to for all vehicles are available, i.e.
+        the ones needed by flow and the ones declared by the environment and
+        by the controllers of vehicles (see get_sumo_variables).
+
+        Parameters
+        ----------
+        veh_id : str or list<str>
+            vehicle id, or list of vehicle ids
+        variable : int
+            TraCI variable (e.g. traci.constants.VAR_COLOR)
+        error : any, optional
+            value that is returned if the vehicle or the variable is not found
+
+        Returns
+        -------
+        any
+        """
+        if isinstance(veh_id, (list, np.ndarray)):
+            return [self.get_sumo_variable(vehID, variable, error)
+                    for vehID in veh_id]
+        return self.__sumo_obs.get(veh_id, {}).get(variable, error)
+
+    def get_sumo_variables(self):
+        """Returns the variables of vehicles read from sumo by the controllers
+        of all vehicle types.
+
+        These are declared by the "vehicle_variables" attribute of the
+        controller classes.
+
+        Returns
+        -------
+        set<int>
+            TraCI variables (e.g. traci.constants.VAR_EDGES)
+        """
+        variables = set()
+        for params in self.type_parameters.values():
+            for name in ["acceleration_controller", "lane_change_controller",
+                         "routing_controller"]:
+                if params[name] is not None:
+                    variables.update(
+                        getattr(params[name][0], "vehicle_variables", []))
+        return variables
+
     def get_leader(self, veh_id, error=""):
         """Returns the leader of the specified vehicle.
 
@@ -847,9 +1421,10 @@ class Vehicles:
         str
 
         """
+        self._update_lane_data(leaders=True, lane_data=False)
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_leader(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("leader", error)
+        return self._get(veh_id, "leader", error)
 
     def get_follower(self, veh_id, error=""):
         """Returns the follower of the specified vehicle.
@@ -866,9 +1441,10 @@ class Vehicles:
         str
 
         """
+        self._update_lane_data(leaders=True, lane_data=False)
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_follower(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("follower", error)
+        return self._get(veh_id, "follower", error)
 
     def get_headway(self, veh_id, error=-1001):
         """Returns the headway of the specified vehicle(s).
@@ -885,12 +1461,14 @@ class Vehicles:
         float
 
         """
+        self._update_lane_data(leaders=True, lane_data=False)
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_headway(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("headway", error)
+        return self._get(veh_id, "headway", error)
 
     def set_lane_headways(self, veh_id, lane_headways):
-        self.__vehicles[veh_id]["lane_headways"] = lane_headways
+        self._update_lane_data()
+        self._set(veh_id, "lane_headways", lane_headways)
 
     def get_lane_headways(self, veh_id, error=list()):
         """Returns the headways between the specified vehicle and the vehicle
@@ -908,12 +1486,14 @@ class Vehicles:
         list<float>
 
         """
+        self._update_lane_data()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_headways(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("lane_headways", error)
+        return self._get(veh_id, "lane_headways", error)
 
     def set_lane_leaders(self, veh_id, lane_leaders):
-        self.__vehicles[veh_id]["lane_leaders"] = lane_leaders
+        self._update_lane_data()
+        self._set(veh_id, "lane_leaders", lane_leaders)
 
     def get_lane_leaders(self, veh_id, error=list()):
         """Returns the leaders for the specified vehicle in all lanes.
@@ -930,12 +1510,14 @@ class Vehicles:
         list<float>
 
         """
+        self._update_lane_data()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_leaders(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("lane_leaders", error)
+        return self._get(veh_id, "lane_leaders", error)
 
     def set_lane_tailways(self, veh_id, lane_tailways):
-        self.__vehicles[veh_id]["lane_tailways"] = lane_tailways
+        self._update_lane_data()
+        self._set(veh_id, "lane_tailways", lane_tailways)
 
     def get_lane_tailways(self, veh_id, error=list()):
         """Returns the tailways between the specified vehicle and the vehicle
@@ -953,12 +1535,14 @@ class Vehicles:
         list<float>
 
         """
+        self._update_lane_data()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_tailways(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("lane_tailways", error)
+        return self._get(veh_id, "lane_tailways", error)
 
     def set_lane_followers(self, veh_id, lane_followers):
-        self.__vehicles[veh_id]["lane_followers"] = lane_followers
+        self._update_lane_data()
+        self._set(veh_id, "lane_followers", lane_followers)
 
     def get_lane_followers(self, veh_id, error=list()):
         """Returns the followers for the specified vehicle in all lanes.
@@ -975,9 +1559,10 @@ class Vehicles:
         list<str>
 
         """
+        self._update_lane_data()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_followers(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("lane_followers", error)
+        return self._get(veh_id, "lane_followers", error)
 
     # TODO(ak): setting sumo observations?
     def set_state(self, veh_id, state_name, state):
@@ -986,241 +1571,806 @@ class Vehicles:
         Updates the state *state_name* of the vehicle with id *veh_id* with the
         value *state*.
         """
-        self.__vehicles[veh_id][state_name] = state
+        self._update_lane_data(leaders=state_name in LEADER_DATA,
+                               lane_data=state_name in LANE_DATA)
+        self._set(veh_id, state_name, state)
 
     # TODO(ak): getting sumo observations?
     def get_state(self, veh_id, state_name, error=None):
         """Generic get function. Returns the value of *state_name* of the
         specified vehicles at the current time step.
         """
+        self._update_lane_data(leaders=state_name in LEADER_DATA,
+                               lane_data=state_name in LANE_DATA)
         if isinstance(veh_id, list):
             return [self.get_state(vehID, state_name, error)
                     for vehID in veh_id]
+        return self._get(veh_id, state_name, error)
+
+    def _get(self, veh_id, state_name, error):
+        """Returns a state of a vehicle from the arrays if it is stored in
+        them, or from the dictionary of the vehicle otherwise."""
+        if self.arrays is not None and state_name in ARRAY_STATES:
+            return self.arrays.get(state_name, veh_id, error)
+        if state_name in LANE_DATA:
+            row = getattr(self, "_lane_rows", {}).get(veh_id)
+            if row is not None:
+                return self._lane_arrays[state_name][
+                    row, :self._lane_counts[row]].tolist()
         return self.__vehicles.get(veh_id, {}).get(state_name, error)
 
+    def _set(self, veh_id, state_name, state):
+        """Sets a state of a vehicle in the arrays if it is stored in them,
+        or in the dictionary of the vehicle otherwise."""
+        if self.arrays is not None and state_name in ARRAY_STATES:
+            self.arrays.set(state_name, veh_id, state)
+        else:
+            if state_name in LANE_DATA:
+                self._store_lane_data(veh_id)
+            self.__vehicles[veh_id][state_name] = state
+
+    def _store_lane_data(self, veh_id):
+        """Moves the lane data of a vehicle from the lane data arrays to the
+        dictionary of the vehicle, where it may be modified."""
+        row = getattr(self, "_lane_rows", {}).get(veh_id)
+        if row is None:
+            return
+        for state_name in LANE_DATA:
+            self.__vehicles[veh_id][state_name] = \
+                self._get(veh_id, state_name, None)
+        del self._lane_rows[veh_id]
+
+    def _update_lane_data(self, leaders=False, lane_data=True):
+        """Computes the lane data of the vehicles, if it was not computed since
+        the last update of the vehicles class.
+
+        Parameters
+        ----------
+        leaders: bool, optional
+            specifies whether the leaders, followers, and headways of vehicles
+            are accessed. These are only computed with the lane data if they
+            are not provided by sumo (see "flow_leaders" in SumoParams).
+        lane_data: bool, optional
+            specifies whether the lane data of vehicles is accessed
+        """
+        env = getattr(self, "_lane_data_env", None)
+        if env is None:
+            return
+        if not (lane_data or leaders and _flow_leaders(env.sumo_params)):
+            return
+
+        self._lane_data_env = None
+        with env.profiler.phase("multi_lane_headways"):
+            self._multi_lane_headways(env)
+
+    def __getstate__(self):
+        # compute the pending lane data, so that copies of the vehicles class
+        # do not hold a reference to the environment
+        self._update_lane_data()
+        self._get_lane_order()
+        state = self.__dict__.copy()
+        state["_lane_order"] = None
+        state["_layout"] = None
+        state["_lanes"] = None
+        return state
+
     def _multi_lane_headways(self, env):
         """Computes the lane leaders/followers/headways/tailways for all
-        vehicles in the network."""
-        edge_list = env.scenario.get_edge_list()
-        junction_list = env.scenario.get_junction_list()
-        tot_list = edge_list + junction_list
-        num_edges = (len(env.scenario.get_edge_list()) +
-                     len(env.scenario.get_junction_list()))
-
-        # maximum number of lanes in the network
-        max_lanes = max([env.scenario.num_lanes(edge_id)
-                         for edge_id in tot_list])
-
-        # Key = edge id
-        # Element = list, with the ith element containing tuples with the name
-        #           and position of all vehicles in lane i
-        edge_dict = dict.fromkeys(tot_list)
-
-        # add the vehicles to the edge_dict element
-        for veh_id in self.get_ids():
-            edge = self.get_edge(veh_id)
-            lane = self.get_lane(veh_id)
-            pos = self.get_position(veh_id)
-            if edge:
-                if edge_dict[edge] is None:
-                    edge_dict[edge] = [[] for _ in range(max_lanes)]
-                edge_dict[edge][lane].append((veh_id, pos))
-
-        # sort all lanes in each edge by position
-        for edge in tot_list:
-            if edge_dict[edge] is None:
-                del edge_dict[edge]
-            else:
-                for lane in range(max_lanes):
-                    edge_dict[edge][lane].sort(key=lambda x: x[1])
-
-        for veh_id in self.get_rl_ids():
-            # collect the lane leaders, followers, headways, and tailways for
-            # each vehicle
-            edge = self.get_edge(veh_id)
-            if edge:
-                headways, tailways, leaders, followers = \
-                    self._multi_lane_headways_util(veh_id, edge_dict,
-                                                   num_edges, env)
-
-                # add the above values to the vehicles class
-                self.set_lane_headways(veh_id, headways)
-                self.set_lane_tailways(veh_id, tailways)
-                self.set_lane_leaders(veh_id, leaders)
-                self.set_lane_followers(veh_id, followers)
-
-        self._ids_by_edge = dict().fromkeys(edge_list)
-
-        for edge_id in edge_dict:
-            edges = list(itertools.chain.from_iterable(edge_dict[edge_id]))
-            # check for edges with no vehicles
-            if len(edges) > 0:
-                edges, _ = zip(*edges)
-                self._ids_by_edge[edge_id] = list(edges)
+        vehicles in the network.
+
+        All vehicles are sorted by edge, lane, and position at once, and the
+        lane data of every vehicle is computed from this ordering with
+        vectorized operations. Vehicles with no lane leader (or follower) in
+        their edge look for one in the edges ahead of (or behind) it, see
+        _Lanes.
+        """
+        ids, edge, group, pos, length, lanes = self._get_lane_order(env)
+        max_lanes = lanes.max_lanes
+        num_lanes = lanes.num_lanes
+
+        # without leader subscriptions, the leaders, followers, and headways
+        # of all vehicles are computed from the sorted lanes
+        if _flow_leaders(env.sumo_params):
+            self._set_leaders(
+                *self._lane_order_leaders(ids, group, pos, length, lanes))
+
+        # queries: every vehicle (index in the sorted vehicles) and every lane
+        # of its edge
+        num_veh = len(ids)
+        veh = np.repeat(np.arange(num_veh), max_lanes)
+        q_lane = np.tile(np.arange(max_lanes), num_veh)
+        valid = q_lane < num_lanes[edge][veh]
+        veh, q_lane = veh[valid], q_lane[valid]
+        q_group = edge[veh] * max_lanes + q_lane
+        q_pos = pos[veh]
+
+        # index of the first vehicle of the lane whose position is not smaller
+        # than the position of the vehicle (see bisect.bisect_left)
+        start = lanes.start[q_group]
+        count = lanes.end[q_group] - start
+        index = _bisect_left(group, pos, q_group, q_pos) - start
+
+        headways = np.full((num_veh, max_lanes), 1000.)
+        tailways = np.full((num_veh, max_lanes), 1000.)
+        leaders = np.full((num_veh, max_lanes), "", dtype=object)
+        followers = np.full((num_veh, max_lanes), "", dtype=object)
+
+        # the lane leader is the first vehicle ahead of the vehicle in the
+        # lane, if it is not the last vehicle of the lane. Otherwise, the lane
+        # leader is in the edges ahead
+        found = index < count - 1
+        leader = start + index
+        leader = np.where(leader == veh, leader + 1, leader)
+        add_length = np.zeros(len(veh))
+        leader[~found], add_length[~found] = \
+            lanes.next_leaders(q_group[~found])
+
+        found = leader >= 0
+        leader, v, ln = leader[found], veh[found], q_lane[found]
+        leaders[v, ln] = ids[leader]
+        headways[v, ln] = pos[leader] - pos[v] + add_length[found] \
+            - length[leader]
+
+        # the lane follower is the last vehicle behind the vehicle in the
+        # lane, if the vehicle is not behind all vehicles of the lane.
+        # Otherwise, the lane follower is in the edges behind
+        found = index > 0
+        follower = start + index - 1
+        add_length = np.zeros(len(veh))
+        follower[~found], add_length[~found] = \
+            lanes.prev_followers(q_group[~found])
+
+        found = follower >= 0
+        follower, v, ln = follower[found], veh[found], q_lane[found]
+        followers[v, ln] = ids[follower]
+        tailways[v, ln] = pos[v] - pos[follower] + add_length[found] \
+            - length[v]
+
+        # vehicles that left the network keep their last lane data
+        for veh_id in set(getattr(self, "_lane_rows", {})) - set(ids):
+            self._store_lane_data(veh_id)
+
+        self._lane_rows = dict(zip(ids, range(num_veh)))
+        self._lane_counts = num_lanes[edge]
+        self._lane_arrays = {"lane_headways": headways,
+                             "lane_tailways": tailways,
+                             "lane_leaders": leaders,
+                             "lane_followers": followers}
+
+    def _get_lane_order(self, env=None):
+        """Returns the ordering of the vehicles in their lanes (see
+        _sort_lanes), and computes it if it was not computed since the last
+        update of the vehicles class.
+
+        The ids of the vehicles in every edge and lane (see get_ids_by_edge
+        and get_ids_by_lane) are updated with the ordering.
+
+        Parameters
+        ----------
+        env: Environment type, optional
+            environment the ordering is computed from if the vehicles class
+            was not updated (e.g. when the lane data is computed explicitly)
+
+        Returns
+        -------
+        tuple or None
+            the values returned by _sort_lanes, or None if the ordering is
+            not available
+        """
+        pending = getattr(self, "_lane_order_env", None)
+        if pending is not None:
+            env = pending
+        elif env is None or getattr(self, "_lane_order", None) is not None:
+            return getattr(self, "_lane_order", None)
+
+        self._lane_order_env = None
+        previous = getattr(self, "_lanes", None)
+        with env.profiler.phase("sort_lanes"):
+            self._lane_order = self._sort_lanes(env)
+        ids, edge, group, _, _, lanes = self._lane_order
+        tot_list, max_lanes = lanes.tot_list, lanes.max_lanes
+
+        # no vehicle entered, left, or changed lane or order since the last
+        # update
+        if lanes is previous:
+            return self._lane_order
+
+        self._ids_by_edge = dict().fromkeys(env.scenario.get_edge_list())
+        bounds = np.searchsorted(edge, np.arange(len(tot_list) + 1))
+        for i in np.unique(edge).tolist():
+            self._ids_by_edge[tot_list[i]] = \
+                ids[bounds[i]:bounds[i + 1]].tolist()
+
+        self._ids_by_lane = dict()
+        for i in np.unique(group).tolist():
+            self._ids_by_lane[tot_list[i // max_lanes], i % max_lanes] = \
+                ids[lanes.start[i]:lanes.end[i]].tolist()
+
+        return self._lane_order
+
+    def _sort_lanes(self, env):
+        """Sorts the vehicles in the network by edge, lane, and position.
+
+        The vehicles are sorted starting from their ordering at the last
+        update, in which vehicles only change order when they change lanes or
+        edges, or pass each other. Only the vehicles that changed order (and
+        the vehicles that entered the network) are moved to their place in
+        the ordering (see _repair_order), and the ordering of the vehicles in
+        all lanes is reused if no vehicle changed lane or order.
+
+        Returns
+        -------
+        numpy ndarray
+            ids of the vehicles in the network, sorted by edge (in the order of
+            the edges and then the junctions of the network), lane, and
+            position
+        numpy ndarray
+            edge index of the sorted vehicles
+        numpy ndarray
+            edge and lane (edge index * maximum number of lanes + lane) of the
+            sorted vehicles
+        numpy ndarray
+            positions of the sorted vehicles
+        numpy ndarray
+            lengths of the sorted vehicles
+        _Lanes type
+            ordering of the vehicles in all lanes
+        """
+        scenario = env.scenario
+        tot_list, edge_index, num_lanes, max_lanes = \
+            self._lane_layout(scenario)
+
+        # the vehicles in their order at the last update, followed by the
+        # vehicles that were added since then
+        veh_ids = self.get_ids()
+        current = set(veh_ids)
+        previous = [veh_id for veh_id in
+                    getattr(self, "_lane_order_ids", [])
+                    if veh_id in current]
+        if len(previous) < len(veh_ids):
+            known = set(previous)
+            previous += [veh_id for veh_id in veh_ids if veh_id not in known]
+
+        # collect the vehicles in the network
+        edges = self.get_array("edge", previous)
+        in_network = edges != ""
+        ids = np.array(previous, dtype=object)[in_network]
+        edge = np.array([edge_index[e] for e in edges[in_network]],
+                        dtype=np.int64)
+        lane = self.get_array("lane", previous)[in_network].astype(np.int64)
+        pos = self.get_array("position", previous)[in_network].astype(float)
+        length = self.get_array("length", previous)[in_network].astype(float)
+        group = edge * max_lanes + lane
+
+        # only vehicles that changed order are moved
+        order = _repair_order(group, pos)
+        if order is not None:
+            ids, edge, group, pos, length = ids[order], edge[order], \
+                group[order], pos[order], length[order]
+
+        # vehicles outside the network (e.g. teleporting vehicles) are kept at
+        # the end of the ordering
+        sorted_ids = ids.tolist()
+        self._lane_order_ids = sorted_ids + \
+            np.array(previous, dtype=object)[~in_network].tolist()
+
+        last = getattr(self, "_lanes", None)
+        if last is not None and last.scenario is scenario \
+                and np.array_equal(last.group, group) \
+                and last.ids == sorted_ids:
+            return ids, edge, group, pos, length, last
+
+        lanes = _Lanes(group, max_lanes, tot_list, edge_index, scenario)
+        lanes.num_lanes = num_lanes
+        lanes.ids = sorted_ids
+        self._lanes = lanes
+
+        return ids, edge, group, pos, length, lanes
+
+    def _lane_layout(self, scenario):
+        """Returns the edges and junctions of the network, with their index
+        and number of lanes.
+
+        These only depend on the network, and are only computed again when
+        the scenario changes.
+
+        Returns
+        -------
+        list<str>
+            edges and junctions of the network
+        dict
+            index of every edge/junction in this list
+        numpy ndarray
+            number of lanes of every edge/junction
+        int
+            maximum number of lanes in the network
+        """
+        layout = getattr(self, "_layout", None)
+        if layout is None or layout[0] is not scenario:
+            tot_list = scenario.get_edge_list() + scenario.get_junction_list()
+            edge_index = {edge: i for i, edge in enumerate(tot_list)}
+            num_lanes = np.array(
+                [scenario.num_lanes(edge) for edge in tot_list])
+            layout = (scenario, tot_list, edge_index, num_lanes,
+                      int(np.max(num_lanes)))
+            self._layout = layout
+        return layout[1:]
+
+    def _lane_order_leaders(self, ids, group, pos, length, lanes):
+        """Computes the leader and headway of every vehicle from the ordering
+        of vehicles in their current lane.
+
+        The leader of a vehicle is the vehicle directly in front of it in the
+        same lane. For the vehicle at the front of a lane, the edges ahead of
+        it are searched (see _Lanes.next_leaders).
+
+        Parameters
+        ----------
+        ids : numpy ndarray
+            ids of the vehicles in the network, sorted by edge, lane, and
+            position
+        group : numpy ndarray
+            edge and lane (edge index * maximum number of lanes + lane) of the
+            sorted vehicles
+        pos : numpy ndarray
+            positions of the sorted vehicles
+        length : numpy ndarray
+            lengths of the sorted vehicles
+        lanes : _Lanes type
+            ordering of the vehicles in all lanes
+
+        Returns
+        -------
+        list<str>
+            ids of the vehicles that have a leader
+        list<str>
+            ids of the leaders of these vehicles
+        list<float>
+            headways of these vehicles
+        """
+        num_veh = len(ids)
+        leader = np.arange(1, num_veh + 1)
+        add_length = np.zeros(num_veh)
+        front = np.ones(num_veh, dtype=bool)
+        front[:-1] = group[1:] != group[:-1]
+        leader[front], add_length[front] = lanes.next_leaders(group[front])
+
+        found = (leader >= 0) & (leader != np.arange(num_veh))
+        veh = np.where(found)[0]
+        leader = leader[found]
+        headway = pos[leader] - pos[veh] + add_length[found] - length[leader]
+
+        return ids[veh].tolist(), ids[leader].tolist(), headway.tolist()
+
+    def _set_leaders(self, veh_ids, leader_ids, headways):
+        """Sets the leaders, followers, and headways of all vehicles.
+
+        Vehicles that are not in veh_ids (e.g. teleporting vehicles or
+        vehicles with no leader) have no leader or follower, unless they are
+        the leader of another vehicle, and a headway of 1000 m.
+        """
+        for veh_id in self.__ids:
+            self._set(veh_id, "leader", None)
+            self._set(veh_id, "follower", None)
+            self._set(veh_id, "headway", 1e+3)
+
+        for veh_id, leader_id, headway in zip(veh_ids, leader_ids, headways):
+            self._set(veh_id, "leader", leader_id)
+            self._set(veh_id, "headway", headway)
+            self._set(leader_id, "follower", veh_id)
+
+    def _validate_leaders(self, vehicle_obs, env):
+        """Compares the leaders and headways computed by flow from the
+        ordering of vehicles in their lanes to the ones provided by sumo, and
+        logs the vehicles for which they differ.
+
+        Leaders that are further than the distance sumo searches for leaders
+        (2000 m) are ignored. The number of mismatches since the creation of
+        the vehicles class is stored in "num_leader_mismatches".
+
+        Parameters
+        ----------
+        vehicle_obs: dict
+            vehicle observations provided from sumo via subscriptions
+        env: Environment type
+            state of the environment at the current time step
+        """
+        ids, _, group, pos, length, lanes = self._get_lane_order(env)
+        veh_ids, leader_ids, headways = \
+            self._lane_order_leaders(ids, group, pos, length, lanes)
+        flow_leaders = dict(zip(veh_ids, zip(leader_ids, headways)))
+
+        mismatches = []
+        for veh_id in ids.tolist():
+            leader_id, headway = flow_leaders.get(veh_id, (None, 1e+3))
+            if headway > 2000:
+                leader_id, headway = None, 1e+3
+
+            sumo_leader = vehicle_obs.get(veh_id, {}).get(tc.VAR_LEADER, None)
+            if sumo_leader is None or sumo_leader[0] == "":
+                sumo_id, sumo_headway = None, 1e+3
             else:
-                self._ids_by_edge[edge_id] = []
+                vtype = self.get_state(veh_id, "type")
+                sumo_id = sumo_leader[0]
+                sumo_headway = sumo_leader[1] + self.minGap[vtype]
+
+            if leader_id != sumo_id or \
+                    abs(headway - sumo_headway) > LEADER_TOLERANCE:
+                mismatches.append("{}: {} at {:.2f} m (sumo: {} at {:.2f} m)"
+                                  .format(veh_id, leader_id, headway,
+                                          sumo_id, sumo_headway))
+
+        self.num_leader_mismatches = \
+            getattr(self, "num_leader_mismatches", 0) + len(mismatches)
+        if mismatches:
+            logging.warning("Leaders computed by flow differ from sumo at "
+                            "step %d:\n%s", env.time_counter,
+                            "\n".join(mismatches))
+
+
+def _flow_leaders(sumo_params):
+    """Returns whether the leaders, followers, and headways of vehicles are
+    computed by flow instead of being provided by sumo."""
+    return sumo_params.context_subscription or \
+        getattr(sumo_params, "flow_leaders", False)
+
+
+def _bisect_left(group, pos, q_group, q_pos):
+    """Returns the indices at which the queries (q_group, q_pos) would be
+    inserted in the sorted pairs (group, pos), to the left of equal pairs.
+
+    This is bisect.bisect_left for many queries at once.
+    """
+    num = len(group)
+    all_group = np.concatenate([group, q_group])
+    all_pos = np.concatenate([pos, q_pos])
+    # queries are sorted before the vehicles at the same position
+    is_vehicle = np.concatenate([np.ones(num, dtype=np.int64),
+                                 np.zeros(len(q_group), dtype=np.int64)])
+    merged = np.lexsort((is_vehicle, all_pos, all_group))
+
+    # number of vehicles sorted before every element
+    num_before = np.cumsum(is_vehicle[merged]) - is_vehicle[merged]
+
+    index = np.empty(len(q_group), dtype=np.int64)
+    is_query = merged >= num
+    index[merged[is_query] - num] = num_before[is_query]
+    return index
+
+
+def _repair_order(group, pos, max_moved=0.25):
+    """Returns the permutation that sorts the pairs (group, pos), when they
+    are nearly sorted, or None if they are already sorted.
+
+    The pairs that are out of order with their neighbors are removed until
+    the remaining pairs are sorted, and are then inserted back in their place
+    with a binary search, so that the cost of the repair grows with the
+    number of pairs that moved. The permutation is the one of a stable sort
+    (see np.lexsort), and all pairs are sorted again if more than max_moved
+    of them are out of order.
+    """
+    num = len(group)
+    kept = np.arange(num)
+    while True:
+        g, p = group[kept], pos[kept]
+        descent = (g[1:] < g[:-1]) | ((g[1:] == g[:-1]) & (p[1:] < p[:-1]))
+        if not descent.any():
+            break
+        out = np.zeros(len(kept), dtype=bool)
+        out[:-1] |= descent
+        out[1:] |= descent
+        kept = kept[~out]
+        if len(kept) < num * (1 - max_moved):
+            return np.lexsort((pos, group))
+
+    if len(kept) == num:
+        return None
+
+    # the moved pairs, sorted by group, position, and previous index
+    moved = np.setdiff1d(np.arange(num), kept)
+    moved = moved[np.lexsort((pos[moved], group[moved]))]
+
+    # index of every moved pair in the kept pairs, after the pairs that are
+    # smaller or equal with a smaller previous index
+    kept_group, kept_pos = group[kept], pos[kept]
+    lo = np.searchsorted(kept_group, group[moved], "left")
+    hi = np.searchsorted(kept_group, group[moved], "right")
+    where = np.empty(len(moved), dtype=np.int64)
+    for i, m in enumerate(moved.tolist()):
+        lane_pos = kept_pos[lo[i]:hi[i]]
+        start = lo[i] + np.searchsorted(lane_pos, pos[m], "left")
+        end = lo[i] + np.searchsorted(lane_pos, pos[m], "right")
+        where[i] = start + np.searchsorted(kept[start:end], m)
+
+    return np.insert(kept, where, moved)
+
+
+class _Lanes:
+
+    def __init__(self, group, max_lanes, tot_list, edge_index, scenario):
+        """Ordering of the vehicles in all lanes of the network.
+
+        Looks for the leaders (or followers) of the vehicles at the front (or
+        back) of a lane in the edges/junctions ahead of (or behind) it. These
+        searches are performed once per lane.
+
+        Attributes
+        ----------
+        group : numpy ndarray
+            edge and lane (edge index * max_lanes + lane) of all vehicles,
+            sorted by edge, lane, and position
+        max_lanes : int
+            maximum number of lanes in the network
+        tot_list : list<str>
+            edges and junctions of the network
+        edge_index : dict
+            index of every edge/junction in tot_list
+        scenario : flow.scenarios.Scenario type
+            the network
+        """
+        self.group = group
+        self.max_lanes = max_lanes
+        self.tot_list = tot_list
+        self.edge_index = edge_index
+        self.scenario = scenario
 
-    def _multi_lane_headways_util(self, veh_id, edge_dict, num_edges, env):
-        """Utility function for _multi_lane_headways()
+        # index of the first vehicle of every lane, and index after the last
+        # vehicle of every lane
+        num_groups = len(tot_list) * max_lanes
+        self.start = np.searchsorted(group, np.arange(num_groups), "left")
+        self.end = np.searchsorted(group, np.arange(num_groups), "right")
 
-        Computes the lane headways, tailways, leaders, and followers for the
-        specified vehicle.
+    def next_leaders(self, groups):
+        """Returns the first vehicles in the edges ahead of lanes.
+
+        The edges/junctions ahead of every lane are followed (through the
+        first of the next edges of every edge) until a vehicle is found.
 
         Parameters
         ----------
-        veh_id : str
-            name of the vehicle
-        edge_dict : dict < list<tuple> >
-            Key = Edge name
-                Index = lane index
-                Element = sorted list of (vehicle id, position)
+        groups : numpy ndarray
+            edge and lane of the lanes
 
         Returns
         -------
-        headway : list<float>
-            Index = lane index
-            Element = headway at this lane
-        tailway : list<float>
-            Index = lane index
-            Element = tailway at this lane
-        leader : list<str>
-            Index = lane index
-            Element = leader at this lane
-        follower : list<str>
-            Index = lane index
-            Element = follower at this lane
+        numpy ndarray
+            index of the sorted vehicle, or -1 if no vehicle is found
+        numpy ndarray
+            distance between the start of the lanes and the start of the
+            edges of the vehicles
         """
-        this_pos = self.get_position(veh_id)
-        this_edge = self.get_edge(veh_id)
-        num_lanes = env.scenario.num_lanes(this_edge)
-
-        # set default values for all output values
-        headway = [1000] * num_lanes
-        tailway = [1000] * num_lanes
-        leader = [""] * num_lanes
-        follower = [""] * num_lanes
-
-        for lane in range(num_lanes):
-            # check the vehicle's current  edge for lane leaders and followers
-            if len(edge_dict[this_edge][lane]) > 0:
-                ids, positions = zip(*edge_dict[this_edge][lane])
-                ids = list(ids)
-                positions = list(positions)
-                index = bisect_left(positions, this_pos)
-
-                # if you are at the end or the front of the edge, the lane
-                # leader is in the edges in front of you
-                if index < len(positions) - 1:
-                    # check if the index does not correspond to the current
-                    # vehicle
-                    if ids[index] == veh_id:
-                        leader[lane] = ids[index + 1]
-                        headway[lane] = (positions[index + 1] - this_pos -
-                                         self.get_length(leader[lane]))
-                    else:
-                        leader[lane] = ids[index]
-                        headway[lane] = positions[index] - this_pos \
-                            - self.get_length(leader[lane])
-
-                # you are in the back of the queue, the lane follower is in the
-                # edges behind you
-                if index > 0:
-                    follower[lane] = ids[index - 1]
-                    tailway[lane] = this_pos - positions[index - 1] \
-                        - self.get_length(veh_id)
-
-            # if lane leader not found, check next edges
-            if leader[lane] == "":
-                headway[lane], leader[lane] = self._next_edge_leaders(
-                    veh_id, edge_dict, lane, num_edges, env)
-
-            # if lane follower not found, check previous edges
-            if follower[lane] == "":
-                tailway[lane], follower[lane] = self._prev_edge_followers(
-                    veh_id, edge_dict, lane, num_edges, env)
-
-        return headway, tailway, leader, follower
-
-    def _next_edge_leaders(self, veh_id, edge_dict, lane, num_edges, env):
-        """Looks to the edges/junctions in front of the vehicle's current edge
-        for potential leaders. This is currently done by only looking one
-        edge/junction backwards.
+        unique, inverse = np.unique(groups, return_inverse=True)
+        leader = np.full(len(unique), -1)
+        add_length = np.zeros(len(unique))
+
+        for i, group in enumerate(unique.tolist()):
+            edge = self.tot_list[group // self.max_lanes]
+            lane = group % self.max_lanes
+
+            for _ in range(len(self.tot_list)):
+                # break if there are no edge/lane pairs ahead of this one
+                if len(self.scenario.next_edge(edge, lane)) == 0:
+                    break
+
+                add_length[i] += self.scenario.edge_length(edge)
+                edge, lane = self.scenario.next_edge(edge, lane)[0]
+
+                # stop if a lane leader is found
+                group = self.edge_index[edge] * self.max_lanes + lane
+                if self.end[group] > self.start[group]:
+                    leader[i] = self.start[group]
+                    break
+
+        return leader[inverse], add_length[inverse]
+
+    def prev_followers(self, groups):
+        """Returns the last vehicles in the edges behind lanes.
+
+        The edges/junctions behind every lane are followed (through the first
+        of the previous edges of every edge) until a vehicle is found.
+
+        Parameters
+        ----------
+        groups : numpy ndarray
+            edge and lane of the lanes
 
         Returns
         -------
-        headway : float
-            lane headway for the specified lane
-        leader : str
-            lane leader for the specified lane
+        numpy ndarray
+            index of the sorted vehicle, or -1 if no vehicle is found
+        numpy ndarray
+            distance between the start of the edges of the vehicles and the
+            start of the lanes
         """
-        pos = self.get_position(veh_id)
-        edge = self.get_edge(veh_id)
+        unique, inverse = np.unique(groups, return_inverse=True)
+        follower = np.full(len(unique), -1)
+        add_length = np.zeros(len(unique))
 
-        headway = 1000  # env.scenario.length
-        leader = ""
-        add_length = 0  # length increment in headway
+        for i, group in enumerate(unique.tolist()):
+            edge = self.tot_list[group // self.max_lanes]
+            lane = group % self.max_lanes
 
-        for _ in range(num_edges):
-            # break if there are no edge/lane pairs behind the current one
-            if len(env.scenario.next_edge(edge, lane)) == 0:
-                break
+            for _ in range(len(self.tot_list)):
+                # break if there are no edge/lane pairs behind this one
+                if len(self.scenario.prev_edge(edge, lane)) == 0:
+                    break
 
-            add_length += env.scenario.edge_length(edge)
-            edge, lane = env.scenario.next_edge(edge, lane)[0]
+                edge, lane = self.scenario.prev_edge(edge, lane)[0]
+                add_length[i] += self.scenario.edge_length(edge)
 
-            try:
-                if len(edge_dict[edge][lane]) > 0:
-                    leader = edge_dict[edge][lane][0][0]
-                    headway = edge_dict[edge][lane][0][1] - pos + add_length \
-                        - self.get_length(leader)
-            except KeyError:
-                # current edge has no vehicles, so move on
-                continue
+                # stop if a lane follower is found
+                group = self.edge_index[edge] * self.max_lanes + lane
+                if self.end[group] > self.start[group]:
+                    follower[i] = self.end[group] - 1
+                    break
 
-            # stop if a lane follower is found
-            if leader != "":
-                break
+        return follower[inverse], add_length[inverse]
 
-        return headway, leader
 
-    def _prev_edge_followers(self, veh_id, edge_dict, lane, num_edges, env):
-        """Looks to the edges/junctions behind the vehicle's current edge for
-        potential followers. This is currently done by only looking one
-        edge/junction backwards.
+class _VehicleIds:
+
+    def __init__(self, sort=False):
+        """Ids of a class of vehicles (e.g. all rl vehicles).
+
+        Membership tests take constant time, and additions and removals take
+        constant (amortized) time, or logarithmic time if the ids are kept
+        sorted, unlike with lists of ids. The ids are returned as a list by
+        as_list.
+
+        Attributes
+        ----------
+        sort: bool, optional
+            specifies whether the ids are kept sorted. Otherwise, they are
+            kept in the order they were added in
+        """
+        self.sort = sort
+        self._ids = set()
+        self._list = []
+
+        # specifies whether _list contains removed ids, which are only
+        # filtered out when the list is requested
+        self._stale = False
+
+    def add(self, veh_id):
+        """Adds an id, if it is not already included."""
+        if veh_id in self._ids:
+            return
+        if self.sort:
+            bisect.insort(self._list, veh_id)
+        else:
+            # removed ids are filtered out first, in case this id was one
+            self.as_list().append(veh_id)
+        self._ids.add(veh_id)
+
+    def remove(self, veh_id):
+        """Removes an id.
+
+        Raises
+        ------
+        KeyError
+            if the id is not included
+        """
+        self._ids.remove(veh_id)
+        if self.sort:
+            del self._list[bisect.bisect_left(self._list, veh_id)]
+        else:
+            self._stale = True
+
+    def as_list(self):
+        """Returns the list of ids.
+
+        Reordering this list (e.g. shuffling it) changes the order of the
+        ids, but ids should only be added or removed with add and remove.
+        """
+        if self._stale:
+            self._list = [veh_id for veh_id in self._list
+                          if veh_id in self._ids]
+            self._stale = False
+        return self._list
+
+    def copy(self):
+        """Returns a copy of the ids."""
+        ids = copy.copy(self)
+        ids._ids = set(self._ids)
+        ids._list = list(self._list)
+        return ids
+
+    def __contains__(self, veh_id):
+        return veh_id in self._ids
+
+    def __iter__(self):
+        return iter(self.as_list())
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class _StepCounts:
+
+    def __init__(self, capacity=1000):
+        """Numbers of vehicles (e.g. that arrived) at every time step.
+
+        The counts are stored as cumulative sums in a ring buffer, so that
+        the sum of the counts of the last steps is computed in constant time,
+        and the memory used does not grow with the number of steps. The
+        buffer is resized to the longest window of steps requested from
+        sum_last; older steps are discarded.
+
+        Attributes
+        ----------
+        capacity: int, optional
+            initial number of steps that are retained
+        """
+        # cumulative sum of the counts up to every retained step, with the
+        # sum up to step i stored at index i % len(self._cumsum)
+        self._cumsum = [0] * (capacity + 1)
+
+        # first step whose cumulative sum was not discarded before the
+        # buffer was last resized
+        self._first = 0
+
+        self.num_steps = 0
+        self.total = 0
+        self.last = 0
+
+    def append(self, count):
+        """Adds the count of a new time step."""
+        self.num_steps += 1
+        self.total += count
+        self.last = count
+        self._cumsum[self.num_steps % len(self._cumsum)] = self.total
+
+    def clear(self):
+        """Removes the counts of all time steps."""
+        self._cumsum = [0] * len(self._cumsum)
+        self._first = 0
+        self.num_steps = 0
+        self.total = 0
+        self.last = 0
+
+    def sum_last(self, num_steps):
+        """Returns the sum of the counts of the last time steps.
+
+        Parameters
+        ----------
+        num_steps: int
+            number of time steps. If this is not positive, all retained steps
+            are included
 
         Returns
         -------
-        tailway : float
-            lane tailway for the specified lane
-        follower : str
-            lane follower for the specified lane
+        int
+            sum of the counts
+        int
+            number of time steps included, which is smaller than num_steps if
+            fewer steps were retained
         """
-        pos = self.get_position(veh_id)
-        edge = self.get_edge(veh_id)
-
-        tailway = 1000  # env.scenario.length
-        follower = ""
-        add_length = 0  # length increment in headway
-
-        for _ in range(num_edges):
-            # break if there are no edge/lane pairs behind the current one
-            if len(env.scenario.prev_edge(edge, lane)) == 0:
-                break
-
-            edge, lane = env.scenario.prev_edge(edge, lane)[0]
-            add_length += env.scenario.edge_length(edge)
-
-            try:
-                if len(edge_dict[edge][lane]) > 0:
-                    tailway = pos - edge_dict[edge][lane][-1][1] + add_length \
-                              - self.get_length(veh_id)
-                    follower = edge_dict[edge][lane][-1][0]
-            except KeyError:
-                # current edge has no vehicles, so move on
-                continue
-
-            # stop if a lane follower is found
-            if follower != "":
-                break
-
-        return tailway, follower
+        if num_steps <= 0:
+            num_steps = self.num_steps
+        self._reserve(num_steps)
+        first = max(self._first, self.num_steps - len(self._cumsum) + 1)
+        num_steps = min(num_steps, self.num_steps - first)
+        start = (self.num_steps - num_steps) % len(self._cumsum)
+        return self.total - self._cumsum[start], num_steps
+
+    def copy(self):
+        """Returns a copy of the counts."""
+        counts = copy.copy(self)
+        counts._cumsum = list(self._cumsum)
+        return counts
+
+    def _reserve(self, num_steps):
+        """Resizes the buffer so that the last num_steps steps are retained
+        from now on."""
+        size = len(self._cumsum)
+        if num_steps < size:
+            return
+
+        self._first = max(self._first, self.num_steps - size + 1)
+        cumsum = [0] * (num_steps + 1)
+        for step in range(self._first, self.num_steps + 1):
+            cumsum[step % len(cumsum)] = self._cumsum[step % size]
+        self._cumsum = cumsum
+
+    def __len__(self):
+        return self.num_steps
@@ -8,8 +8,9 @@ from flow.envs.loop.loop_merges import TwoLoopsMergeEnv
 from flow.envs.loop.wave_attenuation import WaveAttenuationEnv, \
     WaveAttenuationPOEnv
 from flow.envs.merge import WaveAttenuationMergePOEnv
+from flow.envs.vec_env import FlowVecEnv
 
 __all__ = ["Env", "AccelEnv", "LaneChangeAccelEnv", "LaneChangeAccelPOEnv",
            "GreenWaveTestEnv", "GreenWaveTestEnv", "WaveAttenuationMergePOEnv",
            "TwoLoopsMergeEnv", "WaveAttenuationEnv", "WaveAttenuationPOEnv",
-           "TrafficLightGridEnv", "PO_TrafficLightGridEnv"]
+           "TrafficLightGridEnv", "PO_TrafficLightGridEnv", "FlowVecEnv"]
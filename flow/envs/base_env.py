@@ -1,10 +1,13 @@
+import collections
 import logging
 import os
 import signal
 import subprocess
+import tempfile
 from copy import deepcopy
 import time
 import traceback
+import warnings
 import numpy as np
 import random
 
@@ -21,6 +24,12 @@ try:
 except ImportError:
     Serializable = object
 
+try:
+    # Import libsumo if installed (used if requested in SumoParams)
+    import libsumo
+except ImportError:
+    libsumo = None
+
 try:
     # Load user config if exists, else load default config
     import flow.core.config as config
@@ -28,13 +37,53 @@ except ImportError:
     import flow.config_default as config
 
 from flow.core.util import ensure_dir
+from flow.core.traci_buffer import TraCICommandBuffer
+from flow.core.sumo_pool import get_pool
+from flow.core.profiler import StepProfiler
+from flow.core.traci_counter import TraCICallCounter, TraCICallStats
+from flow.controllers.base_controller import BaseController
 
 # Number of retries on restarting SUMO before giving up
 RETRIES_ON_ERROR = 10
 
+# Maximum time (in seconds) to wait for a started sumo instance to accept a
+# TraCI connection (user configs created before this option existed fall back
+# to 60 seconds)
+SUMO_STARTUP_TIMEOUT = getattr(config, "SUMO_STARTUP_TIMEOUT", 60.0)
+
+# SUMO_SLEEP, the fixed delay between starting sumo and connecting to it in
+# older user configs, is no longer used since the connection is made as soon
+# as sumo accepts it. A larger value still extends the startup timeout
+if hasattr(config, "SUMO_SLEEP"):
+    warnings.warn("SUMO_SLEEP in the flow config is deprecated and no longer "
+                  "delays the connection to sumo, use SUMO_STARTUP_TIMEOUT "
+                  "to bound the time to wait for sumo instead.")
+    SUMO_STARTUP_TIMEOUT = max(SUMO_STARTUP_TIMEOUT, config.SUMO_SLEEP)
+
+# Initial and maximum delays (in seconds) between two connection attempts
+CONNECT_INITIAL_WAIT = 0.01
+CONNECT_MAX_WAIT = 0.5
+
+# vehicle variables needed by flow, subscribed to from sumo for all vehicles
+# in the network (other variables are only subscribed to if the environment or
+# the controllers of vehicles declare them, see Env.vehicle_variables)
+VEHICLE_SUBSCRIPTIONS = [tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
+                         tc.VAR_ROAD_ID, tc.VAR_SPEED]
+
+# additional variables subscribed to when using a context subscription, so
+# that departing vehicles do not require any additional TraCI calls
+CONTEXT_SUBSCRIPTIONS = [tc.VAR_TYPE, tc.VAR_LENGTH]
+
 
 class Env(gym.Env, Serializable):
 
+    # variables of vehicles (e.g. traci.constants.VAR_COLOR) read from sumo by
+    # the environment through Vehicles.get_sumo_variable. These are subscribed
+    # to for all vehicles, with the variables needed by flow and the ones
+    # declared by the controllers of vehicles (see
+    # Vehicles.get_sumo_variables)
+    vehicle_variables = []
+
     def __init__(self, env_params, sumo_params, scenario):
         """Base environment class.
 
@@ -71,8 +120,6 @@ class Env(gym.Env, Serializable):
         self.env_params = env_params
         self.scenario = scenario
         self.sumo_params = sumo_params
-        time_stamp = ''.join(str(time.time()).split('.'))
-        time.sleep(8.0 * int(time_stamp[-6:]) / 1e6)
         self.sumo_params.port = sumolib.miscutils.getFreeSocketPort()
         self.vehicles = scenario.vehicles
         self.traffic_lights = scenario.traffic_lights
@@ -109,8 +156,24 @@ class Env(gym.Env, Serializable):
         # store the initial vehicle ids
         self.initial_ids = deepcopy(self.vehicles.get_ids())
 
+        # store the states of vehicles in numpy arrays, if requested (the
+        # attribute is missing from old pkl files)
+        if getattr(self.env_params, "vehicle_arrays", False):
+            self.vehicles.enable_arrays()
+
+        # retain the past states of vehicles, if requested
+        if getattr(self.env_params, "vehicle_history", 0) > 0:
+            self.vehicles.enable_history(self.env_params.vehicle_history,
+                                         self.env_params.history_states)
+
         # store the initial state of the vehicles class (for restarting sumo)
-        self.initial_vehicles = deepcopy(self.vehicles)
+        self.initial_vehicles = self.vehicles.snapshot()
+
+        # variables subscribed to for all vehicles in the network
+        variables = set(self.vehicle_variables) | \
+            self.vehicles.get_sumo_variables()
+        self.vehicle_subscriptions = VEHICLE_SUBSCRIPTIONS + sorted(
+            variables - set(VEHICLE_SUBSCRIPTIONS))
 
         # colors used to distinguish between types of vehicles in the network
         self.colors = {}
@@ -118,9 +181,53 @@ class Env(gym.Env, Serializable):
         # contains the subprocess.Popen instance used to start traci
         self.sumo_proc = None
 
+        # time (in seconds) a started sumo instance took to accept a TraCI
+        # connection (None until an instance is started as a subprocess)
+        self.sumo_startup_time = None
+
+        # junction used as the center of the context subscription (if one is
+        # used, see SumoParams)
+        self._context_id = None
+
+        # specifies whether the next sumo instance uses a random seed issued
+        # at a reset (instead of the seed specified in sumo_params)
+        self._random_seed = False
+
         # TODO(ak): temporary fix to support old pkl files
         if not hasattr(self.env_params, "evaluate"):
             self.env_params.evaluate = False
+        if not hasattr(self.env_params, "profile"):
+            self.env_params.profile = False
+        if not hasattr(self.env_params, "snapshot_reset"):
+            self.env_params.snapshot_reset = None
+
+        if self.env_params.snapshot_reset not in [None, "initial", "warmup"]:
+            raise ValueError("snapshot_reset must be one of None, 'initial', "
+                             "or 'warmup'")
+
+        # measures the time spent in the different phases of a step (if
+        # requested, see "profile" in EnvParams)
+        self.profiler = StepProfiler(enabled=self.env_params.profile)
+
+        # random number generator used for the acceleration noise of the
+        # controllers of vehicles, seeded with the seed of sumo (see seed)
+        self.seed(sumo_params.seed)
+
+        # number and wall time of the TraCI calls performed by the
+        # environment (if requested, see "count_traci_calls" in SumoParams)
+        self.traci_stats = TraCICallStats()
+
+        # state of the network restored at resets (see "snapshot_reset" in
+        # EnvParams), and the file sumo saved its part of the state in
+        self._snapshot = None
+        self._snapshot_path = None
+
+        # vehicle ids sorted by position, and extra sorted data (see
+        # sort_by_position). These are only sorted when they are first
+        # accessed after the vehicles class is updated (see sorted_ids).
+        self._sorted_ids = None
+        self._sorted_extra_data = None
+        self._sorted_stale = False
 
         self.start_sumo()
         self.setup_initial_state()
@@ -141,8 +248,16 @@ class Env(gym.Env, Serializable):
         sumo_binary: str, optional
             specifies whether to use sumo's gui
         """
-        self.traci_connection.close(False)
-        self.sumo_proc.kill()
+        if self.sumo_proc is None:
+            # sumo was run within the python process by libsumo
+            self.traci_connection.close()
+        else:
+            self.traci_connection.close(False)
+            self.sumo_proc.kill()
+
+        # a new instance may use a different seed or emission path, so the
+        # snapshot of the old one is saved again at the next reset
+        self._snapshot = None
 
         if sumo_binary is not None:
             self.sumo_params.sumo_binary = sumo_binary
@@ -178,7 +293,6 @@ class Env(gym.Env, Serializable):
                 # command used to start sumo
                 sumo_call = [self.sumo_params.sumo_binary,
                              "-c", self.scenario.cfg,
-                             "--remote-port", str(port),
                              "--step-length", str(self.sim_step)]
 
                 # add step logs (if requested)
@@ -218,27 +332,94 @@ class Env(gym.Env, Serializable):
                     sumo_call.append("--no-warnings")
                     sumo_call.append("true")
 
+                # save the states restored at resets with full precision (if
+                # snapshots are used, see EnvParams)
+                if self.env_params.snapshot_reset is not None:
+                    sumo_call.append("--save-state.precision")
+                    sumo_call.append("10")
+
                 # set the time it takes for a gridlock teleport to occur
                 sumo_call.append("--time-to-teleport")
                 sumo_call.append(str(int(self.sumo_params.teleport_time)))
 
+                # run sumo within the python process (if requested). libsumo
+                # does not support the gui, which is always run over TraCI.
+                use_libsumo = self.sumo_params.use_libsumo and \
+                    self.sumo_params.sumo_binary != "sumo-gui"
+                if use_libsumo and libsumo is None:
+                    raise ImportError("use_libsumo is set in SumoParams, but "
+                                      "libsumo could not be imported")
+
+                # take an already started sumo instance from a process pool
+                # (if requested). Pooled instances are not used with the gui,
+                # as every idle instance would open its own window.
+                use_pool = self.sumo_params.process_pool_size > 0 and \
+                    self.sumo_params.sumo_binary != "sumo-gui" and \
+                    not use_libsumo
+                if use_pool and (self.sumo_params.restart_instance or
+                                 self._random_seed):
+                    # instances started at resets use random seeds, which are
+                    # drawn by the pool when starting its processes. The
+                    # first instance is not taken from the pool, and still
+                    # uses the seed in sumo_params.
+                    pool_call = list(sumo_call)
+                    if "--seed" in pool_call:
+                        i = pool_call.index("--seed")
+                        del pool_call[i:i + 2]
+                    pool = get_pool(pool_call,
+                                    self.sumo_params.process_pool_size,
+                                    random_seed=True)
+                    use_pool = self._random_seed
+                elif use_pool:
+                    pool = get_pool(sumo_call,
+                                    self.sumo_params.process_pool_size)
+
+                if use_pool:
+                    self.sumo_proc, port, seed = pool.acquire()
+                    self.sumo_params.port = port
+                    if seed is not None:
+                        self.sumo_params.seed = seed
+
                 logging.info(" Starting SUMO on port " + str(port))
                 logging.debug(" Cfg file: " + str(self.scenario.cfg))
                 logging.debug(" Emission file: " + str(emission_out))
                 logging.debug(" Step length: " + str(self.sim_step))
 
                 # Opening the I/O thread to SUMO
-                self.sumo_proc = subprocess.Popen(sumo_call,
-                                                  preexec_fn=os.setsid)
-
-                # wait a small period of time for the subprocess to activate
-                # before trying to connect with traci
-                if os.environ.get("TEST_FLAG", 0):
-                    time.sleep(0.1)
+                if use_libsumo:
+                    self.sumo_proc = None
+                elif not use_pool:
+                    sumo_call.append("--remote-port")
+                    sumo_call.append(str(port))
+                    self.sumo_proc = subprocess.Popen(sumo_call,
+                                                      preexec_fn=os.setsid)
+
+                # connect to sumo as soon as it is ready to accept clients.
+                # The libsumo module provides the same API as a TraCI
+                # connection, without the socket.
+                start_time = time.time()
+                if use_libsumo:
+                    libsumo.start(sumo_call)
+                    self.traci_connection = libsumo
                 else:
-                    time.sleep(config.SUMO_SLEEP)
-
-                self.traci_connection = traci.connect(port, numRetries=100)
+                    self.traci_connection = self._connect_to_sumo(port)
+                self.sumo_startup_time = time.time() - start_time
+                logging.info(" SUMO accepted a connection after %.3f s",
+                             self.sumo_startup_time)
+
+                # queue actuation commands and send them to sumo in a single
+                # message every step (if requested). Commands sent to libsumo
+                # are function calls, and are not batched.
+                if self.sumo_params.batch_commands and not use_libsumo:
+                    self.traci_connection = \
+                        TraCICommandBuffer(self.traci_connection)
+
+                # record the calls performed over the connection (if
+                # requested). Batched commands are recorded as queued, and
+                # the messages sending them as their own "flush" command
+                if self.sumo_params.count_traci_calls:
+                    self.traci_connection = TraCICallCounter(
+                        self.traci_connection, self.traci_stats)
 
                 self.traci_connection.simulationStep()
                 return
@@ -246,8 +427,64 @@ class Env(gym.Env, Serializable):
                 print("Error during start: {}".format(traceback.format_exc()))
                 error = e
                 self.teardown_sumo()
+                # the port may have been taken by another process in the
+                # meantime, so try again on a new one
+                self.sumo_params.port = sumolib.miscutils.getFreeSocketPort()
         raise error
 
+    def _connect_to_sumo(self, port):
+        """Connects to a starting sumo instance over TraCI.
+
+        The connection is attempted repeatedly with an exponentially
+        increasing delay (from CONNECT_INITIAL_WAIT to CONNECT_MAX_WAIT
+        seconds) until sumo accepts it, instead of sleeping for a fixed
+        amount of time before connecting.
+
+        Parameters
+        ----------
+        port: int
+            port the sumo instance is listening on
+
+        Returns
+        -------
+        traci.connection.Connection type
+            TraCI connection to the sumo instance
+
+        Raises
+        ------
+        RuntimeError
+            If the sumo process terminates before accepting the connection.
+        TimeoutError
+            If sumo does not accept the connection within
+            SUMO_STARTUP_TIMEOUT seconds.
+        """
+        deadline = time.time() + SUMO_STARTUP_TIMEOUT
+        wait = CONNECT_INITIAL_WAIT
+        while True:
+            if self.sumo_proc.poll() is not None:
+                raise RuntimeError(
+                    "SUMO exited with code {} before accepting a TraCI "
+                    "connection".format(self.sumo_proc.returncode))
+
+            # sys.stdout is not redirected to hide the messages printed by
+            # some traci clients on failed attempts, as environments may be
+            # connecting from several threads (see FlowVecEnv). The clients
+            # of SUMO 1.x do not print anything when no retry is requested.
+            # The port is not probed with a plain socket either, as sumo
+            # treats the first accepted socket as its client
+            try:
+                return traci.connect(port, numRetries=0)
+            except Exception:
+                # sumo is not listening on the port yet
+                pass
+
+            if time.time() + wait > deadline:
+                raise TimeoutError(
+                    "SUMO did not accept a TraCI connection on port {} "
+                    "within {} s".format(port, SUMO_STARTUP_TIMEOUT))
+            time.sleep(wait)
+            wait = min(2 * wait, CONNECT_MAX_WAIT)
+
     def setup_initial_state(self):
         """Returns information on the initial state of the vehicles in the
         network, to be used upon reset.
@@ -278,22 +515,7 @@ class Env(gym.Env, Serializable):
             self.traffic_lights.add(tl_id)
 
         # subscribe the requested states for traci-related speedups
-        for veh_id in self.vehicles.get_ids():
-            self.traci_connection.vehicle.subscribe(
-                veh_id, [tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
-                         tc.VAR_ROAD_ID, tc.VAR_SPEED, tc.VAR_EDGES])
-            self.traci_connection.vehicle.subscribeLeader(veh_id, 2000)
-
-        # subscribe some simulation parameters needed to check for entering,
-        # exiting, and colliding vehicles
-        self.traci_connection.simulation.subscribe(
-            [tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS,
-             tc.VAR_TELEPORT_STARTING_VEHICLES_IDS])
-
-        # subscribe the traffic light
-        for node_id in self.traffic_lights.get_ids():
-            self.traci_connection.trafficlight.subscribe(
-                node_id, [tc.TL_RED_YELLOW_GREEN_STATE])
+        self.subscribe_network()
 
         for veh_id in self.vehicles.get_ids():
             # some constant vehicle parameters to the vehicles class
@@ -325,8 +547,9 @@ class Env(gym.Env, Serializable):
                  self.initial_observations[veh_id]["speed"], pos)
 
         # collect subscription information from sumo
-        vehicle_obs = self.traci_connection.vehicle.getSubscriptionResults()
-        tls_obs = self.traci_connection.trafficlight.getSubscriptionResults()
+        vehicle_obs = self.get_vehicle_subscription_results()
+        tls_obs = \
+            self.traci_connection.trafficlight.getAllSubscriptionResults()
         id_lists = {tc.VAR_DEPARTED_VEHICLES_IDS: [],
                     tc.VAR_TELEPORT_STARTING_VEHICLES_IDS: [],
                     tc.VAR_ARRIVED_VEHICLES_IDS: []}
@@ -338,6 +561,108 @@ class Env(gym.Env, Serializable):
         # store the network observations in the vehicles class
         self.vehicles.update(vehicle_obs, id_lists, self)
 
+    def subscribe_network(self):
+        """Subscribes to all states collected from sumo at every step.
+
+        This includes the states of the vehicles currently in the network,
+        the simulation parameters needed to check for entering, exiting, and
+        colliding vehicles, and the states of the traffic lights.
+        """
+        if self.sumo_params.context_subscription:
+            self.subscribe_context()
+        for veh_id in self.vehicles.get_ids():
+            self.subscribe_vehicle(veh_id)
+
+        # subscribe some simulation parameters needed to check for entering,
+        # exiting, and colliding vehicles
+        self.traci_connection.simulation.subscribe(
+            [tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS,
+             tc.VAR_TELEPORT_STARTING_VEHICLES_IDS])
+
+        # subscribe the traffic light
+        for node_id in self.traffic_lights.get_ids():
+            self.traci_connection.trafficlight.subscribe(
+                node_id, [tc.TL_RED_YELLOW_GREEN_STATE])
+
+    def subscribe_vehicle(self, veh_id):
+        """Subscribes to the state of a vehicle that entered the network.
+
+        If a context subscription is used (see "context_subscription" in
+        SumoParams), the state of the vehicle is already included in the
+        network-wide subscription, and no TraCI call is performed. The leader
+        of the vehicle is only subscribed to if it is not computed by flow
+        (see "flow_leaders" in SumoParams).
+
+        Parameters
+        ----------
+        veh_id: str
+            name of the vehicle
+        """
+        if self.sumo_params.context_subscription:
+            return
+
+        self.traci_connection.vehicle.subscribe(
+            veh_id, self.vehicle_subscriptions)
+
+        # the leaders of vehicles are not needed from sumo if they are
+        # computed by flow, unless they are compared to the ones of sumo
+        if not self.sumo_params.flow_leaders or \
+                self.sumo_params.validate_leaders:
+            self.traci_connection.vehicle.subscribeLeader(veh_id, 2000)
+
+    def subscribe_context(self):
+        """Subscribes to the state of all vehicles in the network at once.
+
+        This is done via a context subscription around one of the junctions
+        in the network, with a radius large enough to cover the entire
+        network. The results of this subscription are collected in a single
+        response every step, regardless of the number of vehicles.
+        """
+        self._context_id = self.traci_connection.junction.getIDList()[0]
+
+        # the diagonal of the network's bounding box is an upper bound on the
+        # distance between the junction and any vehicle in the network
+        (x_min, y_min), (x_max, y_max) = \
+            self.traci_connection.simulation.getNetBoundary()
+        radius = np.hypot(x_max - x_min, y_max - y_min) + 1
+
+        self.traci_connection.junction.subscribeContext(
+            self._context_id, tc.CMD_GET_VEHICLE_VARIABLE, radius,
+            self.vehicle_subscriptions +
+            [var for var in CONTEXT_SUBSCRIPTIONS
+             if var not in self.vehicle_subscriptions])
+
+    def get_vehicle_subscription_results(self):
+        """Returns the subscription results of all vehicles in the network.
+
+        Returns
+        -------
+        dict
+            Key = vehicle ID
+            Element = dictionary of subscribed variables and their values
+        """
+        if self.sumo_params.context_subscription:
+            return self.traci_connection.junction.\
+                getContextSubscriptionResults(self._context_id) or {}
+        return self.traci_connection.vehicle.getAllSubscriptionResults()
+
+    def get_simulation_subscription_results(self):
+        """Returns the subscription results of the simulation (e.g. the ids
+        of departed and arrived vehicles).
+
+        The results are read from the results of all subscribed objects,
+        since the getter of a single object takes no id in the simulation
+        domain of traci, but requires one in libsumo.
+
+        Returns
+        -------
+        dict
+            Key = subscribed variable
+            Element = value of the variable
+        """
+        return self.traci_connection.simulation.getAllSubscriptionResults()\
+            .get("", {})
+
     def step(self, rl_actions):
         """Advances the environment by one step.
 
@@ -368,66 +693,75 @@ class Env(gym.Env, Serializable):
         info: dict
             contains other diagnostic information from the previous action
         """
+        profiler = self.profiler
+        step_start = time.perf_counter()
+
         for _ in range(self.env_params.sims_per_step):
             self.time_counter += 1
             self.step_counter += 1
 
             # perform acceleration actions for controlled human-driven vehicles
-            if len(self.vehicles.get_controlled_ids()) > 0:
-                accel = []
-                for veh_id in self.vehicles.get_controlled_ids():
-                    accel_contr = self.vehicles.get_acc_controller(veh_id)
-                    action = accel_contr.get_action(self)
-                    accel.append(action)
-                self.apply_acceleration(self.vehicles.get_controlled_ids(),
-                                        accel)
+            with profiler.phase("accel_controllers"):
+                if len(self.vehicles.get_controlled_ids()) > 0:
+                    accel = self.get_controller_actions(
+                        self.vehicles.get_controlled_ids())
+                    self.apply_acceleration(
+                        self.vehicles.get_controlled_ids(), accel)
 
             # perform lane change actions for controlled human-driven vehicles
-            if len(self.vehicles.get_controlled_lc_ids()) > 0:
-                direction = []
-                for veh_id in self.vehicles.get_controlled_lc_ids():
-                    lc_contr = self.vehicles.get_lane_changing_controller(
-                        veh_id)
-                    target_lane = lc_contr.get_action(self)
-                    direction.append(target_lane)
-                self.apply_lane_change(self.vehicles.get_controlled_lc_ids(),
-                                       direction=direction)
+            with profiler.phase("lc_controllers"):
+                if len(self.vehicles.get_controlled_lc_ids()) > 0:
+                    direction = []
+                    for veh_id in self.vehicles.get_controlled_lc_ids():
+                        lc_contr = self.vehicles.get_lane_changing_controller(
+                            veh_id)
+                        target_lane = lc_contr.get_action(self)
+                        direction.append(target_lane)
+                    self.apply_lane_change(
+                        self.vehicles.get_controlled_lc_ids(),
+                        direction=direction)
 
             # perform (optionally) routing actions for all vehicle in the
             # network, including rl and sumo-controlled vehicles
-            routing_ids = []
-            routing_actions = []
-            for veh_id in self.vehicles.get_ids():
-                if self.vehicles.get_routing_controller(veh_id) is not None:
-                    routing_ids.append(veh_id)
-                    route_contr = self.vehicles.get_routing_controller(veh_id)
-                    routing_actions.append(route_contr.choose_route(self))
-
-            self.choose_routes(routing_ids, routing_actions)
-
-            self.apply_rl_actions(rl_actions)
-
-            self.additional_command()
-
-            self.traci_connection.simulationStep()
+            with profiler.phase("routing"):
+                routing_ids = []
+                routing_actions = []
+                for veh_id in self.vehicles.get_ids():
+                    if self.vehicles.get_routing_controller(veh_id) \
+                            is not None:
+                        routing_ids.append(veh_id)
+                        route_contr = self.vehicles.get_routing_controller(
+                            veh_id)
+                        routing_actions.append(route_contr.choose_route(self))
+
+                self.choose_routes(routing_ids, routing_actions)
+
+            with profiler.phase("apply_rl_actions"):
+                self.apply_rl_actions(rl_actions)
+
+            with profiler.phase("additional_command"):
+                self.additional_command()
+
+            with profiler.phase("simulation_step"):
+                self.traci_connection.simulationStep()
 
             # collect subscription information from sumo
-            vehicle_obs = \
-                self.traci_connection.vehicle.getSubscriptionResults()
-            id_lists = \
-                self.traci_connection.simulation.getSubscriptionResults()
-            tls_obs = \
-                self.traci_connection.trafficlight.getSubscriptionResults()
+            with profiler.phase("subscription_results"):
+                vehicle_obs = self.get_vehicle_subscription_results()
+                id_lists = self.get_simulation_subscription_results()
+                tls_obs = self.traci_connection.trafficlight.\
+                    getAllSubscriptionResults()
 
             # store new observations in the vehicles and traffic lights class
-            self.vehicles.update(vehicle_obs, id_lists, self)
-            self.traffic_lights.update(tls_obs)
+            with profiler.phase("vehicles_update"):
+                self.vehicles.update(vehicle_obs, id_lists, self)
+            with profiler.phase("traffic_lights_update"):
+                self.traffic_lights.update(tls_obs)
 
-            # update the colors of vehicles
-            self.update_vehicle_colors()
-
-            # collect list of sorted vehicle ids
-            self.sorted_ids, self.sorted_extra_data = self.sort_by_position()
+            # the list of sorted vehicle ids is collected when it is first
+            # accessed, so that vehicles are not sorted at every simulation
+            # step if sims_per_step > 1
+            self._sorted_stale = True
 
             # crash encodes whether the simulator experienced a collision
             crash = \
@@ -438,15 +772,25 @@ class Env(gym.Env, Serializable):
             if crash:
                 break
 
+        # update the colors of vehicles (only needed for the simulation step
+        # that is rendered last)
+        with profiler.phase("update_vehicle_colors"):
+            self.update_vehicle_colors()
+
         # collect information of the state of the network based on the
         # environment class used
-        self.state = np.asarray(self.get_state()).T
+        with profiler.phase("get_state"):
+            self.state = np.asarray(self.get_state()).T
 
         # collect observation new state associated with action
         next_observation = np.copy(self.state)
 
         # compute the reward
-        reward = self.compute_reward(self.state, rl_actions, fail=crash)
+        with profiler.phase("compute_reward"):
+            reward = self.compute_reward(self.state, rl_actions, fail=crash)
+
+        if profiler.enabled:
+            profiler.record("step", time.perf_counter() - step_start)
 
         return next_observation, reward, crash, {}
 
@@ -472,6 +816,16 @@ class Env(gym.Env, Serializable):
             the initial observation of the space. The initial reward is assumed
             to be zero.
         """
+        # report the time spent in the phases of the most recent steps
+        if self.profiler.enabled and self.time_counter > 0:
+            logging.info(" Step profile:\n" + self.profiler.report())
+
+        # report the TraCI calls of the last episode
+        if self.sumo_params.count_traci_calls:
+            if self.traci_stats.episode_steps > 0:
+                logging.info(" TraCI calls:\n" + self.traci_stats.report())
+            self.traci_stats.end_episode()
+
         # reset the time counter
         self.time_counter = 0
 
@@ -479,11 +833,25 @@ class Env(gym.Env, Serializable):
             self.step_counter = 0
             # issue a random seed to induce randomness into the next rollout
             self.sumo_params.seed = random.randint(0, 1e5)
+            self._random_seed = True
             # modify the vehicles class to match initial data
-            self.vehicles = deepcopy(self.initial_vehicles)
+            self.vehicles.restore(self.initial_vehicles)
             # restart the sumo instance
             self.restart_sumo(self.sumo_params)
 
+        # restore the state at the start of a rollout from a snapshot (if
+        # requested and already saved)
+        snapshot_reset = self.env_params.snapshot_reset
+        if self.starting_position_shuffle or self.vehicle_arrangement_shuffle:
+            snapshot_reset = None
+
+        if snapshot_reset is not None and self._snapshot is not None:
+            observation = self.load_snapshot()
+            if snapshot_reset == "initial":
+                for _ in range(self.env_params.warmup_steps):
+                    observation, _, _, _ = self.step(rl_actions=[])
+            return observation
+
         # perform shuffling (if requested)
         if self.starting_position_shuffle or self.vehicle_arrangement_shuffle:
             if self.starting_position_shuffle:
@@ -524,7 +892,8 @@ class Env(gym.Env, Serializable):
         for veh_id in self.traci_connection.vehicle.getIDList():
             try:
                 self.traci_connection.vehicle.remove(veh_id)
-                self.traci_connection.vehicle.unsubscribe(veh_id)
+                if not self.sumo_params.context_subscription:
+                    self.traci_connection.vehicle.unsubscribe(veh_id)
                 self.vehicles.remove(veh_id)
             except Exception:
                 print("Error during start: {}".format(traceback.format_exc()))
@@ -561,9 +930,10 @@ class Env(gym.Env, Serializable):
         self.traci_connection.simulationStep()
 
         # collect subscription information from sumo
-        vehicle_obs = self.traci_connection.vehicle.getSubscriptionResults()
-        id_lists = self.traci_connection.simulation.getSubscriptionResults()
-        tls_obs = self.traci_connection.trafficlight.getSubscriptionResults()
+        vehicle_obs = self.get_vehicle_subscription_results()
+        id_lists = self.get_simulation_subscription_results()
+        tls_obs = \
+            self.traci_connection.trafficlight.getAllSubscriptionResults()
 
         # store new observations in the vehicles and traffic lights class
         self.vehicles.update(vehicle_obs, id_lists, self)
@@ -582,8 +952,8 @@ class Env(gym.Env, Serializable):
             # re-initialize memory on last lc
             self.prev_last_lc[veh_id] = -float("inf")
 
-        # collect list of sorted vehicle ids
-        self.sorted_ids, self.sorted_extra_data = self.sort_by_position()
+        # the list of sorted vehicle ids is collected when first accessed
+        self._sorted_stale = True
 
         # collect information of the state of the network based on the
         # environment class used
@@ -592,10 +962,69 @@ class Env(gym.Env, Serializable):
         # observation associated with the reset (no warm-up steps)
         observation = np.copy(self.state)
 
+        if snapshot_reset == "initial":
+            self.save_snapshot(observation)
+
         # perform (optional) warm-up steps before training
         for _ in range(self.env_params.warmup_steps):
             observation, _, _, _ = self.step(rl_actions=[])
 
+        if snapshot_reset == "warmup":
+            self.save_snapshot(observation)
+
+        return observation
+
+    def save_snapshot(self, observation):
+        """Saves the current state of the network, to be restored at resets.
+
+        The state of the simulation is saved by sumo in a file, while the
+        states of the vehicles and traffic lights classes (and other data
+        collected during a step) are copied on the python side.
+
+        Parameters
+        ----------
+        observation: numpy ndarray
+            the observation returned when the snapshot is restored
+        """
+        if self._snapshot_path is None:
+            fd, self._snapshot_path = tempfile.mkstemp(
+                prefix="{}-".format(self.scenario.name), suffix=".state.xml")
+            os.close(fd)
+
+        self.traci_connection.simulation.saveState(self._snapshot_path)
+
+        self._snapshot = (self.vehicles.snapshot(), deepcopy(
+            (self.traffic_lights, self.time_counter, self.prev_last_lc,
+             self.sorted_ids, self.sorted_extra_data, self.state,
+             observation)))
+
+    def load_snapshot(self):
+        """Restores the state of the network saved by save_snapshot.
+
+        The simulation state is loaded by sumo in a single TraCI command.
+        Sumo drops all subscriptions when loading a state, so these are
+        performed again (a single call for all vehicles if a context
+        subscription is used).
+
+        Returns
+        -------
+        numpy ndarray
+            the observation saved with the snapshot
+        """
+        self.traci_connection.simulation.loadState(self._snapshot_path)
+
+        vehicles, state = self._snapshot
+        self.vehicles.restore(vehicles)
+        traffic_lights, self.time_counter, self.prev_last_lc, \
+            self.sorted_ids, self.sorted_extra_data, self.state, \
+            observation = deepcopy(state)
+
+        # the traffic lights are restored in place, as they are shared with
+        # the scenario
+        self.traffic_lights.__dict__ = traffic_lights.__dict__
+
+        self.subscribe_network()
+
         return observation
 
     def additional_command(self):
@@ -628,6 +1057,93 @@ class Env(gym.Env, Serializable):
     def _apply_rl_actions(self, rl_actions):
         raise NotImplementedError
 
+    def get_controller_actions(self, veh_ids):
+        """Returns the actions of the acceleration controllers of vehicles.
+
+        Vehicles whose controllers are of the same class and have the same
+        parameters (see flow.controllers.BaseController.batch_key), and whose
+        accelerations may be computed for several vehicles at once (see
+        flow.controllers.BaseController.batched) are grouped, regardless of
+        their type. The actions of every group are computed with a single
+        call to get_action_batch. The actions of other vehicles are computed
+        with get_action.
+
+        The acceleration noise of all controllers (see the noise parameter of
+        flow.controllers.BaseController) is drawn at once from the random
+        number generator of the environment (see seed).
+
+        Parameters
+        ----------
+        veh_ids: list<str>
+            names of the vehicles
+
+        Returns
+        -------
+        list<float>
+            actions of the vehicles (None for vehicles controlled by sumo at
+            the current time step)
+        """
+        actions = [None] * len(veh_ids)
+        controllers = [self.vehicles.get_acc_controller(veh_id)
+                       for veh_id in veh_ids]
+
+        # Key = class of a controller
+        # Element = whether the controller is batched, and whether it uses the
+        # get_action method of BaseController (and may be given its noise)
+        kinds = dict()
+        for accel_contr in controllers:
+            contr_class = type(accel_contr)
+            if contr_class not in kinds:
+                kinds[contr_class] = (
+                    contr_class.batched(),
+                    contr_class.get_action is BaseController.get_action)
+
+        # the acceleration noise of all vehicles is drawn at once
+        noise_levels = np.array(
+            [accel_contr.accel_noise if kinds[type(accel_contr)][1] else 0
+             for accel_contr in controllers], dtype=float)
+        noise = np.zeros(len(veh_ids))
+        noisy = noise_levels > 0
+        if np.any(noisy):
+            # environments loaded from old pkl files have no generator
+            rng = getattr(self, "np_random", np.random)
+            noise[noisy] = rng.normal(0, noise_levels[noisy])
+
+        # Key = class and parameters of a controller (see batch_key)
+        # Element = (controller, indices of the vehicles whose controllers
+        #           have these class and parameters)
+        groups = collections.OrderedDict()
+        # the keys of controllers whose attributes are the same objects (e.g.
+        # the controllers of the vehicles of a type) are only computed once
+        batch_keys = dict()
+        for i, accel_contr in enumerate(controllers):
+            batched, base_action = kinds[type(accel_contr)]
+            if batched:
+                attributes = (type(accel_contr),) + tuple(
+                    id(value) for name, value in accel_contr.__dict__.items()
+                    if name != "veh_id")
+                if attributes not in batch_keys:
+                    batch_keys[attributes] = accel_contr.batch_key()
+                groups.setdefault(batch_keys[attributes],
+                                  (accel_contr, []))[1].append(i)
+                continue
+
+            # controllers may be used by all vehicles of a type
+            accel_contr.veh_id = veh_ids[i]
+            if base_action:
+                actions[i] = accel_contr.get_action(
+                    self, noise=float(noise[i]))
+            else:
+                actions[i] = accel_contr.get_action(self)
+
+        for accel_contr, indices in groups.values():
+            group_actions = accel_contr.get_action_batch(
+                self, [veh_ids[i] for i in indices], noise=noise[indices])
+            for i, action in zip(indices, group_actions):
+                actions[i] = action
+
+        return actions
+
     def apply_acceleration(self, veh_ids, acc):
         """Applies the acceleration requested by a vehicle in sumo.
 
@@ -688,7 +1204,7 @@ class Env(gym.Env, Serializable):
                 self.traci_connection.vehicle.changeLane(
                     veh_id, int(target_lane), 100000)
 
-                if veh_id in self.vehicles.get_rl_ids():
+                if self.vehicles.is_rl(veh_id):
                     self.prev_last_lc[veh_id] = \
                         self.vehicles.get_state(veh_id, "last_lc")
 
@@ -706,8 +1222,10 @@ class Env(gym.Env, Serializable):
         """
         for i, veh_id in enumerate(veh_ids):
             if route_choices[i] is not None:
+                # the arguments are positional, as libsumo does not accept
+                # keywords for overloaded methods such as setRoute
                 self.traci_connection.vehicle.setRoute(
-                    vehID=veh_id, edgeList=route_choices[i])
+                    veh_id, route_choices[i])
 
     def get_x_by_id(self, veh_id):
         """Provides a 1-dimensional representation of the position of a vehicle
@@ -729,6 +1247,43 @@ class Env(gym.Env, Serializable):
         return self.scenario.get_x(self.vehicles.get_edge(veh_id),
                                    self.vehicles.get_position(veh_id))
 
+    @property
+    def sorted_ids(self):
+        """Vehicle ids sorted by position at the current step (see
+        sort_by_position).
+
+        Vehicles are only sorted when this (or sorted_extra_data) is first
+        accessed after the vehicles class is updated, so that steps whose ids
+        are never read (e.g. all but the last simulation step of a step with
+        sims_per_step > 1) do not sort the vehicles.
+        """
+        self._update_sorted_ids()
+        return self._sorted_ids
+
+    @sorted_ids.setter
+    def sorted_ids(self, sorted_ids):
+        self._update_sorted_ids()
+        self._sorted_ids = sorted_ids
+
+    @property
+    def sorted_extra_data(self):
+        """Extra sorted data at the current step (see sort_by_position)."""
+        self._update_sorted_ids()
+        return self._sorted_extra_data
+
+    @sorted_extra_data.setter
+    def sorted_extra_data(self, sorted_extra_data):
+        self._update_sorted_ids()
+        self._sorted_extra_data = sorted_extra_data
+
+    def _update_sorted_ids(self):
+        """Sorts the vehicles if they were updated since the last sort."""
+        if self._sorted_stale:
+            self._sorted_stale = False
+            with self.profiler.phase("sort_by_position"):
+                self._sorted_ids, self._sorted_extra_data = \
+                    self.sort_by_position()
+
     def sort_by_position(self):
         """Sorts the vehicle ids of vehicles in the network by position.
 
@@ -864,14 +1419,47 @@ class Env(gym.Env, Serializable):
     def _close(self):
         self.traci_connection.close()
 
+        if self._snapshot_path is not None:
+            os.remove(self._snapshot_path)
+            self._snapshot_path = None
+
     def teardown_sumo(self):
         try:
-            os.killpg(self.sumo_proc.pid, signal.SIGTERM)
+            if self.sumo_proc is None:
+                # sumo was run within the python process by libsumo
+                libsumo.close()
+            else:
+                os.killpg(self.sumo_proc.pid, signal.SIGTERM)
         except Exception:
             print("Error during teardown: {}".format(traceback.format_exc()))
 
+    def seed(self, seed=None):
+        """Seeds the random number generator of the environment.
+
+        This generator (np_random) is used to draw the acceleration noise of
+        the controllers of vehicles, so that the noise of an environment is
+        reproducible for a given seed, independently of other environments
+        in the same process.
+
+        Parameters
+        ----------
+        seed: int, optional
+            the seed. If not specified, the generator is seeded from the
+            global numpy generator, so that seeding numpy (np.random.seed)
+            still makes the noise reproducible
+
+        Returns
+        -------
+        list<int>
+            the seed of the generator
+        """
+        if seed is None:
+            seed = np.random.randint(2 ** 31 - 1)
+        self.np_random = np.random.RandomState(seed)
+        return [seed]
+
     def _seed(self, seed=None):
-        return []
+        return self.seed(seed)
 
     def render(self, mode='human'):
         pass
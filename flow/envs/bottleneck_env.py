@@ -4,10 +4,10 @@ from flow.controllers.routing_controllers import ContinuousRouter
 from flow.core.params import InFlows, NetParams
 from flow.core.vehicles import Vehicles
 
-from collections import defaultdict
 from copy import deepcopy
 
 import numpy as np
+import traci.constants as tc
 from gym.spaces.box import Box
 
 from flow.core import rewards
@@ -83,6 +83,10 @@ PERIOD = 10.0
 
 class BottleneckEnv(Env):
 
+    # the colors of vehicles are stored when they enter the toll booth and
+    # ramp meter areas, and restored when they leave them
+    vehicle_variables = [tc.VAR_COLOR]
+
     def __init__(self, env_params, sumo_params, scenario):
         """Environment used as a simplified representation of the toll booth
         portion of the bay bridge. Contains ramp meters, and a toll both.
@@ -107,7 +111,6 @@ class BottleneckEnv(Env):
         env_add_params = self.env_params.additional_params
         # tells how scaled the number of lanes are
         self.scaling = scenario.net_params.additional_params.get("scaling")
-        self.edge_dict = defaultdict(list)
         self.cars_waiting_for_toll = dict()
         self.cars_before_ramp = dict()
         self.toll_wait_time = np.abs(
@@ -147,24 +150,6 @@ class BottleneckEnv(Env):
     def additional_command(self):
         # print(self.vehicles.get_outflow_rate(100))
         super().additional_command()
-        # build a list of vehicles and their edges and positions
-        self.edge_dict = defaultdict(list)
-        # update the dict with all the edges in edge_list
-        # so we can look forward for edges
-        self.edge_dict.update(
-            (k, [[] for _ in range(MAX_LANES * self.scaling)])
-            for k in EDGE_LIST)
-        for veh_id in self.vehicles.get_ids():
-            try:
-                edge = self.vehicles.get_edge(veh_id)
-                if edge not in self.edge_dict:
-                    self.edge_dict.update(
-                        {edge: [[] for _ in range(MAX_LANES * self.scaling)]})
-                lane = self.vehicles.get_lane(veh_id)  # integer
-                pos = self.vehicles.get_position(veh_id)
-                self.edge_dict[edge][lane].append((veh_id, pos))
-            except:
-                pass
         if not self.disable_tb:
             self.apply_toll_bridge_control()
         if not self.disable_ramp_metering:
@@ -202,17 +187,19 @@ class BottleneckEnv(Env):
             self.cars_before_ramp.__delitem__(veh_id)
 
         for lane in range(NUM_RAMP_METERS * self.scaling):
-            cars_in_lane = self.edge_dict[EDGE_BEFORE_RAMP_METER][lane]
+            cars_in_lane = self.vehicles.get_ids_by_lane(
+                EDGE_BEFORE_RAMP_METER, lane)
 
-            for car in cars_in_lane:
-                veh_id, pos = car
+            for veh_id in cars_in_lane:
+                pos = self.vehicles.get_position(veh_id)
                 if pos > RAMP_METER_AREA:
                     if veh_id not in self.cars_waiting_for_toll:
                         traci_veh = self.traci_connection.vehicle
                         # Disable lane changes inside Toll Area
                         lane_change_mode = \
                             self.vehicles.get_lane_change_mode(veh_id)
-                        color = traci_veh.getColor(veh_id)
+                        color = self.vehicles.get_sumo_variable(
+                            veh_id, tc.VAR_COLOR)
                         self.cars_before_ramp[veh_id] = {
                             "lane_change_mode": lane_change_mode,
                             "color": color
@@ -274,16 +261,18 @@ class BottleneckEnv(Env):
         traffic_light_states = ["G"] * NUM_TOLL_LANES * self.scaling
 
         for lane in range(NUM_TOLL_LANES * self.scaling):
-            cars_in_lane = self.edge_dict[EDGE_BEFORE_TOLL][lane]
+            cars_in_lane = self.vehicles.get_ids_by_lane(
+                EDGE_BEFORE_TOLL, lane)
 
-            for car in cars_in_lane:
-                veh_id, pos = car
+            for veh_id in cars_in_lane:
+                pos = self.vehicles.get_position(veh_id)
                 if pos > TOLL_BOOTH_AREA:
                     if veh_id not in self.cars_waiting_for_toll:
                         # Disable lane changes inside Toll Area
                         lane_change_mode = \
                             self.vehicles.get_lane_change_mode(veh_id)
-                        color = self.traci_connection.vehicle.getColor(veh_id)
+                        color = self.vehicles.get_sumo_variable(
+                            veh_id, tc.VAR_COLOR)
                         self.cars_waiting_for_toll[veh_id] = \
                             {"lane_change_mode": lane_change_mode,
                              "color": color}
@@ -542,7 +531,7 @@ class BottleNeckAccelEnv(BottleneckEnv):
 
         # re-arrange actions according to mapping in observation space
         sorted_rl_ids = [veh_id for veh_id in self.sorted_ids
-                         if veh_id in self.vehicles.get_rl_ids()]
+                         if self.vehicles.is_rl(veh_id)]
 
         # represents vehicles that are allowed to change lanes
         non_lane_changing_veh = \
@@ -597,6 +586,10 @@ class DesiredVelocityEnv(BottleneckEnv):
            for RL vehicles making forward progress
     """
 
+    # the desired velocities of rl vehicles are set by updating their maximum
+    # speeds
+    vehicle_variables = BottleneckEnv.vehicle_variables + [tc.VAR_MAXSPEED]
+
     def __init__(self, env_params, sumo_params, scenario):
         super().__init__(env_params, sumo_params, scenario)
         for p in ADDITIONAL_VSL_ENV_PARAMS.keys():
@@ -737,7 +730,7 @@ class DesiredVelocityEnv(BottleneckEnv):
             for i, id in enumerate(ids):
                 segment = np.searchsorted(self.obs_slices[edge],
                                           pos_list[i]) - 1
-                if id in self.vehicles.get_rl_ids():
+                if self.vehicles.is_rl(id):
                     rl_vehicle_speeds[segment, lane_list[i]] \
                         += self.vehicles.get_speed(id)
                     num_rl_vehicles[segment, lane_list[i]] += 1
@@ -803,7 +796,8 @@ class DesiredVelocityEnv(BottleneckEnv):
                                             self.action_index[edge]]
 
                     traci_veh = self.traci_connection.vehicle
-                    max_speed_curr = traci_veh.getMaxSpeed(rl_id)
+                    max_speed_curr = self.vehicles.get_sumo_variable(
+                        rl_id, tc.VAR_MAXSPEED)
                     next_max = np.clip(max_speed_curr + action, 0.01, 23.0)
                     traci_veh.setMaxSpeed(rl_id, next_max)
 
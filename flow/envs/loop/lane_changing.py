@@ -104,10 +104,12 @@ class LaneChangeAccelEnv(Env):
         max_lanes = max(self.scenario.num_lanes(edge)
                         for edge in self.scenario.get_edge_list())
 
-        return np.array([[self.vehicles.get_speed(veh_id) / max_speed,
-                          self.get_x_by_id(veh_id) / length,
-                          self.vehicles.get_lane(veh_id) / max_lanes]
-                         for veh_id in self.sorted_ids])
+        speed = self.vehicles.get_array("speed", self.sorted_ids) / max_speed
+        pos = np.array([self.get_x_by_id(veh_id)
+                        for veh_id in self.sorted_ids]) / length
+        lane = self.vehicles.get_array("lane", self.sorted_ids) / max_lanes
+
+        return np.array([speed, pos, lane]).T
 
     def _apply_rl_actions(self, actions):
         acceleration = actions[::2]
@@ -115,7 +117,7 @@ class LaneChangeAccelEnv(Env):
 
         # re-arrange actions according to mapping in observation space
         sorted_rl_ids = [veh_id for veh_id in self.sorted_ids
-                         if veh_id in self.vehicles.get_rl_ids()]
+                         if self.vehicles.is_rl(veh_id)]
 
         # represents vehicles that are allowed to change lanes
         non_lane_changing_veh = \
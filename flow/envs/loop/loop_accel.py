@@ -70,12 +70,12 @@ class AccelEnv(Env):
 
     def _apply_rl_actions(self, rl_actions):
         sorted_rl_ids = [veh_id for veh_id in self.sorted_ids
-                         if veh_id in self.vehicles.get_rl_ids()]
+                         if self.vehicles.is_rl(veh_id)]
         self.apply_acceleration(sorted_rl_ids, rl_actions)
 
     def compute_reward(self, state, rl_actions, **kwargs):
         if self.env_params.evaluate:
-            return np.mean(self.vehicles.get_speed(self.vehicles.get_ids()))
+            return np.mean(self.vehicles.get_array("speed"))
         else:
             return rewards.desired_velocity(self, fail=kwargs["fail"])
 
@@ -83,9 +83,11 @@ class AccelEnv(Env):
         # speed normalizer
         max_speed = self.scenario.max_speed
 
-        return np.array([[self.vehicles.get_speed(veh_id) / max_speed,
-                          self.get_x_by_id(veh_id) / self.scenario.length]
-                         for veh_id in self.sorted_ids])
+        speed = self.vehicles.get_array("speed", self.sorted_ids) / max_speed
+        pos = np.array([self.get_x_by_id(veh_id)
+                        for veh_id in self.sorted_ids]) / self.scenario.length
+
+        return np.array([speed, pos]).T
 
     def additional_command(self):
         # specify observed vehicles
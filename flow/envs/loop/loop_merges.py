@@ -99,7 +99,7 @@ class TwoLoopsMergeEnv(Env):
 
     def _apply_rl_actions(self, rl_actions):
         sorted_rl_ids = [veh_id for veh_id in self.sorted_ids
-                         if veh_id in self.vehicles.get_rl_ids()]
+                         if self.vehicles.is_rl(veh_id)]
         self.apply_acceleration(sorted_rl_ids, rl_actions)
 
     def compute_reward(self, state, rl_actions, **kwargs):
@@ -207,10 +207,10 @@ class TwoLoopsMergeEnv(Env):
         sorted_ids = np.array(self.vehicles.get_ids())[sorted_indx]
 
         sorted_human_ids = [veh_id for veh_id in sorted_ids
-                            if veh_id not in self.vehicles.get_rl_ids()]
+                            if not self.vehicles.is_rl(veh_id)]
 
         sorted_rl_ids = [veh_id for veh_id in sorted_ids
-                         if veh_id in self.vehicles.get_rl_ids()]
+                         if self.vehicles.is_rl(veh_id)]
 
         sorted_separated_ids = sorted_human_ids + sorted_rl_ids
 
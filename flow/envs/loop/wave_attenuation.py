@@ -73,12 +73,11 @@ class WaveAttenuationEnv(Env):
 
     def _apply_rl_actions(self, rl_actions):
         sorted_rl_ids = [veh_id for veh_id in self.sorted_ids
-                         if veh_id in self.vehicles.get_rl_ids()]
+                         if self.vehicles.is_rl(veh_id)]
         self.apply_acceleration(sorted_rl_ids, rl_actions)
 
     def compute_reward(self, state, rl_actions, **kwargs):
-        vel = np.array([self.vehicles.get_speed(veh_id)
-                        for veh_id in self.vehicles.get_ids()])
+        vel = self.vehicles.get_array("speed")
 
         if any(vel < -100) or kwargs["fail"]:
             return 0.
@@ -98,10 +97,12 @@ class WaveAttenuationEnv(Env):
         return float(reward)
 
     def get_state(self, **kwargs):
-        return np.array(
-            [[self.vehicles.get_speed(veh_id) / self.scenario.max_speed,
-              self.get_x_by_id(veh_id) / self.scenario.length]
-             for veh_id in self.sorted_ids])
+        speed = self.vehicles.get_array("speed", self.sorted_ids) \
+            / self.scenario.max_speed
+        pos = np.array([self.get_x_by_id(veh_id)
+                        for veh_id in self.sorted_ids]) / self.scenario.length
+
+        return np.array([speed, pos]).T
 
     def additional_command(self):
         # specify observed vehicles
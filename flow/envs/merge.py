@@ -93,7 +93,7 @@ class WaveAttenuationMergePOEnv(Env):
     def _apply_rl_actions(self, rl_actions):
         for i, rl_id in enumerate(self.rl_veh):
             # ignore rl vehicles outside the network
-            if rl_id not in self.vehicles.get_rl_ids():
+            if not self.vehicles.is_rl(rl_id):
                 continue
             self.apply_acceleration([rl_id], [rl_actions[i]])
 
@@ -178,10 +178,10 @@ class WaveAttenuationMergePOEnv(Env):
 
         # remove rl vehicles that exited the network
         for veh_id in list(self.rl_queue):
-            if veh_id not in self.vehicles.get_rl_ids():
+            if not self.vehicles.is_rl(veh_id):
                 self.rl_queue.remove(veh_id)
         for veh_id in self.rl_veh:
-            if veh_id not in self.vehicles.get_rl_ids():
+            if not self.vehicles.is_rl(veh_id):
                 self.rl_veh.remove(veh_id)
 
         # fil up rl_veh until they are enough controlled vehicles
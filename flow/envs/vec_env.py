@@ -0,0 +1,102 @@
+"""
+Contains an environment that steps several flow environments at once.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from flow.utils.registry import make_create_env
+
+
+class FlowVecEnv:
+
+    def __init__(self, flow_params, num_envs, version=0, sumo_binary=None):
+        """Vectorized flow environment.
+
+        Creates num_envs environments from the same flow parameters, and
+        resets and steps all of them at once. Every environment runs its own
+        sumo instance, and is stepped from its own thread, so that the
+        simulation steps of all sumo instances are computed in parallel
+        while the other environments wait on TraCI.
+
+        Environments whose rollout is done are automatically reset, and the
+        observation returned for them is the first observation of the next
+        rollout.
+
+        Attributes
+        ----------
+        flow_params: dict
+            flow-related parameters (see flow.utils.registry.make_create_env)
+        num_envs: int
+            number of environments
+        version: int, optional
+            environment version number
+        sumo_binary: str, optional
+            specifies whether to use sumo's gui during execution. This
+            overrides the sumo_binary component in SumoParams
+        """
+        if flow_params["sumo"].use_libsumo and num_envs > 1:
+            raise ValueError("Only one environment per process may use "
+                             "libsumo")
+
+        create_env, self.env_name = make_create_env(
+            flow_params, version=version, sumo_binary=sumo_binary,
+            separate_envs=True)
+
+        self.num_envs = num_envs
+        self.envs = [create_env() for _ in range(num_envs)]
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+
+        self._executor = ThreadPoolExecutor(max_workers=num_envs)
+
+    def reset(self):
+        """Resets all environments.
+
+        Returns
+        -------
+        numpy ndarray
+            initial observations of all environments, stacked along the first
+            axis
+        """
+        observations = self._executor.map(lambda env: env.reset(), self.envs)
+        return np.stack(list(observations))
+
+    def step(self, actions):
+        """Advances all environments by one step.
+
+        Parameters
+        ----------
+        actions: list of numpy ndarray
+            actions provided by the rl algorithm to every environment
+
+        Returns
+        -------
+        numpy ndarray
+            observations of all environments, stacked along the first axis
+        numpy ndarray
+            rewards of all environments
+        numpy ndarray
+            indicates whether the rollouts of the environments have ended
+        list of dict
+            diagnostic information from every environment
+        """
+        results = self._executor.map(_step, self.envs, actions)
+        observations, rewards, dones, infos = zip(*results)
+
+        return np.stack(observations), np.array(rewards), np.array(dones), \
+            list(infos)
+
+    def close(self):
+        """Terminates all environments and their sumo instances."""
+        self._executor.shutdown()
+        for env in self.envs:
+            env.unwrapped.terminate()
+
+
+def _step(env, action):
+    """Steps an environment, and resets it if its rollout is done."""
+    observation, reward, done, info = env.step(action)
+    if done:
+        observation = env.reset()
+    return observation, reward, done, info
@@ -226,6 +226,52 @@ class Scenario(Serializable):
         else:
             return self.total_edgestarts_dict[edge] + position
 
+    def get_x_array(self, edges, positions):
+        """Vectorized version of get_x for several edges and positions.
+
+        The absolute position at the start of every edge, and whether the
+        relative position is added to it (see get_x), are stored in arrays
+        indexed by edge, which are extended the first time an edge is seen.
+
+        Parameters
+        ----------
+        edges: list<str> or numpy ndarray
+            names of the edges
+        positions: array_like
+            relative positions on the edges
+
+        Returns
+        -------
+        numpy ndarray
+            absolute positions with respect to some global reference
+        """
+        if not hasattr(self, "_edge_x_index"):
+            # the empty edge ("") is at index 0
+            self._edge_x_index = {"": 0}
+            self._edge_x_starts = np.array([self.get_x("", 0)], dtype=float)
+            self._edge_x_scales = np.zeros(1)
+            for edge, _ in self.total_edgestarts:
+                self._add_edge_x(edge)
+
+        index = [self._edge_x_index.get(edge) for edge in edges]
+        if None in index:
+            index = [self._add_edge_x(edge) if i is None else i
+                     for edge, i in zip(edges, index)]
+        index = np.array(index, dtype=int)
+        return self._edge_x_starts[index] + \
+            self._edge_x_scales[index] * np.asarray(positions, dtype=float)
+
+    def _add_edge_x(self, edge):
+        """Adds an edge to the arrays used by get_x_array, and returns its
+        index."""
+        if edge not in self._edge_x_index:
+            start = self.get_x(edge, 0.)
+            self._edge_x_index[edge] = len(self._edge_x_starts)
+            self._edge_x_starts = np.append(self._edge_x_starts, start)
+            self._edge_x_scales = np.append(self._edge_x_scales,
+                                            self.get_x(edge, 1.) - start)
+        return self._edge_x_index[edge]
+
     def generate_starting_positions(self, num_vehicles=None, **kwargs):
         """Generates starting positions for vehicles in the network.
 
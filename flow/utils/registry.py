@@ -7,7 +7,7 @@ from flow.core.params import InitialConfig
 from flow.core.traffic_lights import TrafficLights
 
 
-def make_create_env(params, version=0, sumo_binary=None):
+def make_create_env(params, version=0, sumo_binary=None, separate_envs=False):
     """Creates a parametrized flow environment compatible with OpenAI gym.
 
     This environment creation method allows for the specification of several
@@ -46,6 +46,13 @@ def make_create_env(params, version=0, sumo_binary=None):
     sumo_binary : bool, optional
         specifies whether to use sumo's gui during execution. This overrides
         the sumo_binary component in SumoParams
+    separate_envs : bool, optional
+        specifies whether the returned method may be called several times
+        within the same process (e.g. by flow.envs.FlowVecEnv). If so, every
+        environment created gets its own copy of the vehicles and traffic
+        lights classes, and the gym environment is registered again at every
+        call. Otherwise, the method may only be called once, as gym does not
+        allow an environment name to be registered twice
 
     Returns
     -------
@@ -70,13 +77,16 @@ def make_create_env(params, version=0, sumo_binary=None):
     traffic_lights = params.get("tls", TrafficLights())
 
     def create_env(*_):
+        # the vehicles and traffic lights classes are modified by the
+        # environment, so separate environments get their own copy
         scenario = scenario_class(
             name=exp_tag,
             generator_class=generator_class,
-            vehicles=vehicles,
+            vehicles=deepcopy(vehicles) if separate_envs else vehicles,
             net_params=net_params,
             initial_config=initial_config,
-            traffic_lights=traffic_lights,
+            traffic_lights=deepcopy(traffic_lights) if separate_envs
+            else traffic_lights,
         )
 
         sumo_params = deepcopy(params['sumo'])
@@ -84,6 +94,10 @@ def make_create_env(params, version=0, sumo_binary=None):
         if sumo_binary is not None:
             sumo_params.sumo_binary = sumo_binary
 
+        # separate environments are registered with their own scenario
+        if separate_envs and env_name in gym.envs.registry.env_specs:
+            del gym.envs.registry.env_specs[env_name]
+
         register(
             id=env_name,
             entry_point='flow.envs:' + params["env_name"],
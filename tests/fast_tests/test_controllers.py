@@ -1,13 +1,15 @@
 import unittest
+from unittest import mock
 
 from flow.core.experiment import SumoExperiment
-from flow.core.params import EnvParams, InitialConfig, NetParams
+from flow.core.params import EnvParams, InitialConfig, NetParams, SumoParams
 from flow.core.vehicles import Vehicles
 from flow.core.params import SumoCarFollowingParams
 
 from flow.controllers.routing_controllers import ContinuousRouter
 from flow.controllers.car_following_models import IDMController, \
     OVMController, BCMController, LinearOVM, CFMController
+from flow.controllers.velocity_controllers import FollowerStopper
 from tests.setup_scripts import ring_road_exp_setup
 import os
 import numpy as np
@@ -260,6 +262,210 @@ class TestIDMController(unittest.TestCase):
          for veh_id in ids]
 
 
+class TestBatchedControllers(unittest.TestCase):
+    """
+    Tests that the accelerations of vehicles that are computed for all
+    vehicles of a controller at once match the ones computed per vehicle, and
+    that controllers that are not batched are evaluated per vehicle.
+    """
+    def run_models(self, vehicle_arrays):
+        vehicles = Vehicles()
+        models = [(CFMController, {}), (BCMController, {}),
+                  (OVMController, {}), (LinearOVM, {}),
+                  (IDMController, {}), (IDMController, {"v0": 10})]
+        for i, model in enumerate(models):
+            vehicles.add(
+                veh_id="test_%d" % i,
+                acceleration_controller=model,
+                routing_controller=(ContinuousRouter, {}),
+                num_vehicles=3)
+        vehicles.add(
+            veh_id="custom",
+            acceleration_controller=(ConstantController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=2)
+
+        env_params = EnvParams(additional_params={"target_velocity": 8,
+                                                  "max_accel": 1,
+                                                  "max_decel": 1},
+                               vehicle_arrays=vehicle_arrays)
+        env, scenario = ring_road_exp_setup(vehicles=vehicles,
+                                            env_params=env_params)
+        env.reset()
+
+        # vehicles with various headways, and a vehicle with no leader
+        ids = env.vehicles.get_controlled_ids()
+        for i, veh_id in enumerate(ids):
+            env.vehicles.set_headway(veh_id, 2.5 * i)
+        env.vehicles.set_leader(ids[-1], None)
+
+        expected_accel = [env.vehicles.get_acc_controller(
+            veh_id).get_action(env) for veh_id in ids]
+        requested_accel = env.get_controller_actions(ids)
+
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+        self.assertEqual(requested_accel[-2:], [0.5, 0.5])
+
+        env.terminate()
+
+    def test_batched_accel(self):
+        self.run_models(vehicle_arrays=False)
+        self.run_models(vehicle_arrays=True)
+
+    def test_batched_failsafes(self):
+        vehicles = Vehicles()
+        vehicles.add(
+            veh_id="test",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=8)
+        env, scenario = ring_road_exp_setup(vehicles=vehicles)
+        env.reset()
+        for _ in range(20):
+            env.step(rl_actions=[])
+
+        # vehicles close to their leader, and a vehicle with no leader
+        ids = env.vehicles.get_ids()
+        for i, veh_id in enumerate(ids):
+            env.vehicles.set_headway(veh_id, 0.1 * i)
+        env.vehicles.set_leader(ids[-1], None)
+        actions = np.linspace(3, -3, len(ids))
+
+        for safe, safe_batch in [
+                ("get_safe_action_instantaneous",
+                 "get_safe_actions_instantaneous"),
+                ("get_safe_velocity_action", "get_safe_velocity_actions")]:
+            # the vehicles share a controller, which is requested for every
+            # vehicle before it is used
+            expected = [
+                getattr(env.vehicles.get_acc_controller(veh_id), safe)(
+                    env, action) for veh_id, action in zip(ids, actions)]
+            contr = env.vehicles.get_acc_controller(ids[0])
+            np.testing.assert_array_almost_equal(
+                getattr(contr, safe_batch)(env, ids, actions), expected)
+            # some of the actions are modified by the failsafes
+            self.assertFalse(np.allclose(expected, actions))
+
+        env.terminate()
+
+    def test_batch_groups(self):
+        vehicles = Vehicles()
+        for veh_id, model in [("idm_a", (IDMController, {})),
+                              ("idm_b", (IDMController, {})),
+                              ("idm_c", (IDMController, {"v0": 10})),
+                              ("stateful", (StatefulController, {}))]:
+            vehicles.add(
+                veh_id=veh_id,
+                acceleration_controller=model,
+                routing_controller=(ContinuousRouter, {}),
+                num_vehicles=2)
+        env, scenario = ring_road_exp_setup(vehicles=vehicles)
+        env.reset()
+
+        # vehicles of different types with the same controller parameters
+        # are batched together, including controllers with a state specific
+        # to their vehicle
+        ids = env.vehicles.get_ids()
+        keys = dict((veh_id, env.vehicles.get_acc_controller(
+            veh_id).batch_key()) for veh_id in ids)
+        self.assertEqual(keys["idm_a_0"], keys["idm_b_1"])
+        self.assertNotEqual(keys["idm_a_0"], keys["idm_c_0"])
+        self.assertEqual(keys["stateful_0"], keys["stateful_1"])
+        self.assertNotEqual(keys["idm_a_0"], keys["stateful_0"])
+
+        with mock.patch.object(IDMController, "get_accel_batch",
+                               autospec=True,
+                               side_effect=IDMController.get_accel_batch
+                               ) as get_accel_batch:
+            env.get_controller_actions(ids)
+        self.assertEqual(get_accel_batch.call_count, 3)
+
+        env.terminate()
+
+    def test_batched(self):
+        self.assertTrue(IDMController.batched())
+        self.assertTrue(OVMController.batched())
+        # controllers that override the accelerations of a batched controller
+        # are evaluated per vehicle
+        self.assertFalse(ConstantController.batched())
+        self.assertFalse(FollowerStopper.batched())
+        self.assertFalse(CustomFailsafeController.batched())
+
+
+class TestAccelNoise(unittest.TestCase):
+    """
+    Tests that the acceleration noise of all controllers is drawn at once from
+    the seeded random number generator of the environment.
+    """
+    def setUp(self):
+        vehicles = Vehicles()
+        for veh_id, noise in [("noiseless", 0), ("low", 0.1), ("high", 0.5)]:
+            vehicles.add(
+                veh_id=veh_id,
+                acceleration_controller=(IDMController, {"noise": noise}),
+                routing_controller=(ContinuousRouter, {}),
+                num_vehicles=2)
+        vehicles.add(
+            veh_id="custom",
+            acceleration_controller=(ConstantController, {"noise": 0.2}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=2)
+
+        sumo_params = SumoParams(sim_step=0.1, seed=3)
+        self.env, scenario = ring_road_exp_setup(vehicles=vehicles,
+                                                 sumo_params=sumo_params)
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def test_noise(self):
+        env = self.env
+        env.reset()
+        ids = env.vehicles.get_controlled_ids()
+        noise_levels = np.array([0, 0, 0.1, 0.1, 0.5, 0.5, 0.2, 0.2])
+
+        # the accelerations without noise
+        controllers = [env.vehicles.get_acc_controller(veh_id)
+                       for veh_id in ids]
+        for contr in controllers:
+            contr.accel_noise = 0
+        accel = np.array(env.get_controller_actions(ids))
+        for contr, noise in zip(controllers, noise_levels):
+            contr.accel_noise = noise
+
+        # the generator of the environment is seeded with the seed of sumo
+        expected_noise = np.zeros(len(ids))
+        expected_noise[2:] = np.random.RandomState(3).normal(
+            0, noise_levels[2:])
+        np.testing.assert_array_almost_equal(
+            np.array(env.get_controller_actions(ids)) - accel,
+            expected_noise)
+
+        # the noise is reproducible after seeding the environment again
+        self.assertListEqual(env.seed(7), [7])
+        noisy_accel = env.get_controller_actions(ids)
+        env.seed(7)
+        self.assertListEqual(env.get_controller_actions(ids), noisy_accel)
+
+
+class ConstantController(IDMController):
+
+    def get_accel(self, env):
+        return 0.5
+
+
+class StatefulController(IDMController):
+
+    per_vehicle_state = True
+
+
+class CustomFailsafeController(IDMController):
+
+    def safe_velocity(self, env):
+        return 0
+
+
 class TestInstantaneousFailsafe(unittest.TestCase):
     """
     Tests that the instantaneous failsafe of the base acceleration controller
@@ -1,4 +1,6 @@
+import sys
 import unittest
+from unittest import mock
 
 from flow.core.params import SumoParams, EnvParams, InitialConfig, \
     NetParams, SumoCarFollowingParams
@@ -7,10 +9,21 @@ from flow.core.vehicles import Vehicles
 from flow.controllers.routing_controllers import ContinuousRouter
 from flow.controllers.car_following_models import IDMController
 from flow.envs.loop.loop_accel import ADDITIONAL_ENV_PARAMS
+from flow.core import sumo_pool
+from flow.core.sumo_pool import close_pools
+from flow.envs.base_env import VEHICLE_SUBSCRIPTIONS
+from flow.core.traci_buffer import TraCICommandBuffer, supports_batching
 
 from tests.setup_scripts import ring_road_exp_setup
 import os
 import numpy as np
+import traci
+import traci.constants as tc
+
+try:
+    import libsumo
+except ImportError:
+    libsumo = None
 
 os.environ["TEST_FLAG"] = "True"
 
@@ -140,6 +153,106 @@ class TestEmissionPath(unittest.TestCase):
         self.assertIsNone(self.env.sumo_params.emission_path)
 
 
+class TestSumoStartup(unittest.TestCase):
+    """
+    Tests that sumo is connected to as soon as it is ready, and that a sumo
+    process which exits during startup is reported instead of waited for.
+    """
+
+    def setUp(self):
+        # create the environment and scenario classes for a ring road
+        self.env, scenario = ring_road_exp_setup()
+
+    def tearDown(self):
+        # terminate the traci instance
+        self.env.terminate()
+
+        # free data used by the class
+        self.env = None
+
+    def test_startup_time(self):
+        # the startup latency is measured, and no fixed sleep is added to it
+        self.assertGreater(self.env.sumo_startup_time, 0)
+        self.assertLess(self.env.sumo_startup_time, 5)
+
+    def test_exited_process(self):
+        # a process that has already terminated fails without any retries
+        self.env.sumo_proc.kill()
+        self.env.sumo_proc.wait()
+        self.assertRaises(RuntimeError, self.env._connect_to_sumo,
+                          self.env.sumo_params.port)
+
+    def test_stdout(self):
+        # connecting does not redirect the output of the process, which may
+        # be used by other threads
+        stdout = sys.stdout
+        connect = traci.connect
+        outputs = []
+
+        def checked_connect(*args, **kwargs):
+            outputs.append(sys.stdout)
+            return connect(*args, **kwargs)
+
+        with mock.patch.object(traci, "connect", side_effect=checked_connect):
+            self.env.restart_sumo(self.env.sumo_params)
+        self.assertGreater(len(outputs), 0)
+        self.assertTrue(all(output is stdout for output in outputs))
+
+
+class TestProcessPool(unittest.TestCase):
+    """
+    Tests that sumo instances are taken from a pool of started processes, and
+    that the pool is refilled after every restart.
+    """
+
+    def setUp(self):
+        sumo_params = SumoParams(process_pool_size=2, restart_instance=True,
+                                 seed=42)
+
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=5)
+
+        # create the environment and scenario classes for a ring road
+        self.env, scenario = ring_road_exp_setup(sumo_params=sumo_params,
+                                                 vehicles=vehicles)
+
+    def tearDown(self):
+        # terminate the traci instance and the idle processes
+        self.env.terminate()
+        close_pools()
+
+        # free data used by the class
+        self.env = None
+
+    def runTest(self):
+        # the first instance is started with the seed in sumo_params
+        args = self.env.sumo_proc.args
+        self.assertEqual(args[args.index("--seed") + 1], "42")
+
+        pools = sumo_pool.active_pools()
+        self.assertEqual(len(pools), 1)
+        self.assertEqual(pools[0].num_idle(), 2)
+
+        # restarting sumo at a reset uses an idle process of the pool, with
+        # the random seed it was started with
+        self.env.reset()
+        args = self.env.sumo_proc.args
+        self.assertIsNone(self.env.sumo_proc.poll())
+        self.assertEqual(args[args.index("--remote-port") + 1],
+                         str(self.env.sumo_params.port))
+        self.assertEqual(args[args.index("--seed") + 1],
+                         str(self.env.sumo_params.seed))
+        self.assertEqual(args.count("--seed"), 1)
+        self.assertEqual(pools[0].num_idle(), 2)
+
+        # the simulation runs as usual on the pooled instance
+        self.env.step(rl_actions=[])
+        self.assertEqual(len(self.env.vehicles.get_ids()), 5)
+
+
 class TestApplyingActionsWithSumo(unittest.TestCase):
     """
     Tests the apply_acceleration, apply_lane_change, and choose_routes
@@ -291,6 +404,99 @@ class TestApplyingActionsWithSumo(unittest.TestCase):
         np.testing.assert_array_almost_equal(lane2, expected_lane2, 1)
 
 
+class TestBatchCommands(unittest.TestCase):
+    """
+    Tests that actuation commands are sent to sumo in a single message per
+    step when "batch_commands" is set to True in SumoParams
+    """
+
+    def setUp(self):
+        # create a 3-lane ring road network
+        additional_net_params = {"length": 230, "lanes": 3, "speed_limit": 30,
+                                 "resolution": 40}
+        net_params = NetParams(additional_params=additional_net_params)
+
+        sumo_params = SumoParams(sim_step=0.1, batch_commands=True)
+
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=5)
+
+        # create the environment and scenario classes for a ring road
+        self.env, scenario = ring_road_exp_setup(net_params=net_params,
+                                                 sumo_params=sumo_params,
+                                                 vehicles=vehicles)
+
+    def tearDown(self):
+        # terminate the traci instance
+        self.env.terminate()
+
+        # free data used by the class
+        self.env = None
+
+    def test_lane_changes(self):
+        """
+        Ensures that buffered lane changes are only sent when the simulation
+        is stepped, that they are all sent in a single message, and that they
+        are performed as if they were not buffered.
+        """
+        self.env.reset()
+        ids = self.env.vehicles.get_ids()
+        lane0 = np.array([self.env.vehicles.get_lane(veh_id)
+                          for veh_id in ids])
+
+        # send any command still queued from the reset
+        self.env.traci_connection.flush()
+
+        num_commands = self.env.traci_connection.num_commands
+        num_messages = self.env.traci_connection.num_messages
+
+        direction0 = np.array([0, 1, 0, 1, -1])
+        self.env.apply_lane_change(ids, direction=direction0)
+
+        # nothing should have been sent yet
+        self.assertEqual(self.env.traci_connection.num_commands, num_commands)
+
+        self.env.traci_connection.simulationStep()
+
+        # all lane changes should have been sent in one message
+        expected_lane1 = (lane0 + np.sign(direction0)).clip(
+            min=0, max=self.env.scenario.lanes - 1)
+        self.assertEqual(self.env.traci_connection.num_commands,
+                         num_commands + sum(expected_lane1 != lane0))
+        self.assertEqual(self.env.traci_connection.num_messages,
+                         num_messages + 1)
+
+        # the lane changes should have been performed by sumo
+        lane1 = np.array(
+            [self.env.traci_connection.vehicle.getLaneIndex(veh_id)
+             for veh_id in ids])
+        np.testing.assert_array_almost_equal(lane1, expected_lane1, 1)
+
+    def test_unsupported_traci(self):
+        """
+        Ensures that commands are sent immediately if the traci client does
+        not support batching.
+        """
+        self.env.reset()
+        self.env.traci_connection.flush()
+        connection = self.env.traci_connection._connection
+        self.assertTrue(supports_batching(connection))
+
+        with mock.patch.object(traci, "__version__", "2.0.0", create=True):
+            buffer = TraCICommandBuffer(connection)
+        self.assertFalse(buffer.batching)
+
+        veh_id = self.env.vehicles.get_ids()[0]
+        buffer.vehicle.setSpeedMode(veh_id, 0)
+        buffer.vehicle.slowDown(veh_id, 0, 1)
+        self.assertEqual(buffer.num_commands, 2)
+        self.assertEqual(buffer.num_messages, 2)
+        self.assertEqual(connection.vehicle.getSpeedMode(veh_id), 0)
+
+
 class TestSorting(unittest.TestCase):
     """
     Tests that the sorting method returns a list of ids sorted by the
@@ -392,5 +598,293 @@ class TestSimsPerStep(unittest.TestCase):
         self.assertEqual(t2 - t1, sims_per_step)
 
 
+class TestSnapshotReset(unittest.TestCase):
+    """Ensures that restoring the state at the start of a rollout from a
+    snapshot (see flow.core.params.EnvParams.snapshot_reset) leads to the same
+    rollouts as re-adding all vehicles at resets."""
+
+    def test_it_works(self):
+        speeds = []
+        for snapshot_reset in [None, "initial", "warmup"]:
+            env_params = EnvParams(warmup_steps=5,
+                                   snapshot_reset=snapshot_reset,
+                                   additional_params=ADDITIONAL_ENV_PARAMS)
+
+            vehicles = Vehicles()
+            vehicles.add(veh_id="test",
+                         acceleration_controller=(IDMController, {}),
+                         routing_controller=(ContinuousRouter, {}),
+                         num_vehicles=10)
+
+            env, scenario = ring_road_exp_setup(env_params=env_params,
+                                                vehicles=vehicles)
+
+            # collect the speeds of vehicles during several rollouts
+            rollout_speeds = []
+            for _ in range(3):
+                env.reset()
+                self.assertEqual(env.time_counter, 5)
+                for _ in range(10):
+                    env.step(rl_actions=[])
+                rollout_speeds.append(
+                    env.vehicles.get_speed(env.vehicles.get_ids()))
+            speeds.append(rollout_speeds)
+
+            # the traffic lights are still shared with the scenario
+            self.assertIs(env.traffic_lights, scenario.traffic_lights)
+
+            env.terminate()
+
+        np.testing.assert_array_almost_equal(speeds[0], speeds[1])
+        np.testing.assert_array_almost_equal(speeds[0], speeds[2])
+
+    def test_invalid_mode(self):
+        env_params = EnvParams(snapshot_reset="final",
+                               additional_params=ADDITIONAL_ENV_PARAMS)
+        self.assertRaises(ValueError, ring_road_exp_setup,
+                          env_params=env_params)
+
+
+class TestLibsumo(unittest.TestCase):
+    """Ensures that running sumo within the python process through libsumo
+    (see flow.core.params.SumoParams.use_libsumo) leads to the same rollouts
+    as running sumo over TraCI."""
+
+    @unittest.skipIf(libsumo is None, "libsumo is not installed")
+    def test_it_works(self):
+        speeds = []
+        for use_libsumo in [False, True]:
+            sumo_params = SumoParams(use_libsumo=use_libsumo)
+
+            vehicles = Vehicles()
+            vehicles.add(veh_id="test",
+                         acceleration_controller=(IDMController, {}),
+                         routing_controller=(ContinuousRouter, {}),
+                         num_vehicles=10)
+
+            env, scenario = ring_road_exp_setup(sumo_params=sumo_params,
+                                                vehicles=vehicles)
+
+            # enough steps for the vehicles to be rerouted
+            env.reset()
+            for _ in range(700):
+                env.step(rl_actions=[])
+            speeds.append(env.vehicles.get_speed(env.vehicles.get_ids()))
+
+            # resets are also supported
+            env.reset()
+            self.assertEqual(len(env.vehicles.get_ids()), 10)
+
+            env.terminate()
+
+        np.testing.assert_array_almost_equal(speeds[0], speeds[1])
+
+
+class TestStepProfiler(unittest.TestCase):
+    """Ensures that the phases of a step are timed when profiling is requested
+    through flow.core.params.EnvParams.profile, and only then."""
+
+    def test_it_works(self):
+        for profile in [False, True]:
+            env_params = EnvParams(profile=profile,
+                                   additional_params=ADDITIONAL_ENV_PARAMS)
+            env, scenario = ring_road_exp_setup(env_params=env_params)
+
+            env.reset()
+            env.profiler.clear()
+            for _ in range(5):
+                env.step(rl_actions=[])
+            summary = env.profiler.summary()
+
+            if not profile:
+                self.assertDictEqual(summary, {})
+            else:
+                for phase in ["step", "accel_controllers", "simulation_step",
+                              "vehicles_update", "sort_by_position",
+                              "get_state", "compute_reward"]:
+                    self.assertEqual(summary[phase]["count"], 5)
+                    self.assertLessEqual(summary[phase]["p50"],
+                                         summary[phase]["p99"])
+                self.assertGreaterEqual(summary["step"]["total"],
+                                        summary["simulation_step"]["total"])
+                self.assertIn("simulation_step", env.profiler.report())
+
+            env.terminate()
+
+
+class TestLazySubsteps(unittest.TestCase):
+    """Ensures that, if several simulation steps are performed per step, the
+    sorted vehicle ids and the lane data of vehicles are only computed when
+    they are accessed, and match the data of the last simulation step."""
+
+    def test_it_works(self):
+        env_params = EnvParams(sims_per_step=5, profile=True,
+                               additional_params=ADDITIONAL_ENV_PARAMS)
+        net_params = NetParams(additional_params={
+            "length": 230, "lanes": 2, "speed_limit": 30, "resolution": 40})
+
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=10)
+
+        env, scenario = ring_road_exp_setup(env_params=env_params,
+                                            net_params=net_params,
+                                            vehicles=vehicles)
+
+        env.reset()
+        env.profiler.clear()
+        for _ in range(3):
+            env.step(rl_actions=[])
+        summary = env.profiler.summary()
+
+        # vehicles are only sorted for the observations of every step, and
+        # the lane data is never accessed
+        self.assertEqual(summary["vehicles_update"]["count"], 15)
+        self.assertEqual(summary["sort_by_position"]["count"], 3)
+        self.assertNotIn("multi_lane_headways", summary)
+
+        # the lane data is computed from the last simulation step once it is
+        # accessed
+        ids = env.vehicles.get_ids()
+        lane_headways = env.vehicles.get_lane_headways(ids)
+        self.assertEqual(
+            env.profiler.summary()["multi_lane_headways"]["count"], 1)
+        env.vehicles._multi_lane_headways(env)
+        self.assertListEqual(env.vehicles.get_lane_headways(ids),
+                             lane_headways)
+
+        # the sorted ids match the positions of the last simulation step
+        positions = env.vehicles.get_absolute_position(env.sorted_ids)
+        self.assertListEqual(positions, sorted(positions))
+
+        env.terminate()
+
+
+class TestTraCICallCounter(unittest.TestCase):
+    """Ensures that the TraCI calls of an environment are recorded per step and
+    per episode when requested through
+    flow.core.params.SumoParams.count_traci_calls."""
+
+    def test_it_works(self):
+        sumo_params = SumoParams(count_traci_calls=True)
+
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=5)
+
+        env, scenario = ring_road_exp_setup(sumo_params=sumo_params,
+                                            vehicles=vehicles)
+
+        env.reset()
+        for _ in range(10):
+            env.step(rl_actions=[])
+
+        stats = env.traci_stats
+
+        # one acceleration command per vehicle and step
+        self.assertEqual(stats.last_step["vehicle.slowDown"][0], 5)
+        self.assertEqual(stats.last_step["simulationStep"][0], 1)
+        self.assertEqual(stats.episode_steps, 11)
+        self.assertEqual(stats.episode["vehicle.slowDown"][0], 50)
+        self.assertAlmostEqual(stats.calls_per_step()["simulationStep"], 1)
+        self.assertIn("vehicle.slowDown", stats.report())
+
+        # the statistics of the episode are cleared at resets, but not the
+        # total ones
+        env.reset()
+        self.assertNotIn("vehicle.slowDown", stats.episode)
+        self.assertEqual(stats.total["vehicle.slowDown"][0], 50)
+
+        env.terminate()
+
+    def test_batch_commands(self):
+        sumo_params = SumoParams(count_traci_calls=True, batch_commands=True)
+
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=5)
+
+        env, scenario = ring_road_exp_setup(sumo_params=sumo_params,
+                                            vehicles=vehicles)
+
+        env.reset()
+        for _ in range(10):
+            env.step(rl_actions=[])
+
+        stats = env.traci_stats
+
+        # the acceleration commands are queued, and sent to sumo in a single
+        # message that is recorded separately from the simulation step
+        self.assertNotIn("vehicle.slowDown", stats.last_step)
+        self.assertEqual(stats.last_step["vehicle.slowDown (queued)"][0], 5)
+        self.assertEqual(stats.last_step["flush"][0], 1)
+        self.assertEqual(stats.last_step["simulationStep"][0], 1)
+        self.assertEqual(env.traci_connection._connection.num_messages,
+                         stats.total["flush"][0])
+
+        env.terminate()
+
+
+class ColorController(IDMController):
+    """IDM controller that reads the color of its vehicle from sumo."""
+
+    vehicle_variables = [tc.VAR_COLOR]
+
+
+class TestVehicleSubscriptions(unittest.TestCase):
+    """Ensures that the variables subscribed to for every vehicle are the ones
+    needed by flow, and the ones declared by the environment and the
+    controllers of vehicles."""
+
+    def test_no_route(self):
+        # vehicles without a router do not need their routes
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(IDMController, {}),
+                     num_vehicles=5)
+
+        env, scenario = ring_road_exp_setup(vehicles=vehicles)
+        self.assertListEqual(env.vehicle_subscriptions, VEHICLE_SUBSCRIPTIONS)
+
+        env.reset()
+        env.step(rl_actions=[])
+        veh_id = env.vehicles.get_ids()[0]
+        self.assertListEqual(env.vehicles.get_route(veh_id), [])
+        self.assertIsNotNone(env.vehicles.get_speed(veh_id))
+        env.terminate()
+
+    def test_declared_variables(self):
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(ColorController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=5)
+
+        for context_subscription in [False, True]:
+            sumo_params = SumoParams(context_subscription=context_subscription)
+            env, scenario = ring_road_exp_setup(sumo_params=sumo_params,
+                                                vehicles=vehicles)
+            self.assertListEqual(
+                env.vehicle_subscriptions,
+                VEHICLE_SUBSCRIPTIONS + sorted([tc.VAR_COLOR, tc.VAR_EDGES]))
+
+            env.reset()
+            env.step(rl_actions=[])
+            veh_id = env.vehicles.get_ids()[0]
+            self.assertEqual(env.vehicles.get_sumo_variable(veh_id,
+                                                            tc.VAR_COLOR),
+                             env.traci_connection.vehicle.getColor(veh_id))
+            self.assertListEqual(
+                list(env.vehicles.get_route(veh_id)),
+                list(env.traci_connection.vehicle.getRoute(veh_id)))
+            env.terminate()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -42,6 +42,31 @@ class TestGetX(unittest.TestCase):
         self.assertAlmostEqual(self.scenario.get_x(edge_2, pos_2), 0.1)
 
 
+class TestGetXArray(unittest.TestCase):
+    """
+    Tests that the get_x_array function returns the same positions as get_x
+    for edges in the lanes, in the internal links, and for vehicles that are
+    not in the network.
+    """
+
+    def runTest(self):
+        env, scenario = figure_eight_exp_setup()
+
+        edges = ["bottom_lower_ring", ":bottom_lower_ring", "",
+                 ":center_intersection_1", "top_upper_ring",
+                 ":bottom_lower_ring"]
+        positions = [4.72, 0.1, -1001, 2.5, 10, 0.3]
+        np.testing.assert_array_almost_equal(
+            scenario.get_x_array(edges, positions),
+            [scenario.get_x(edge, pos)
+             for edge, pos in zip(edges, positions)])
+        np.testing.assert_array_almost_equal(
+            scenario.get_x_array(np.array(edges[::-1], dtype=object),
+                                 positions[::-1]),
+            [scenario.get_x(edge, pos)
+             for edge, pos in zip(edges[::-1], positions[::-1])])
+
+
 class TestGetEdge(unittest.TestCase):
     """
     Tests the get_edge function for vehicles placed in links and in internal
@@ -0,0 +1,110 @@
+import unittest
+import os
+
+from flow.core.params import SumoParams, EnvParams, NetParams
+from flow.core.vehicles import Vehicles
+from flow.controllers import RLController, IDMController, ContinuousRouter
+from flow.envs import FlowVecEnv
+from flow.utils.registry import make_create_env
+from flow.envs.loop.loop_accel import ADDITIONAL_ENV_PARAMS
+from flow.scenarios.loop.loop_scenario import ADDITIONAL_NET_PARAMS
+import numpy as np
+import gym
+
+os.environ["TEST_FLAG"] = "True"
+
+
+def ring_flow_params():
+    """Returns the flow parameters of a ring road with an rl vehicle."""
+    vehicles = Vehicles()
+    vehicles.add(veh_id="human",
+                 acceleration_controller=(IDMController, {}),
+                 routing_controller=(ContinuousRouter, {}),
+                 num_vehicles=5)
+    vehicles.add(veh_id="rl",
+                 acceleration_controller=(RLController, {}),
+                 routing_controller=(ContinuousRouter, {}),
+                 num_vehicles=1)
+
+    return dict(
+        exp_tag="vec_env_test",
+        env_name="AccelEnv",
+        scenario="LoopScenario",
+        generator="CircleGenerator",
+        sumo=SumoParams(),
+        env=EnvParams(horizon=5, additional_params=ADDITIONAL_ENV_PARAMS),
+        net=NetParams(additional_params=ADDITIONAL_NET_PARAMS),
+        veh=vehicles,
+    )
+
+
+class TestFlowVecEnv(unittest.TestCase):
+    """
+    Tests that the vectorized environment steps all of its environments, and
+    resets them at the end of their rollouts.
+    """
+
+    def setUp(self):
+        self.vec_env = FlowVecEnv(ring_flow_params(), num_envs=3)
+
+    def tearDown(self):
+        # terminate all sumo instances
+        self.vec_env.close()
+
+        # free data used by the class
+        self.vec_env = None
+
+    def runTest(self):
+        # every environment has its own vehicles class and sumo instance
+        vehicles = [env.unwrapped.vehicles for env in self.vec_env.envs]
+        self.assertIsNot(vehicles[0], vehicles[1])
+
+        obs = self.vec_env.reset()
+        self.assertEqual(obs.shape[0], 3)
+        self.assertEqual(obs.shape[1:],
+                         self.vec_env.envs[0].unwrapped.state.shape)
+
+        actions = [np.array([1])] * 3
+        for _ in range(4):
+            obs, rewards, dones, infos = self.vec_env.step(actions)
+            self.assertEqual(rewards.shape, (3,))
+            self.assertFalse(any(dones))
+        for env in self.vec_env.envs:
+            self.assertEqual(env.unwrapped.time_counter, 4)
+
+        # the environments are reset once their horizon is met
+        obs, rewards, dones, infos = self.vec_env.step(actions)
+        self.assertTrue(all(dones))
+        self.assertEqual(len(infos), 3)
+        for env in self.vec_env.envs:
+            self.assertEqual(env.unwrapped.time_counter, 0)
+
+
+class TestMakeCreateEnv(unittest.TestCase):
+    """
+    Tests that the environment creation method of make_create_env may be
+    called several times if separate environments are requested, and only
+    once otherwise.
+    """
+
+    def test_separate_envs(self):
+        create_env, env_name = make_create_env(
+            ring_flow_params(), version=1, separate_envs=True)
+        envs = [create_env(), create_env()]
+        self.assertIn(env_name, gym.envs.registry.env_specs)
+        self.assertIsNot(envs[0].unwrapped.vehicles,
+                         envs[1].unwrapped.vehicles)
+        for env in envs:
+            env.unwrapped.terminate()
+
+    def test_single_env(self):
+        flow_params = ring_flow_params()
+        create_env, env_name = make_create_env(flow_params, version=2)
+        env = create_env()
+        self.assertIs(env.unwrapped.vehicles, flow_params["veh"])
+        self.assertRaises(gym.error.Error, create_env)
+        env.unwrapped.terminate()
+
+
+if __name__ == '__main__':
+    unittest.main()
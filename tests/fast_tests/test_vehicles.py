@@ -1,13 +1,19 @@
 import unittest
 import os
 import numpy as np
+import traci.constants as tc
 
-from flow.core.vehicles import Vehicles
-from flow.core.params import SumoCarFollowingParams, NetParams, InitialConfig
+from flow.core.vehicles import Vehicles, _repair_order
+from flow.controllers.base_controller import BaseController
+from flow.core.params import SumoCarFollowingParams, NetParams, \
+    InitialConfig, SumoParams, EnvParams
 from flow.controllers.car_following_models import IDMController, \
     SumoCarFollowingController
+from flow.controllers.routing_controllers import ContinuousRouter
 from flow.controllers.lane_change_controllers import StaticLaneChanger
 from flow.controllers.rlcontroller import RLController
+from flow.controllers.velocity_controllers import PISaturation
+from flow.envs.loop.loop_accel import ADDITIONAL_ENV_PARAMS
 
 from tests.setup_scripts import ring_road_exp_setup
 
@@ -156,6 +162,140 @@ class TestVehiclesClass(unittest.TestCase):
         # ensures that then num_rl_vehicles matches the actual number of rl veh
         self.assertEqual(vehicles.num_rl_vehicles, len(vehicles.get_rl_ids()))
 
+    def test_ids_order(self):
+        """
+        Checks that the vehicle ids are kept in the order they were added in,
+        and the rl ids are kept sorted, as vehicles are added and removed.
+        """
+        vehicles = Vehicles()
+        vehicles.add("test", num_vehicles=3)
+        vehicles.add("test_rl", num_vehicles=12,
+                     acceleration_controller=(RLController, {}))
+        self.assertListEqual(
+            vehicles.get_rl_ids(),
+            sorted(["test_rl_%d" % i for i in range(12)]))
+
+        vehicles.remove("test_1")
+        vehicles.remove("test_rl_10")
+        vehicles.add("other", num_vehicles=1)
+        self.assertListEqual(vehicles.get_human_ids(),
+                             ["test_0", "test_2", "other_0"])
+        self.assertListEqual(vehicles.get_ids()[:3],
+                             ["test_0", "test_2", "test_rl_0"])
+        self.assertListEqual(
+            vehicles.get_rl_ids(),
+            sorted(["test_rl_%d" % i for i in range(12) if i != 10]))
+
+        # vehicles that are removed and added again are not duplicated
+        vehicles.remove("test_0")
+        vehicles.add("test", num_vehicles=1)
+        self.assertListEqual(vehicles.get_human_ids(),
+                             ["test_2", "other_0", "test_0"])
+
+        self.assertTrue(vehicles.is_rl("test_rl_11"))
+        self.assertFalse(vehicles.is_rl("test_rl_10"))
+        self.assertFalse(vehicles.is_rl("test_0"))
+
+
+class TestSharedControllers(unittest.TestCase):
+    """
+    Tests that controllers that declare that they do not store a per-vehicle
+    state are constructed once per vehicle type and used by all vehicles of
+    the type, and that other controllers are constructed for every vehicle.
+    """
+
+    def runTest(self):
+        vehicles = Vehicles()
+        vehicles.add("test", num_vehicles=3,
+                     acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}))
+        vehicles.add("test_pi", num_vehicles=2,
+                     acceleration_controller=(PISaturation, {}))
+        vehicles.add("test_custom", num_vehicles=2,
+                     acceleration_controller=(HistoryController, {}))
+
+        # the vehicles of a type share a single controller, which is returned
+        # for the requested vehicle
+        controller = vehicles.get_acc_controller("test_0")
+        self.assertEqual(controller.veh_id, "test_0")
+        self.assertIs(vehicles.get_acc_controller("test_1"), controller)
+        self.assertEqual(controller.veh_id, "test_1")
+        self.assertEqual(vehicles.get_routing_controller("test_2").veh_id,
+                         "test_2")
+        self.assertEqual(
+            vehicles.get_lane_changing_controller("test_2").veh_id, "test_2")
+
+        # controllers with a per-vehicle state, including the ones of classes
+        # that do not declare per_vehicle_state, are constructed for every
+        # vehicle
+        self.assertIsNot(vehicles.get_acc_controller("test_pi_0"),
+                         vehicles.get_acc_controller("test_pi_1"))
+        self.assertIsNot(
+            vehicles.get_acc_controller("test_custom_0").history,
+            vehicles.get_acc_controller("test_custom_1").history)
+
+        # types that are added again get new controllers
+        vehicles.add("test", num_vehicles=1,
+                     acceleration_controller=(IDMController, {"a": 2}))
+        self.assertEqual(vehicles.get_acc_controller("test_0").a, 2)
+        self.assertEqual(vehicles.get_acc_controller("test_1").a, 1)
+
+
+class HistoryController(BaseController):
+
+    def __init__(self, veh_id, sumo_cf_params):
+        BaseController.__init__(self, veh_id, sumo_cf_params)
+        self.history = []
+
+    def get_accel(self, env):
+        self.history.append(env.vehicles.get_speed(self.veh_id))
+        return 0
+
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Tests that restoring a snapshot of the vehicles class undoes the changes
+    made since the snapshot, without modifying the snapshot.
+    """
+
+    def runTest(self):
+        vehicles = Vehicles()
+        vehicles.add("test", num_vehicles=3,
+                     acceleration_controller=(IDMController, {}))
+        vehicles.add("test_pi", num_vehicles=2,
+                     acceleration_controller=(PISaturation, {}))
+        vehicles.add("test_rl", num_vehicles=2,
+                     acceleration_controller=(RLController, {}))
+        vehicles.get_acc_controller("test_pi_0").v_history.append(1)
+
+        snapshot = vehicles.snapshot()
+
+        vehicles.remove("test_1")
+        vehicles.remove("test_rl_0")
+        vehicles.set_state("test_0", "last_lc", 10)
+        vehicles.get_acc_controller("test_pi_0").v_history.append(2)
+
+        for _ in range(2):
+            vehicles.restore(snapshot)
+            self.assertListEqual(
+                vehicles.get_ids(),
+                ["test_0", "test_1", "test_2", "test_pi_0", "test_pi_1",
+                 "test_rl_0", "test_rl_1"])
+            self.assertListEqual(vehicles.get_rl_ids(),
+                                 ["test_rl_0", "test_rl_1"])
+            self.assertEqual(vehicles.num_vehicles, 7)
+            self.assertIsNone(vehicles.get_state("test_0", "last_lc"))
+
+            # controllers with a state are restored, and copied before they
+            # are modified
+            controller = vehicles.get_acc_controller("test_pi_0")
+            self.assertListEqual(controller.v_history, [1])
+            controller.v_history.append(3)
+
+        # controllers without a state are shared with the snapshot
+        self.assertIs(vehicles.get_acc_controller("test_0"),
+                      snapshot.get_acc_controller("test_0"))
+
 
 class TestMultiLaneData(unittest.TestCase):
     """
@@ -207,6 +347,46 @@ class TestMultiLaneData(unittest.TestCase):
         np.testing.assert_array_almost_equal(actual_lane_tail,
                                              expected_lane_tail)
 
+    def test_human_vehicles(self):
+        """
+        Tests that the above mentioned methods are available for vehicles
+        that are not rl vehicles, and can be overwritten.
+        """
+        additional_net_params = {"length": 230, "lanes": 3, "speed_limit": 30,
+                                 "resolution": 40}
+        net_params = NetParams(additional_params=additional_net_params)
+
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(IDMController, {}),
+                     num_vehicles=21)
+
+        initial_config = InitialConfig(lanes_distribution=float("inf"))
+
+        env, scenario = ring_road_exp_setup(net_params=net_params,
+                                            vehicles=vehicles,
+                                            initial_config=initial_config)
+        env.reset()
+
+        self.assertCountEqual(env.vehicles.get_lane_leaders("test_0"),
+                              ["test_3", "test_1", "test_2"])
+        self.assertCountEqual(env.vehicles.get_lane_followers("test_0"),
+                              ["test_18", "test_19", "test_20"])
+
+        # the lane leaders and followers of vehicles in the same lane match
+        lane = env.vehicles.get_lane("test_0")
+        self.assertEqual(
+            env.vehicles.get_lane_followers("test_3")[lane], "test_0")
+
+        # lane data that is set is not overwritten until the next step
+        env.vehicles.set_lane_headways("test_0", [1, 2, 3])
+        self.assertListEqual(env.vehicles.get_lane_headways("test_0"),
+                             [1, 2, 3])
+        self.assertCountEqual(env.vehicles.get_lane_leaders("test_0"),
+                              ["test_3", "test_1", "test_2"])
+
+        env.terminate()
+
     def test_junctions(self):
         """
         Tests the above mentioned methods in the presence of junctions.
@@ -239,6 +419,390 @@ class TestIdsByEdge(unittest.TestCase):
         self.assertCountEqual(ids, expected_ids)
 
 
+class TestIdsByLane(unittest.TestCase):
+    """
+    Tests that the ordering of vehicles in their lanes, which is repaired
+    from the ordering of the previous step, matches the positions of vehicles
+    after vehicles change lanes and pass each other.
+    """
+
+    def setUp(self):
+        # fast and slow vehicles, so that vehicles change lanes and pass each
+        # other
+        vehicles = Vehicles()
+        for veh_id, max_speed in [("fast", 30), ("slow", 3)]:
+            vehicles.add(veh_id=veh_id,
+                         routing_controller=(ContinuousRouter, {}),
+                         sumo_car_following_params=SumoCarFollowingParams(
+                             accel=2.6, max_speed=max_speed),
+                         num_vehicles=6)
+        net_params = NetParams(additional_params={
+            "length": 230, "lanes": 3, "speed_limit": 30, "resolution": 40})
+        initial_config = InitialConfig(lanes_distribution=3)
+
+        self.env, scenario = ring_road_exp_setup(
+            vehicles=vehicles, net_params=net_params,
+            initial_config=initial_config)
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def runTest(self):
+        vehicles = self.env.vehicles
+        for step in range(200):
+            if step == 20:
+                # force lane changes in the middle of other vehicles
+                for veh_id in ["fast_0", "slow_2"]:
+                    lane = vehicles.get_lane(veh_id)
+                    traci_veh = self.env.traci_connection.vehicle
+                    traci_veh.setLaneChangeMode(veh_id, 0)
+                    traci_veh.changeLane(veh_id, 1 if lane != 1 else 0, 1)
+            self.env.step(rl_actions=[])
+
+            for edge in self.env.scenario.get_edge_list():
+                ids = []
+                for lane in range(3):
+                    lane_ids = vehicles.get_ids_by_lane(edge, lane)
+                    positions = vehicles.get_position(lane_ids)
+                    self.assertListEqual(positions, sorted(positions))
+                    for veh_id in lane_ids:
+                        self.assertEqual(vehicles.get_edge(veh_id), edge)
+                        self.assertEqual(vehicles.get_lane(veh_id), lane)
+                    ids += lane_ids
+                self.assertListEqual(vehicles.get_ids_by_edge(edge), ids)
+
+        self.assertListEqual(vehicles.get_ids_by_lane("bottom", 3), [])
+        self.assertListEqual(vehicles.get_ids_by_lane("no_edge", 0), [])
+
+
+class TestRepairOrder(unittest.TestCase):
+    """
+    Tests that repairing the ordering of vehicles in which a few vehicles
+    changed lane or position leads to the same ordering as a stable sort.
+    """
+
+    def runTest(self):
+        rng = np.random.RandomState(0)
+        for _ in range(500):
+            num = rng.randint(0, 40)
+            # rounded positions, so that some vehicles are at the same
+            # position
+            group = np.sort(rng.randint(0, 5, num))
+            pos = np.round(rng.uniform(0, 5, num))
+            order = np.lexsort((pos, group))
+            group, pos = group[order], pos[order]
+
+            self.assertIsNone(_repair_order(group, pos))
+
+            for i in rng.randint(0, max(num, 1), min(num, 4)):
+                group[i] = rng.randint(0, 5)
+                pos[i] = np.round(rng.uniform(0, 5))
+
+            expected = np.lexsort((pos, group))
+            order = _repair_order(group, pos)
+            if order is None:
+                order = np.arange(num)
+            np.testing.assert_array_equal(order, expected)
+
+
+class TestContextSubscription(unittest.TestCase):
+    """
+    Tests that collecting vehicle data through a context subscription leads
+    to the same states as using per-vehicle subscriptions.
+    """
+
+    def runTest(self):
+        states = []
+        for context_subscription in [False, True]:
+            sumo_params = SumoParams(sim_step=0.1,
+                                     context_subscription=context_subscription)
+
+            vehicles = Vehicles()
+            vehicles.add(veh_id="test",
+                         acceleration_controller=(IDMController, {}),
+                         routing_controller=(ContinuousRouter, {}),
+                         num_vehicles=10)
+
+            env, scenario = ring_road_exp_setup(sumo_params=sumo_params,
+                                                vehicles=vehicles)
+            env.reset()
+            for _ in range(10):
+                env.step(rl_actions=[])
+
+            ids = env.vehicles.get_ids()
+            states.append((env.vehicles.get_speed(ids),
+                           env.vehicles.get_headway(ids),
+                           env.vehicles.get_leader(ids),
+                           env.vehicles.get_follower(ids),
+                           env.vehicles.get_length(ids)))
+            env.terminate()
+
+        np.testing.assert_array_almost_equal(states[0][0], states[1][0])
+        np.testing.assert_array_almost_equal(states[0][1], states[1][1])
+        self.assertListEqual(states[0][2], states[1][2])
+        self.assertListEqual(states[0][3], states[1][3])
+        np.testing.assert_array_almost_equal(states[0][4], states[1][4])
+
+
+class TestFlowLeaders(unittest.TestCase):
+    """
+    Tests that the leaders computed by flow match the ones provided by sumo,
+    and that the leaders of vehicles are then not subscribed to.
+    """
+
+    def runTest(self):
+        for validate_leaders in [False, True]:
+            sumo_params = SumoParams(sim_step=0.1, flow_leaders=True,
+                                     validate_leaders=validate_leaders)
+
+            vehicles = Vehicles()
+            vehicles.add(veh_id="test",
+                         acceleration_controller=(IDMController, {}),
+                         routing_controller=(ContinuousRouter, {}),
+                         num_vehicles=10)
+
+            env, scenario = ring_road_exp_setup(sumo_params=sumo_params,
+                                                vehicles=vehicles)
+            env.reset()
+            for _ in range(10):
+                env.step(rl_actions=[])
+
+            veh_id = env.vehicles.get_ids()[0]
+            results = env.traci_connection.vehicle.getSubscriptionResults(
+                veh_id)
+            self.assertEqual(tc.VAR_LEADER in results, validate_leaders)
+            self.assertEqual(env.vehicles.num_leader_mismatches, 0)
+            self.assertNotIn(None, env.vehicles.get_leader(
+                env.vehicles.get_ids()))
+            env.terminate()
+
+
+class TestVehicleArrays(unittest.TestCase):
+    """
+    Tests that storing the states of vehicles in numpy arrays leads to the
+    same states as storing them in per-vehicle dictionaries, and that the
+    slots of removed vehicles are reused.
+    """
+
+    def test_same_states(self):
+        states = []
+        for vehicle_arrays in [False, True]:
+            env_params = EnvParams(vehicle_arrays=vehicle_arrays,
+                                   additional_params=ADDITIONAL_ENV_PARAMS)
+
+            vehicles = Vehicles()
+            vehicles.add(veh_id="test",
+                         acceleration_controller=(IDMController, {}),
+                         routing_controller=(ContinuousRouter, {}),
+                         num_vehicles=10)
+
+            env, scenario = ring_road_exp_setup(env_params=env_params,
+                                                vehicles=vehicles)
+            self.assertEqual(env.vehicles.arrays is not None, vehicle_arrays)
+
+            env.reset()
+            for _ in range(10):
+                env.step(rl_actions=[])
+
+            ids = env.vehicles.get_ids()
+            states.append((env.vehicles.get_speed(ids),
+                           env.vehicles.get_absolute_position(ids),
+                           env.vehicles.get_position(ids),
+                           env.vehicles.get_headway(ids),
+                           env.vehicles.get_length(ids),
+                           env.vehicles.get_edge(ids),
+                           env.vehicles.get_lane(ids),
+                           env.vehicles.get_leader(ids),
+                           env.vehicles.get_follower(ids),
+                           [env.vehicles.get_state(veh_id, "type")
+                            for veh_id in ids]))
+
+            if vehicle_arrays:
+                # the arrays contain the same states as the getters
+                arrays = env.vehicles.arrays
+                slots = arrays.get_slots(ids)
+                np.testing.assert_array_almost_equal(arrays.speed[slots],
+                                                     states[-1][0])
+                self.assertListEqual(
+                    [arrays.edges[i] for i in arrays.edge[slots]],
+                    states[-1][5])
+            env.terminate()
+
+        for i in range(5):
+            np.testing.assert_array_almost_equal(states[0][i], states[1][i])
+        for i in range(5, 10):
+            self.assertListEqual(states[0][i], states[1][i])
+
+    def test_slot_reuse(self):
+        vehicles = Vehicles()
+        vehicles.add(veh_id="test", num_vehicles=3)
+        vehicles.set_length("test_1", 5)
+        vehicles.enable_arrays()
+        arrays = vehicles.arrays
+
+        # states set before the arrays were enabled are moved to the arrays
+        self.assertEqual(vehicles.get_length("test_1"), 5)
+        self.assertEqual(vehicles.get_length("test_0", error=-1), -1)
+        self.assertEqual(vehicles.get_state("test_0", "type"), "test")
+        self.assertListEqual(list(arrays.get_slots(["test_0", "test_2"])),
+                             [0, 2])
+
+        # the states of a removed vehicle are unset, and its slot is reused
+        vehicles.remove("test_1")
+        self.assertTrue(np.isnan(arrays.length[1]))
+        self.assertEqual(vehicles.get_length("test_1", error=-1), -1)
+
+        vehicles.add(veh_id="other", num_vehicles=1)
+        self.assertEqual(arrays.slots["other_0"], 1)
+        self.assertEqual(vehicles.get_state("other_0", "type"), "other")
+
+        # leaders and followers are stored as slots
+        vehicles.set_leader("test_0", "other_0")
+        vehicles.set_follower("test_0", None)
+        self.assertEqual(arrays.leader[0], 1)
+        self.assertEqual(vehicles.get_leader("test_0"), "other_0")
+        self.assertIsNone(vehicles.get_follower("test_0"))
+
+        # leaders and followers without a slot keep their names
+        vehicles.set_leader("test_2", "unknown")
+        vehicles.set_follower("test_2", "")
+        self.assertEqual(vehicles.get_leader("test_2"), "unknown")
+        self.assertEqual(vehicles.get_follower("test_2"), "")
+        self.assertListEqual(
+            list(arrays.gather("leader", [0, 2, -1], "error")),
+            ["other_0", "unknown", "error"])
+
+        # the arrays grow when they are full
+        vehicles.add(veh_id="many", num_vehicles=20)
+        self.assertGreaterEqual(arrays.capacity, 23)
+        self.assertEqual(vehicles.get_state("many_19", "type"), "many")
+
+
+class TestGetArray(unittest.TestCase):
+    """
+    Tests that the batch getter of the vehicles class returns the same states
+    as the per-vehicle getters, with or without arrays.
+    """
+
+    def runTest(self):
+        for vehicle_arrays in [False, True]:
+            env_params = EnvParams(vehicle_arrays=vehicle_arrays,
+                                   additional_params=ADDITIONAL_ENV_PARAMS)
+            env, scenario = ring_road_exp_setup(env_params=env_params)
+            env.reset()
+            env.step(rl_actions=[])
+            vehicles = env.vehicles
+
+            # "missing" is not a vehicle in the network
+            ids = vehicles.get_ids() + ["missing"]
+            for state_name, getter in [("speed", vehicles.get_speed),
+                                       ("headway", vehicles.get_headway),
+                                       ("lane", vehicles.get_lane)]:
+                values = vehicles.get_array(state_name, ids)
+                self.assertIsInstance(values, np.ndarray)
+                np.testing.assert_array_almost_equal(values, getter(ids))
+            self.assertListEqual(list(vehicles.get_array("edge", ids)),
+                                 vehicles.get_edge(ids))
+            self.assertListEqual(list(vehicles.get_array("leader", ids)),
+                                 vehicles.get_leader(ids))
+
+            # custom value for missing vehicles, and all vehicles by default
+            self.assertTrue(np.isnan(
+                vehicles.get_array("speed", ids, error=np.nan)[-1]))
+            np.testing.assert_array_almost_equal(
+                vehicles.get_array("speed"),
+                vehicles.get_speed(vehicles.get_ids()))
+
+            # slots may only be used with arrays
+            if vehicle_arrays:
+                slots = vehicles.arrays.get_slots(vehicles.get_ids())
+                np.testing.assert_array_almost_equal(
+                    vehicles.get_array("speed", slots=slots),
+                    vehicles.get_speed(vehicles.get_ids()))
+            else:
+                self.assertRaises(ValueError, vehicles.get_array, "speed",
+                                  slots=[0])
+
+            env.terminate()
+
+
+class TestVehicleHistory(unittest.TestCase):
+    """
+    Tests that the history of the states of vehicles contains the states of
+    the last steps, and is cleared at resets and for removed vehicles.
+    """
+
+    def runTest(self):
+        env_params = EnvParams(vehicle_history=4,
+                               additional_params=ADDITIONAL_ENV_PARAMS)
+        env, scenario = ring_road_exp_setup(env_params=env_params)
+        vehicles = env.vehicles
+        self.assertRaises(ValueError, vehicles.get_history, "edge")
+
+        for _ in range(2):
+            env.reset()
+            speeds = [vehicles.get_array("speed")]
+            for _ in range(6):
+                env.step(rl_actions=[])
+                speeds.append(vehicles.get_array("speed"))
+
+            # "missing" is not a vehicle in the network
+            ids = vehicles.get_ids() + ["missing"]
+            for steps_ago in range(4):
+                values = vehicles.get_history("speed", ids, steps_ago)
+                np.testing.assert_array_almost_equal(
+                    values[:-1], speeds[-1 - steps_ago])
+                self.assertEqual(values[-1], -1001)
+            np.testing.assert_array_almost_equal(
+                vehicles.get_history("speed", steps_ago=[2, 0]),
+                np.stack([speeds[-3], speeds[-1]], axis=1))
+            self.assertRaises(ValueError, vehicles.get_history, "speed",
+                              steps_ago=4)
+
+        # the history of removed vehicles is not inherited by the vehicles
+        # that reuse their slots
+        veh_id = vehicles.get_ids()[0]
+        slot = vehicles.arrays.slots[veh_id]
+        vehicles.remove(veh_id)
+        self.assertTrue(np.all(vehicles.history.gather(
+            "speed", [slot, slot], [0, 3], error=-1) == -1))
+
+        env.terminate()
+
+
+class TestFlowRates(unittest.TestCase):
+    """
+    Tests that the inflow and outflow rates are computed over the requested
+    number of most recent steps, with a bounded history.
+    """
+
+    def runTest(self):
+        vehicles = Vehicles()
+        vehicles.sim_step = 0.5
+        self.assertEqual(vehicles.get_outflow_rate(10), 0)
+        self.assertEqual(vehicles.get_num_arrived(), 0)
+
+        num_arrived = [i % 3 for i in range(3000)]
+        for i, num in enumerate(num_arrived):
+            vehicles._num_arrived.append(num)
+            vehicles._num_departed.append(1)
+
+            # 10 steps
+            self.assertAlmostEqual(
+                vehicles.get_outflow_rate(5),
+                3600 * sum(num_arrived[max(i - 9, 0):i + 1]) /
+                (min(i + 1, 10) * 0.5))
+
+        self.assertEqual(vehicles.get_num_arrived(), num_arrived[-1])
+        self.assertAlmostEqual(vehicles.get_inflow_rate(5), 7200)
+
+        # the history only grows to the longest requested window
+        self.assertLess(len(vehicles._num_arrived._cumsum), 3000)
+        self.assertAlmostEqual(vehicles.get_outflow_rate(500),
+                               3600 * sum(num_arrived[-1000:]) / 500)
+
+
 class TestObservedIDs(unittest.TestCase):
     """Tests the observed_ids methods, which are used for visualization."""
 